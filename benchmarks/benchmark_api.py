@@ -0,0 +1,155 @@
+"""
+Benchmark the fetching and conversion paths against a local FakeGAServer, without credentials or network.
+Each scenario runs in a fresh interpreter so its peak RSS is its own, and records requests/s, rows/s,
+conversion time and peak RSS. Results are printed and appended as json lines to --output, tagged with the
+package version and git commit, to compare releases.
+
+    python benchmarks/benchmark_api.py --days 30 --rows-per-day 20000 --latency 0.05 --output results.jsonl
+
+Scenarios:
+    getData            GetGAData.getData(batch=False) with --workers threads
+    iterResponsePages  every page of the whole date range through _helpers.iterResponsePages
+    dataToFrame        Management.dataToFrame(typed=True) on data fetched beforehand (conversion only)
+    getFrame           GetGAData.getFrame(batch=False), fetching and converting in a pipeline
+"""
+import argparse
+import functools
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+SCENARIOS = ('getData', 'iterResponsePages', 'dataToFrame', 'getFrame')
+
+
+def peakRss():
+    """
+    Peak resident set size of the process in MiB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def packageVersion():
+    """
+    Return the version of the package and the git commit of the tree it is imported from
+    """
+    try:
+        from importlib.metadata import version
+        package_version = version('googleAnalyticUtility')
+    except Exception:
+        package_version = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+
+    return package_version, commit
+
+
+def runScenario(args):
+    """
+    Run one scenario against the server at args.url and return its measures. Called in the child process
+    """
+    from benchmarks.fake_api import fakeService
+    from googleAnalyticUtility._helpers import iterResponsePages
+    from googleAnalyticUtility.Analytics import GetGAData, Management, RetryPolicy
+    import pandas  # noqa: F401, loaded lazily by the package: keep the import out of the measures
+
+    end_date = datetime.strptime(args.start_date, '%Y-%m-%d') + timedelta(days=args.days - 1)
+    analytics = GetGAData(args.start_date, end_date.strftime('%Y-%m-%d'), retry_policy=RetryPolicy(base_delay=0.05),
+                          service_factory=functools.partial(fakeService, args.url, 'analyticsreporting', 'v4'))
+    payload = analytics.formatPayload(['ga:date', 'ga:deviceCategory', 'ga:browser'],
+                                      ['ga:sessions', 'ga:users', 'ga:pageviews'], view_id='100000')
+    payload.get('reportRequests')[0].update({'pageSize': args.page_size})
+
+    result = {'conversion_seconds': None}
+    start = time.perf_counter()
+    if args.scenario == 'getData':
+        data = analytics.getData(payload, batch=False, verbose=False, workers=args.workers)
+        rows = sum(len(r.get('data').get('rows') or []) for d in data for r in d.get('reports'))
+    elif args.scenario == 'iterResponsePages':
+        data = iterResponsePages(analytics.report_service, payload, False, 0, retry_policy=analytics.retry_policy)
+        rows = sum(len(r.get('data').get('rows') or []) for r in data.get('reports'))
+    elif args.scenario == 'dataToFrame':
+        data = analytics.getData(payload, batch=False, verbose=False, workers=args.workers)
+        start = time.perf_counter()
+        rows = len(Management.dataToFrame(data, typed=True))
+        result['conversion_seconds'] = time.perf_counter() - start
+    elif args.scenario == 'getFrame':
+        rows = len(analytics.getFrame(payload, batch=False, verbose=False))
+    else:
+        raise ValueError(f'unknown scenario {args.scenario!r}')
+    result.update({'seconds': time.perf_counter() - start, 'rows': rows, 'peak_rss_mib': peakRss()})
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--start-date', default='2020-01-01')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--rows-per-day', type=int, default=10000)
+    parser.add_argument('--page-size', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--max-unsampled-days', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--output', help='json lines file the results are appended to')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        print(json.dumps(runScenario(args)))
+        return
+
+    from benchmarks.fake_api import FakeGAServer
+
+    package_version, commit = packageVersion()
+    config = {key: getattr(args, key) for key in ('days', 'rows_per_day', 'page_size', 'latency', 'error_rate',
+                                                  'max_unsampled_days', 'workers')}
+    print(f'{"scenario":<18} {"seconds":>8} {"requests/s":>11} {"rows/s":>12} {"convert s":>10} {"peak RSS":>10}')
+    with FakeGAServer(rows_per_day=args.rows_per_day, latency=args.latency, error_rate=args.error_rate,
+                      max_unsampled_days=args.max_unsampled_days) as server:
+        for scenario in args.scenarios:
+            server.resetCounters()
+            command = [sys.executable, os.path.abspath(__file__), '--scenario', scenario, '--url', server.url]
+            for key, value in config.items():
+                if value is not None:
+                    command += [f'--{key.replace("_", "-")}', str(value)]
+            command += ['--start-date', args.start_date]
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result.update({'scenario': scenario, 'requests': server.requests, 'errors': server.errors,
+                           'requests_per_s': server.requests / result.get('seconds'),
+                           'rows_per_s': result.get('rows') / result.get('seconds'),
+                           'version': package_version, 'commit': commit, 'config': config,
+                           'timestamp': datetime.now().isoformat(timespec='seconds')})
+            if scenario == 'dataToFrame':
+                result['requests_per_s'] = None
+
+            conversion = result.get('conversion_seconds')
+            requests_per_s = result.get('requests_per_s')
+            print(f'{scenario:<18} {result.get("seconds"):8.3f} '
+                  f'{requests_per_s if requests_per_s is not None else float("nan"):11.1f} '
+                  f'{result.get("rows_per_s"):12,.0f} '
+                  f'{conversion if conversion is not None else float("nan"):10.3f} '
+                  f'{result.get("peak_rss_mib"):8.1f}MiB')
+            if args.output:
+                with open(args.output, 'a') as f:
+                    f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
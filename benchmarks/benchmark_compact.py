@@ -0,0 +1,62 @@
+"""
+Compare the memory held by raw report pages with the memory held by a CompactStore of the same pages.
+Pages are generated one at a time, as they would be fetched, and the memory still allocated once every
+page has been added is reported.
+
+    python benchmarks/benchmark_compact.py --rows 1000000 --page-size 100000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.benchmark_dataToFrame import syntheticData
+from googleAnalyticUtility._compact import CompactStore
+
+
+def pages(n_rows, page_size):
+    for index, start in enumerate(range(0, n_rows, page_size)):
+        yield syntheticData(min(page_size, n_rows - start), page_size, seed=index)[0]
+
+
+def measure(name, n_rows, page_size, hold):
+    """
+    Feed every page to hold() and print the memory it keeps allocated
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = hold(pages(n_rows, page_size))
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<10} {elapsed:8.3f}s {current / 1024 ** 2:10.1f} MiB held')
+
+    return kept
+
+
+def compact(stream, memory_limit=None):
+    store = CompactStore(memory_limit)
+    store.extend(stream)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=300000)
+    parser.add_argument('--page-size', type=int, default=100000)
+    parser.add_argument('--memory-limit', type=int, default=1024 ** 2)
+    args = parser.parse_args()
+
+    measure('raw', args.rows, args.page_size, list)
+    measure('compact', args.rows, args.page_size, compact).close()
+    measure('spilled', args.rows, args.page_size, lambda stream: compact(stream, args.memory_limit)).close()
+
+
+if __name__ == '__main__':
+    main()
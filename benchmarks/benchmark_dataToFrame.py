@@ -0,0 +1,138 @@
+"""
+Compare the row throughput and peak memory of Management.dataToFrame against the row by row
+implementation it replaced. Each converter runs in a fresh interpreter so its peak RSS, which includes
+the memory of pyarrow backed strings, is its own. The peak includes the synthetic data, built the same way
+for every converter, so compare the converters with each other.
+
+    python benchmarks/benchmark_dataToFrame.py --rows 1000000 --page-size 100000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+CONVERTERS = ('legacy', 'strings', 'typed')
+
+
+def syntheticData(n_rows, page_size, seed=0):
+    """
+    Build raw reporting data shaped like getData() output: one dictionnary with one report per page
+
+        Args:
+            n_rows: int, total number of rows
+            page_size: int, number of rows per report
+            seed: int, seed of the random generator
+        Return:
+            data: list, raw reporting data
+    """
+    rng = random.Random(seed)
+    devices = ['mobile', 'desktop', 'tablet']
+    browsers = [f'browser{i}' for i in range(40)]
+    header = {
+        'dimensions': ['ga:date', 'ga:deviceCategory', 'ga:browser'],
+        'metricHeader': {'metricHeaderEntries': [{'name': 'ga:sessions', 'type': 'INTEGER'},
+                                                 {'name': 'ga:bounceRate', 'type': 'PERCENT'},
+                                                 {'name': 'ga:avgSessionDuration', 'type': 'TIME'}]}
+    }
+    reports = list()
+    for start in range(0, n_rows, page_size):
+        rows = list()
+        for i in range(start, min(n_rows, start + page_size)):
+            rows.append({'dimensions': [f'2020{1 + i % 12:02d}{1 + i % 28:02d}', rng.choice(devices),
+                                        rng.choice(browsers)],
+                         'metrics': [{'values': [str(rng.randint(0, 5000)), f'{rng.random() * 100:.2f}',
+                                                 f'{rng.random() * 600:.1f}']}]})
+        reports.append({'columnHeader': header, 'data': {'rows': rows}})
+
+    return [{'reports': reports}]
+
+
+def legacyDataToFrame(data):
+    """
+    Row by row implementation of dataToFrame used up to 0.2.41, kept as the benchmark baseline
+    """
+    import pandas as pd
+
+    dfs = list()
+    for datum in data:
+        for report in datum.get('reports'):
+            columnHeader = report.get('columnHeader')
+            dimensionHeader = columnHeader.get('dimensions')
+            metricHeaderEntries = columnHeader.get('metricHeader').get('metricHeaderEntries')
+            headers = dimensionHeader + [m.get('name') for m in metricHeaderEntries]
+            dims = [[] for _ in range(len(dimensionHeader))]
+            mets = [[] for _ in range(len(metricHeaderEntries))]
+            for row in report.get('data').get('rows'):
+                for i, dimension in enumerate(row.get('dimensions')):
+                    dims[i].append(dimension)
+                for metric in row.get('metrics'):
+                    for i, value in enumerate(metric.get('values')):
+                        mets[i].append(value)
+            dfs.append(pd.DataFrame(dict(zip(headers, dims + mets))))
+
+    return pd.concat(dfs)
+
+
+def peakRss():
+    """
+    Peak resident set size of the process in MiB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(converter, n_rows, page_size):
+    """
+    Convert synthetic data with one converter and return its measures. Called in the child process
+    """
+    import pandas as pd  # noqa: F401, imported before the data is built like by the package
+    from googleAnalyticUtility._convert import reportsToFrame
+
+    data = syntheticData(n_rows, page_size)
+    reports = data[0].get('reports')
+    baseline = peakRss()
+    func = {'legacy': legacyDataToFrame,
+            'strings': lambda d: reportsToFrame(reports, typed=False),
+            'typed': lambda d: reportsToFrame(reports, typed=True)}.get(converter)
+
+    start = time.perf_counter()
+    df = func(data)
+    elapsed = time.perf_counter() - start
+
+    return {'seconds': elapsed, 'peak_rss_mib': peakRss(), 'conversion_rss_mib': peakRss() - baseline,
+            'frame_mib': df.memory_usage(deep=True).sum() / 1024 ** 2}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=300000)
+    parser.add_argument('--page-size', type=int, default=100000)
+    parser.add_argument('--converter', choices=CONVERTERS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.converter is not None:
+        print(json.dumps(measure(args.converter, args.rows, args.page_size)))
+        return
+
+    print(f'{"converter":<10} {"seconds":>8} {"rows/s":>14} {"peak RSS":>12} {"conversion":>12} {"frame":>12}')
+    for converter in CONVERTERS:
+        command = [sys.executable, os.path.abspath(__file__), '--converter', converter, '--rows', str(args.rows),
+                   '--page-size', str(args.page_size)]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{converter:<10} {result.get("seconds"):8.3f} {args.rows / result.get("seconds"):14,.0f} '
+              f'{result.get("peak_rss_mib"):9.1f}MiB {result.get("conversion_rss_mib"):9.1f}MiB '
+              f'{result.get("frame_mib"):9.1f}MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Measure the time needed to import googleAnalyticUtility.Analytics and create client objects in a fresh
+interpreter, and list the slowest modules it imports.
+
+    python benchmarks/benchmark_import.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE = '''
+import time
+start = time.perf_counter()
+from googleAnalyticUtility.Analytics import GetGAData, Management, DataImport
+imported = time.perf_counter()
+GetGAData('2020-01-01', '2020-01-31'), Management(), DataImport()
+print(imported - start, time.perf_counter() - imported)
+'''
+
+
+def run(args=()):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, *args, '-c', CODE], env=env, capture_output=True, text=True, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imported modules to list')
+    args = parser.parse_args()
+
+    imports, inits = list(), list()
+    for _ in range(args.runs):
+        imported, created = map(float, run().stdout.split())
+        imports.append(imported)
+        inits.append(created)
+    print(f'import  median {statistics.median(imports) * 1000:8.1f} ms  min {min(imports) * 1000:8.1f} ms')
+    print(f'objects median {statistics.median(inits) * 1000:8.1f} ms  min {min(inits) * 1000:8.1f} ms')
+
+    timings = list()
+    for line in run(['-X', 'importtime']).stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            timings.append((int(fields[1]), fields[2].rstrip()))
+    print('\nslowest imports (cumulative us):')
+    for cumulative, name in sorted(timings, reverse=True)[:args.top]:
+        print(f'{cumulative:10d} {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""
+Local stand-in for the Google Analytics APIs used by the package, to test and benchmark it offline:
+    - reports:batchGet of the Reporting API v4, answering with synthetic reports, pivots and cohorts included
+    - the accounts, webproperties, profiles and uploads list calls of the Management API v3
+    - resumable uploads, upload status and deleteUploadData of the Management API v3
+
+    server = FakeGAServer(rows_per_day=10000, latency=0.05, error_rate=0.01)
+    server.start()
+    analytics = GetGAData('2020-01-01', '2020-01-31')
+    analytics.report_service = server.reportService()
+    ...
+    server.stop()
+"""
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import json
+import random
+import re
+import threading
+import time
+
+from googleAnalyticUtility._helpers import discoveryDocument
+
+
+UPLOADS_PATH = re.compile(r'^(?:/upload)?/analytics/v3/management/accounts/(?P<account>[^/]+)/webproperties/'
+                          r'(?P<property>[^/]+)/customDataSources/(?P<source>[^/]+)/'
+                          r'(?P<action>uploads|deleteUploadData)(?:/(?P<upload>[^/]+))?$')
+LIST_PATH = re.compile(r'^/analytics/v3/management/accounts(?:/(?P<account>[^/]+)/webproperties'
+                       r'(?:/(?P<property>[^/]+)/profiles)?)?$')
+
+
+def fakeService(url, name, version, http=None):
+    """
+    Build a googleapiclient service sending its requests to a FakeGAServer
+
+        Args:
+            url: str, root url of the server
+            name: str, 'analyticsreporting' or 'analytics'
+            version: str, 'v4' or 'v3'
+            http: httplib2.Http, optional http object. Default to googleapiclient.http.build_http()
+        Return:
+            service: googleapiclient.discovery.Resource, the service
+    """
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import build_http
+
+    document = dict(discoveryDocument(name, version))
+    document['rootUrl'] = url
+    document['baseUrl'] = url + document.get('servicePath', '')
+    return build_from_document(document, http=http or build_http())
+
+
+class FakeGAServer(object):
+    """
+    Threaded HTTP server generating synthetic Google Analytics responses.
+
+    Every report request returns `rows_per_day` rows per day of its date range, split in pages of the
+    request pageSize (capped by `max_page_size`). Dimension values cycle through `cardinality` values,
+    except ga:date which holds the date of the row, and metrics are random integers. Each request waits
+    `latency` seconds and fails with `error_status` with probability `error_rate`. Date ranges longer than
+    `max_unsampled_days` days come back sampled.
+    """
+
+    def __init__(self, rows_per_day=1000, max_page_size=100000, latency=0, error_rate=0, error_status=503,
+                 max_unsampled_days=None, cardinality=50, accounts=2, properties=2, views=2, seed=0):
+        """
+            Args:
+                rows_per_day: int, number of rows of each day of a report
+                max_page_size: int, maximum number of rows per page, whatever the request pageSize
+                latency: float, seconds waited before answering each request
+                error_rate: float, probability that a request fails
+                error_status: int, HTTP status of failed requests (503, 500 or 429)
+                max_unsampled_days: int, date ranges with more days come back sampled. None to never sample
+                cardinality: int, number of distinct values of each dimension
+                accounts: int, number of accounts listed by the management API
+                properties: int, number of properties per account
+                views: int, number of views per property
+                seed: int, seed of the random generator
+        """
+        self.rows_per_day = rows_per_day
+        self.max_page_size = max_page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_unsampled_days = max_unsampled_days
+        self.cardinality = cardinality
+        self.accounts = [{'id': str(1000 + a), 'name': f'Account {a}'} for a in range(accounts)]
+        self.properties = [{'id': f'UA-{1000 + a}-{p + 1}', 'name': f'Property {a}-{p}', 'accountId': str(1000 + a)}
+                           for a in range(accounts) for p in range(properties)]
+        self.views = [{'id': str(100000 * (1 + a) + 100 * p + v), 'name': f'View {a}-{p}-{v}',
+                       'accountId': str(1000 + a), 'webPropertyId': f'UA-{1000 + a}-{p + 1}'}
+                      for a in range(accounts) for p in range(properties) for v in range(views)]
+        self.uploads = dict()
+        self.sessions = dict()
+        self.requests = 0
+        self.errors = 0
+        self.rows = 0
+        self.bytes = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+
+    def start(self):
+        """
+        Start serving on a free local port in a background thread
+
+            Return:
+                url: str, root url of the server
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.handle(self, 'GET')
+
+            def do_POST(self):
+                server.handle(self, 'POST')
+
+            def do_PUT(self):
+                server.handle(self, 'PUT')
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self.url
+
+
+    def stop(self):
+        """
+        Stop the server
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+    def service(self, name, version, http=None):
+        """
+        Build a googleapiclient service sending its requests to this server, see fakeService()
+        """
+        return fakeService(self.url, name, version, http)
+
+
+    def reportService(self):
+        return self.service('analyticsreporting', 'v4')
+
+
+    def managementService(self):
+        return self.service('analytics', 'v3')
+
+
+    def resetCounters(self):
+        with self._lock:
+            self.requests = self.errors = self.rows = self.bytes = 0
+
+
+    def handle(self, handler, method):
+        """
+        Route a request to the endpoint it targets and write the response
+        """
+        url = urlparse(handler.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else b''
+        with self._lock:
+            self.requests += 1
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if failed:
+            reason = 'rateLimitExceeded' if self.error_status == 429 else 'backendError'
+            return self.respond(handler, self.error_status, {'error': {
+                'code': self.error_status, 'message': 'synthetic error', 'errors': [{'reason': reason}]}})
+
+        if url.path == '/v4/reports:batchGet' and method == 'POST':
+            return self.respond(handler, 200, self.batchGet(json.loads(body)))
+        if url.path.startswith('/upload-session/') and method == 'PUT':
+            return self.uploadChunk(handler, url.path.rsplit('/', 1)[1], body)
+
+        match = UPLOADS_PATH.match(url.path)
+        if match is not None:
+            source = match.group('source')
+            if match.group('action') == 'deleteUploadData':
+                ids = set(json.loads(body).get('customDataImportUids'))
+                with self._lock:
+                    self.uploads[source] = [u for u in self.uploads.get(source, []) if u.get('id') not in ids]
+                return self.respond(handler, 204, None)
+            if method == 'POST':
+                return self.startUpload(handler, match.groupdict())
+            if match.group('upload'):
+                return self.respond(handler, 200, {'id': match.group('upload'), 'status': 'COMPLETED',
+                                                   'customDataSourceId': source})
+            return self.respond(handler, 200, self.page(list(self.uploads.get(source, [])), query))
+
+        match = LIST_PATH.match(url.path)
+        if match is not None and method == 'GET':
+            account, web_property = match.group('account'), match.group('property')
+            if account is None:
+                items = self.accounts
+            elif web_property is None:
+                items = [p for p in self.properties if account in ('~all', p.get('accountId'))]
+            else:
+                items = [v for v in self.views if account in ('~all', v.get('accountId'))
+                         and web_property in ('~all', v.get('webPropertyId'))]
+            return self.respond(handler, 200, self.page(items, query))
+
+        return self.respond(handler, 404, {'error': {'code': 404, 'message': f'unknown endpoint {url.path}'}})
+
+
+    def respond(self, handler, status, body, headers=None):
+        content = json.dumps(body).encode('utf-8') if body is not None else b''
+        with self._lock:
+            self.bytes += len(content)
+        handler.send_response(status)
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+
+    def page(self, items, query):
+        """
+        Paginate a management list call with its max-results and start-index parameters
+        """
+        max_results = int(query.get('max-results', 1000))
+        start_index = int(query.get('start-index', 1))
+        return {'items': items[start_index - 1:start_index - 1 + max_results], 'totalResults': len(items),
+                'itemsPerPage': max_results, 'startIndex': start_index}
+
+
+    def batchGet(self, body):
+        return {'reports': [self.report(request) for request in body.get('reportRequests')]}
+
+
+    def report(self, request):
+        """
+        Generate one page of a report request
+        """
+        cohorts = (request.get('cohortGroup') or {}).get('cohorts') or []
+        date_ranges = request.get('dateRanges') or [cohort.get('dateRange') for cohort in cohorts]
+        start = min(datetime.strptime(date_range.get('startDate'), '%Y-%m-%d') for date_range in date_ranges)
+        end = max(datetime.strptime(date_range.get('endDate'), '%Y-%m-%d') for date_range in date_ranges)
+        days = (end - start).days + 1
+        total = self.rows_per_day * days
+        offset = int(request.get('pageToken') or 0)
+        size = min(int(request.get('pageSize') or 1000), self.max_page_size)
+        stop = min(total, offset + size)
+
+        dimensions = [d.get('name') for d in request.get('dimensions', [])]
+        metrics = [m.get('expression') for m in request.get('metrics', [])]
+        pivots = [self.pivotEntries(pivot) for pivot in request.get('pivots') or []]
+        rows = list()
+        for index in range(offset, stop):
+            date = (start + timedelta(days=index // self.rows_per_day)).strftime('%Y%m%d')
+            rows.append({
+                'dimensions': [date if name == 'ga:date' else
+                               cohorts[index % len(cohorts)].get('name') if name == 'ga:cohort' else
+                               f'{name[3:]}-{index % self.cardinality}' for name in dimensions],
+                'metrics': [{'values': [str((index * 7919 + i) % 1000) for i in range(len(metrics))]}]
+            })
+            if pivots:
+                rows[-1]['metrics'][0]['pivotValueRegions'] = [
+                    {'values': [str((index * 31 + i) % 100) for i in range(len(entries))]} for entries in pivots]
+        with self._lock:
+            self.rows += len(rows)
+
+        report = {
+            'columnHeader': {'dimensions': dimensions,
+                             'metricHeader': {'metricHeaderEntries': [{'name': name, 'type': 'INTEGER'}
+                                                                      for name in metrics]}},
+            'data': {'rows': rows, 'rowCount': total}
+        }
+        if pivots:
+            report['columnHeader']['metricHeader']['pivotHeaders'] = [
+                {'pivotHeaderEntries': entries, 'totalPivotGroupsCount': self.cardinality} for entries in pivots]
+        if stop < total:
+            report['nextPageToken'] = str(stop)
+        if self.max_unsampled_days is not None and days > self.max_unsampled_days:
+            report['data'].update({'samplesReadCounts': ['1000'], 'samplingSpaceSizes': ['5000']})
+        else:
+            report['data'].update({'isDataGolden': True})
+
+        return report
+
+
+    def pivotEntries(self, pivot):
+        """
+        Header entries of a pivot: one group per value of its dimensions, from startGroup and up to
+        maxGroupCount groups, each with every metric of the pivot
+        """
+        dimensions = [d.get('name') for d in pivot.get('dimensions', [])]
+        start_group = pivot.get('startGroup') or 0
+        groups = range(start_group, min(self.cardinality, start_group + (pivot.get('maxGroupCount') or 5)))
+        return [{'dimensionNames': dimensions,
+                 'dimensionValues': [f'{name[3:]}-{group}' for name in dimensions],
+                 'metric': {'name': metric.get('expression'), 'type': 'INTEGER'}}
+                for group in groups for metric in pivot.get('metrics', [])]
+
+
+    def startUpload(self, handler, params):
+        with self._lock:
+            session = str(len(self.sessions))
+            self.sessions[session] = {'source': params.get('source'), 'data': bytearray()}
+        self.respond(handler, 200, None, {'Location': f'{self.url}upload-session/{session}'})
+
+
+    def uploadChunk(self, handler, session, body):
+        """
+        Receive a chunk of a resumable upload: answer 308 with the received range until the last chunk
+        """
+        upload = self.sessions.get(session)
+        content_range = handler.headers.get('Content-Range', '')
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range)
+        if match is not None:
+            begin = int(match.group(1))
+            del upload['data'][begin:]
+            upload['data'].extend(body)
+        total = content_range.rsplit('/', 1)[-1]
+        if total != '*' and len(upload['data']) >= int(total):
+            resource = {'id': f'upload{session:0>16}', 'customDataSourceId': upload['source'], 'status': 'PENDING'}
+            with self._lock:
+                self.uploads.setdefault(upload['source'], list()).append(resource)
+            return self.respond(handler, 200, resource)
+
+        headers = {'Range': f'bytes=0-{len(upload["data"]) - 1}'} if upload['data'] else {}
+        self.respond(handler, 308, None, headers)
@@ -1,14 +1,24 @@
 from __future__ import print_function
-import argparse
 import os
-import pandas as pd
-import httplib2
+import json
 import time
+import threading
+import copy
 
-from oauth2client.service_account import ServiceAccountCredentials
-from apiclient.errors import HttpError
-from apiclient.http import MediaFileUpload
-from googleAnalyticUtility._helpers import managementService, reportService, iterResponsePages, formatDates
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.errors import HttpError
+from googleAnalyticUtility._helpers import managementService, reportService, copyService, iterResponsePages, iterPages, \
+    formatDates, datePayload, derivePayload, fetchPacked, isCohort, isSampled, splitDateRange, listAll, execute, RateLimiter, \
+    QuotaExhaustedError, UploadError, UploadTimeoutError, RetryPolicy, SERVICES, UPLOAD_CHUNK_SIZE, DELETE_BATCH_SIZE
+from googleAnalyticUtility._storage import Checkpoint, ResponseCache, SyncState
+from googleAnalyticUtility._convert import reportsToFrame, pivotToFrame, pipelinedFrame
+from googleAnalyticUtility._parquet import ParquetSink
+from googleAnalyticUtility._compact import CompactStore
+from googleAnalyticUtility._spec import ReportSpec, compileSpec, PAGE_SIZE
+from googleAnalyticUtility._backfill import BackfillRunner, LeaseQueue, SharedRateLimiter, WorkUnit, workUnits
+from googleAnalyticUtility._diff import ChangeTracker, FrameDiff, diffFrames
+from googleAnalyticUtility._metrics import INSTRUMENTATION, NULL_SPAN, LoggingSink, PrometheusSink, SpanSink, \
+    reportRows
 
 
 class Management(object):
@@ -19,106 +29,133 @@ class Management(object):
         - format ga returned data to a dataframe
     """
 
-    def __init__(self):
+    def __init__(self, rate_limiter=None, retry_policy=None):
         """
+            Args:
+                rate_limiter: RateLimiter, optional limiter shared with other client objects
+                retry_policy: RetryPolicy, policy used to retry transient API errors. Default to RetryPolicy()
+        """
+        self._management_service = None
+        self._injected_service = False
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
 
+
+    @property
+    def management_service(self):
+        """
+        The v3 management service, built on first use
         """
-        self.management_service = managementService()
+        if self._management_service is None:
+            self._management_service = managementService()
+        return self._management_service
+
+
+    @management_service.setter
+    def management_service(self, service):
+        self._management_service = service
+        self._injected_service = service is not None
+
 
+    _account_cache = dict()
+    _account_cache_lock = threading.Lock()
 
-    def getAccountDetails(self):
+    def getAccountDetails(self, cache_ttl=3600, refresh=False):
         """
         Fetch all the viewId linked to an account. This function uses a v3 service created for the
         helper.py file.
+        The whole tree is fetched with three paginated list calls using the `~all` wildcard, then kept in a
+        process wide cache shared by every Management() object using the same credentials. Objects whose
+        `management_service` was assigned share the tree with the objects using the same service only.
 
+            Args:
+                cache_ttl: float, number of seconds the account tree is cached for. 0 to disable the cache
+                refresh: bool, True to ignore the cached tree and fetch it again
             Return:
                 accounts_data: dict, represents the account, property, and view data (id and name)
         """
+        if self._injected_service:
+            service = self._management_service
+            key = ('service', id(service))
+        else:
+            service = None
+            key = (os.environ.get('GA_API_CREDS'), os.environ.get('GA_API_SCOPES'))
+        with Management._account_cache_lock:
+            cached = Management._account_cache.get(key)
+        # the service is kept with the tree so an id reused by another service never matches
+        if cached and cached[2] is service and not refresh and time.monotonic() - cached[0] < cache_ttl:
+            return copy.deepcopy(cached[1])
+
+        management = self.management_service.management()
+        accounts = listAll(management.accounts().list, self.rate_limiter, self.retry_policy)
+        properties = listAll(management.webproperties().list, self.rate_limiter, self.retry_policy,
+                             accountId='~all')
+        views = listAll(management.profiles().list, self.rate_limiter, self.retry_policy,
+                        accountId='~all', webPropertyId='~all')
+
+        property_views = dict()
+        for viewi in views:
+            property_views.setdefault(viewi.get('webPropertyId'), list()).append({'view_name': viewi.get('name'),
+                                                                                  'view_id': viewi.get('id')})
+
+        account_properties = dict()
+        for propertyi in properties:
+            property_id = propertyi.get('id')
+            account_properties.setdefault(propertyi.get('accountId'), list()).append({
+                'property_name': propertyi.get('name'),
+                'property_id': property_id,
+                'property_views': property_views.get(property_id, list())})
+
         accounts_data = {'accounts': list()}
-        
-        accounts = self.management_service.management().accounts().list().execute().get('items')
         for accounti in accounts:
             account_id = accounti.get('id')
-            account_name = accounti.get('name')
-            account_properties = list()
-
-            properties = self.management_service.management().webproperties().list(accountId=account_id).execute().get('items')
-            for propertyi in properties:
-                property_id = propertyi.get('id')
-                property_name = propertyi.get('name')
-                property_views = list()
-
-                views = self.management_service.management().profiles().list(accountId=account_id, 
-                                                                        webPropertyId=property_id).execute().get('items')
-                for viewi in views:
-                    view_id = viewi.get('id')
-                    view_name = viewi.get('name')
-                    property_views.append({'view_name': view_name,
-                                            'view_id': view_id})
-                
-                account_properties.append({'property_name': property_name,
-                                            'property_id': property_id,
-                                            'property_views': property_views})
-            
-            accounts_data.get('accounts').append({'account_name': account_name,
-                                        'account_id': account_id,
-                                        'account_properties': account_properties}
-                                        )
-        
+            accounts_data.get('accounts').append({'account_name': accounti.get('name'),
+                                                  'account_id': account_id,
+                                                  'account_properties': account_properties.get(account_id, list())})
+
+        if cache_ttl:
+            with Management._account_cache_lock:
+                Management._account_cache[key] = (time.monotonic(), copy.deepcopy(accounts_data), service)
+
         return accounts_data
 
 
     @staticmethod
-    def dataToFrame(data):
+    def dataToFrame(data, typed=False):
         """
         format the raw data from the API response into a pandas dataframe
 
             Args:
-                data: list, list of dictionnary containing the reporting data
+                data: list, list of dictionnary containing the reporting data, or a CompactStore which is
+                      always converted to a typed dataframe
+                typed: bool, True to cast metrics to their GA type (INTEGER, FLOAT, PERCENT, TIME, CURRENCY) and
+                       store dimensions as categoricals. False keeps every value as a string
             Return:
                 df: pandas.DataFrame, a dataframe object contaning the formated reporting data
         """
-        dfs = list()
-
-        for datum in data:
-            for report in datum.get('reports'):
-                columnHeader = report.get('columnHeader')
-                dimensionHeader = columnHeader.get('dimensions')
-                metricHeaders = columnHeader.get('metricHeader')
-                metricHeaderEntries = metricHeaders.get('metricHeaderEntries')
-                metricHeader = list()
-
-                for mHeader in metricHeaderEntries:
-                    metricHeader.append(mHeader.get('name'))
-
-                headers = dimensionHeader + metricHeader
-
-                dims = [[] for _ in range(len(dimensionHeader))]
-                mets= [[] for _ in range(len(metricHeaderEntries))]
-                rows = report.get('data').get('rows')
-
-                for row in rows:
-                    dimensions = row.get('dimensions')
-                    metrics = row.get('metrics')
-
-                    for i, dimension in enumerate(dimensions):
-                        dims[i].append(dimension)
-
-                    for metric in metrics:
-                        values = metric.get('values')
-                        for i, value in enumerate(values):
-                            mets[i].append(value)
+        if isinstance(data, CompactStore):
+            return data.toFrame()
+        reports = [report for datum in data for report in datum.get('reports')]
+        df = reportsToFrame(reports, typed)
+        return df
 
-                dims_mets = dims + mets
-                
-                df_tmp = dict()
-                for i, header in enumerate(headers):
-                    df_tmp[header] = dims_mets[i]
 
-                dfs.append(pd.DataFrame(df_tmp))
+    @staticmethod
+    def pivotToFrame(data, typed=False, pivot=0):
+        """
+        format the pivot columns of the raw data into a tidy pandas dataframe: one row per row of the report
+        and group of the pivot, with the row dimensions, the pivot dimensions and the pivot metrics as columns.
+        The metrics of the request itself are returned by dataToFrame
 
-        df = pd.concat(dfs)
-        return df
+            Args:
+                data: list, list of dictionnary containing the reporting data of a request with pivots
+                typed: bool, see dataToFrame
+                pivot: int, index of the pivot to format
+            Return:
+                df: pandas.DataFrame, a dataframe object contaning the pivot data
+        """
+        reports = [report for datum in data for report in datum.get('reports')]
+        return pivotToFrame(reports, typed, pivot)
 
 
 class GetGAData(object):
@@ -127,20 +164,325 @@ class GetGAData(object):
     for a specified date range
     """
 
-    def __init__(self, start_date=None, end_date=None):
+    def __init__(self, start_date=None, end_date=None, rate_limiter=None, retry_policy=None, checkpoint_dir=None,
+                 cache=None, service_factory=None):
         """
         Initialize the GetData() class
 
             Args:
                 start_date: str, start date of the period the data are pulled for
                 end_date: str, end date of the period the data are pulled for
+                rate_limiter: RateLimiter, optional limiter shared with other client objects. When set, requests
+                              are sent as fast as the limiter allows
+                retry_policy: RetryPolicy, policy used to retry transient API errors. Default to RetryPolicy()
+                checkpoint_dir: str, optional directory where every fetched page is saved. A rerun with the same
+                                payload skips the date ranges already fetched and resumes unfinished ones from
+                                their last page token
+                cache: ResponseCache, optional cache of responses. Cached date ranges are not fetched again
+                service_factory: callable, optional function returning a new report service, called once by
+                                 the main thread and once by each worker thread. Default to the service
+                                 configured through the environment variables
         """
         self.start_date = start_date
         self.end_date = end_date
-        self.report_service = reportService()
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.checkpoint = Checkpoint(checkpoint_dir) if checkpoint_dir else None
+        self.cache = cache
+        self.service_factory = service_factory
+        self._report_service = None
+        self._injected_service = False
+        self._thread_services = threading.local()
+
+
+    @property
+    def report_service(self):
+        """
+        The reporting service, built on first use so creating a GetGAData object does not load the API
+        """
+        if self._report_service is None:
+            self._report_service = self.service_factory() if self.service_factory is not None else reportService()
+        return self._report_service
+
+
+    @report_service.setter
+    def report_service(self, service):
+        self._report_service = service
+        self._injected_service = service is not None
+        self._thread_services = threading.local()
+
+
+    def _threadService(self):
+        """
+        Return a report service owned by the calling thread. httplib2 connections are not thread safe,
+        so worker threads each get their own service while the main thread keeps `report_service`. Worker
+        services come from `service_factory`, else are copies of the service assigned to `report_service`,
+        else come from the registry.
+
+            Return:
+                service: googleapiclient.discovery.Resource object, a Google API service object
+        """
+        if threading.current_thread() is threading.main_thread():
+            return self.report_service
+        if self.service_factory is None and not self._injected_service:
+            return reportService()
+
+        service = getattr(self._thread_services, 'service', None)
+        if service is None:
+            if self.service_factory is not None and not self._injected_service:
+                service = self.service_factory()
+            else:
+                service = copyService(self._report_service)
+            self._thread_services.service = service
+
+        return service
+
+
+    def _fetchDay(self, payload, date, verbose, slow_down):
+        """
+        Fetch every page of the report for a single day, on a private copy of the payload
+
+            Args:
+                payload: dict, payload to be passed with the service in the API call. It is not mutated
+                date: str, the day to fetch data for
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+            Return:
+                data: dict, the report data for the day
+        """
+        if verbose:
+            print(f'-----------\nfetching data between {date} and {date}')
+        day_payload = datePayload(payload, date, date)
+        return self._fetch(self._threadService(), day_payload, verbose, slow_down)
+
+
+    def _fetch(self, service, payload, verbose, slow_down):
+        """
+        Fetch every page of a payload, going through the response cache and the checkpoint directory when set
+
+            Args:
+                service: googleapiclient.discovery.Resource object, the report service to use
+                payload: dict, payload to be passed with the service in the API call
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+            Return:
+                data: dict, the report data for the payload date range
+        """
+        if self.cache is not None:
+            data = self.cache.get(payload)
+            if data is not None:
+                if verbose:
+                    print('Loaded from cache')
+                return data
+
+        if self.checkpoint is None:
+            data = iterResponsePages(service, payload, verbose, slow_down, self.rate_limiter, self.retry_policy)
+        else:
+            reports = list()
+            for page in self._iterCheckpointed(service, payload, verbose, slow_down):
+                reports.extend(page.get('reports'))
+            data = {'reports': reports}
+
+        if self.cache is not None:
+            self.cache.put(payload, data)
+
+        return data
+
+
+    def _iterCheckpointed(self, service, payload, verbose, slow_down):
+        """
+        Yield the pages of a payload, reading the ones saved in the checkpoint directory and fetching the
+        missing ones, which are saved as they arrive
+
+            Args:
+                service: googleapiclient.discovery.Resource object, the report service to use
+                payload: dict, payload to be passed with the service in the API call
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+            Yield:
+                page: dict, the response of one page
+        """
+        pages = 0
+        next_token = None
+        for page in self.checkpoint.iterPages(payload):
+            pages += 1
+            next_token = page.get('reports')[0].get('nextPageToken')
+            yield page
+
+        if self.checkpoint.isDone(payload) or (pages > 0 and next_token is None):
+            if verbose:
+                print('Loaded from checkpoint')
+            return
+        if next_token is not None:
+            payload = derivePayload(payload, pageToken=next_token)
+
+        for page in iterPages(service, payload, verbose, slow_down, self.rate_limiter, self.retry_policy):
+            self.checkpoint.savePage(payload, page)
+            yield page
+            payload = derivePayload(payload, pageToken=page.get('reports')[0].get('nextPageToken'))
+        self.checkpoint.markDone(payload)
+
+
+    def _iterFetch(self, service, payload, verbose, slow_down):
+        """
+        Yield the pages of a payload one at a time. A cached response is yielded as a single page; pages
+        fetched from the API are not added to the cache since that would require holding them all
+
+            Args:
+                service: googleapiclient.discovery.Resource object, the report service to use
+                payload: dict, payload to be passed with the service in the API call
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+            Yield:
+                page: dict, the response of one page
+        """
+        if self.cache is not None:
+            data = self.cache.get(payload)
+            if data is not None:
+                if verbose:
+                    print('Loaded from cache')
+                yield data
+                return
+
+        if self.checkpoint is None:
+            yield from iterPages(service, payload, verbose, slow_down, self.rate_limiter, self.retry_policy)
+        else:
+            yield from self._iterCheckpointed(service, payload, verbose, slow_down)
+
+
+    def iterData(self, payload=None, batch=True, verbose=True, slow_down=0, as_frame=False, typed=False):
+        """
+        Fetch the data from the GA API and yield it page by page as it arrives. Memory stays bounded to
+        about one page whatever the date range, so results can be written to disk or to a database on the go.
+
+            Args:
+                payload: dict, payload to be passed with the service in the API call
+                batch: bool, True if to fetch all the data within the data range at once or False to fetch
+                       them day by day
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+                as_frame: bool, True to yield a pandas.DataFrame per page instead of the raw response
+                typed: bool, passed to Management.dataToFrame when as_frame=True
+            Yield:
+                page: dict or pandas.DataFrame, the data of one page. Raw pages have the same structure as
+                      the items returned by getData()
+        """
+        for _, page in self._iterPayloadPages(payload, batch, verbose, slow_down):
+            yield Management.dataToFrame([page], typed) if as_frame else page
+
+
+    def _iterPayloadPages(self, payload, batch, verbose, slow_down):
+        """
+        Yield the pages of every date range of a getData() call along with the payload each page comes from
 
+            Args:
+                payload: dict, payload to be passed with the service in the API call
+                batch: bool, True for one date range, False for one date range per day
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+            Yield:
+                request_payload: dict, the payload of the date range
+                page: dict, the response of one page
+        """
+        if batch or isCohort(payload):
+            payloads = [payload]
+        else:
+            payloads = (datePayload(payload, date, date) for date in formatDates(self.start_date, self.end_date))
+
+        for request_payload in payloads:
+            if verbose:
+                date_range = (request_payload.get('reportRequests')[0].get('dateRanges') or [{}])[0]
+                print(f'-----------\nfetching data between {date_range.get("startDate")} and {date_range.get("endDate")}')
+            for page in self._iterFetch(self.report_service, request_payload, verbose, slow_down):
+                yield request_payload, page
+
+
+    def writeParquet(self, payload, path, batch=True, verbose=True, slow_down=0, compression='zstd', columns=None):
+        """
+        Fetch the data from the GA API and append each page to a parquet dataset partitioned by view id and
+        date as soon as it arrives. Requires pyarrow.
+
+            Args:
+                payload: dict, payload to be passed with the service in the API call
+                path: str, root directory of the dataset
+                batch: bool, True if to fetch all the data within the data range at once or False to fetch
+                       them day by day
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+                compression: str, parquet compression codec
+                columns: list, optional names of the dimensions and metrics to write
+            Return:
+                rows: int, number of rows written
+        """
+        with ParquetSink(path, compression=compression, columns=columns) as sink:
+            for request_payload, page in self._iterPayloadPages(payload, batch, verbose, slow_down):
+                request = request_payload.get('reportRequests')[0]
+                # cohort requests have no date range: their rows are stored under the dates of the object
+                date_range = (request.get('dateRanges') or [{'startDate': self.start_date,
+                                                              'endDate': self.end_date}])[0]
+                date = date_range.get('startDate')
+                if date_range.get('endDate') != date:
+                    date = f'{date}_{date_range.get("endDate")}'
+                sink.write(page, request.get('viewId'), date)
+
+        return sink.rows
+
+
+    def getFrame(self, payload=None, batch=True, verbose=True, slow_down=0, typed=True, converters=2,
+                 queue_size=4):
+        """
+        Fetch the data from the GA API straight into a dataframe. Pages are converted while the next ones are
+        being fetched: a producer thread sends the requests and a pool of converter threads turns each page
+        into typed columns as soon as it arrives. The queue between them is bounded, so a slow conversion
+        pauses the fetching instead of piling up responses in memory.
+
+            Args:
+                payload: dict, payload to be passed with the service in the API call
+                batch: bool, True if to fetch all the data within the data range at once or False to fetch
+                       them day by day
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+                typed: bool, see Management.dataToFrame
+                converters: int, number of pages converted in parallel
+                queue_size: int, maximum number of fetched pages waiting to be converted
+            Return:
+                df: pandas.DataFrame, the rows of every page, in the order they were fetched
+        """
+        pages = (page for _, page in self._iterPayloadPages(payload, batch, verbose, slow_down))
+        return pipelinedFrame(pages, typed=typed, converters=converters, queue_size=queue_size)
+
+
+    def getCompactData(self, payload=None, batch=True, verbose=True, slow_down=0, memory_limit=256 * 1024 ** 2,
+                       spill_dir=None):
+        """
+        Fetch the data from the GA API into a CompactStore instead of a list of responses. Each page is
+        encoded as soon as it arrives, dimensions as dictionary codes and metrics as typed arrays, and the
+        arrays are spilled to memory mapped files past memory_limit.
+
+            Args:
+                payload: dict, payload to be passed with the service in the API call
+                batch: bool, True if to fetch all the data within the data range at once or False to fetch
+                       them day by day
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+                memory_limit: int, number of bytes kept in memory before spilling to disk. None to never spill
+                spill_dir: str, directory of the spill files. Default to the temp directory
+            Return:
+                store: CompactStore, the fetched rows. Pass it to Management.dataToFrame() or call its toFrame()
+                       method, and close() it to remove its spill files
+        """
+        store = CompactStore(memory_limit, spill_dir)
+        try:
+            for _, page in self._iterPayloadPages(payload, batch, verbose, slow_down):
+                store.append(page)
+        except BaseException:
+            store.close()
+            raise
+
+        return store
 
-    def getData(self, payload=None, batch=True, verbose=True, slow_down=0):
+
+    def getData(self, payload=None, batch=True, verbose=True, slow_down=0, workers=1):
         """
         Fetch the data from the GA API
 
@@ -150,32 +492,151 @@ class GetGAData(object):
                 batch: bool, True if to fetch all the data within the data range at once or False to fetch
                        them day by day
                 verbose: bool, display information regarding rows being fetched
+                workers: int, number of days fetched in parallel when batch=False. Results keep the order
+                         of the dates whatever the number of workers
             Return:
                 data: list, contains the report data for the specified request. If batch=False, len(data) = 1 otherwise
-                      len(data) = n when n is the number of days in the date range.
+                      len(data) = n when n is the number of days in the date range. Cohort requests have no date
+                      range and are always fetched at once
 
         """
         service = self.report_service
         data = list()
-        if batch:
+        if batch or isCohort(payload):
             if verbose:
                 print(f'-----------\nfetching data between {self.start_date} and {self.end_date}')
-            data.append(iterResponsePages(service, payload, verbose, slow_down))
+            data.append(self._fetch(service, payload, verbose, slow_down))
             return data
         else:
             dates = formatDates(self.start_date, self.end_date)
             self.days_ = len(dates)
-            for date in dates:
-                if verbose:
-                    print(f'-----------\nfetching data between {date} and {date}')
-                payload.get('reportRequests')[0].get('dateRanges')[0].update({'startDate': date})
-                payload.get('reportRequests')[0].get('dateRanges')[0].update({'endDate': date})
-                data.append(iterResponsePages(service, payload, verbose, slow_down))
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    data.extend(executor.map(lambda date: self._fetchDay(payload, date, verbose, slow_down), dates))
+            else:
+                for date in dates:
+                    data.append(self._fetchDay(payload, date, verbose, slow_down))
             return data        
 
 
+    def getIncrementalData(self, payload, state, verbose=True, slow_down=0, workers=1):
+        """
+        Fetch, day by day, only the dates of the date range that were never fetched or whose data was not
+        final (isDataGolden) when they were last fetched. The dates are recorded in `state` once fetched, so
+        a daily refresh over a rolling window only requests the days that changed.
+
+            Args:
+                payload: dict, payload to be passed with the service in the API call
+                state: SyncState, the state store recording the fetched dates
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+                workers: int, number of days fetched in parallel
+            Return:
+                data: list, contains the report data of each fetched date. The fetched dates are listed in
+                      `self.dates_`, in the same order
+        """
+        dates = state.pendingDates(payload, formatDates(self.start_date, self.end_date))
+        self.dates_ = dates
+        if verbose:
+            print(f'-----------\n{len(dates)} dates to fetch')
+
+        def fetchDate(date):
+            day = self._fetchDay(payload, date, verbose, slow_down)
+            golden = all((report.get('data') or {}).get('isDataGolden', False) for report in day.get('reports'))
+            state.record(payload, date, golden)
+            return day
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(fetchDate, dates))
+
+        return [fetchDate(date) for date in dates]
+
+
+    def getUnsampledData(self, payload=None, verbose=True, slow_down=0):
+        """
+        Fetch the data from the GA API with as few requests as possible while avoiding sampled data. The whole
+        date range is requested first; when the first page of a range comes back sampled, the range is split
+        in two halves which are requested in turn. Only ranges that are sampled end up being requested day by
+        day. A single day that is still sampled is kept as is.
+
+            Args:
+                payload: dict, payload to be passed with the service in the API call
+                verbose: bool, display information regarding rows being fetched
+                slow_down: float, number of seconds to wait before each request
+            Return:
+                data: list, contains the report data for each final date range, in chronological order. The
+                      ranges are listed in `self.ranges_` as dictionnaries with the startDate, endDate, sampled
+                      and golden (isDataGolden) keys
+        """
+        data = list()
+        self.ranges_ = list()
+        pending = [(self.start_date, self.end_date)]
+
+        while pending:
+            start_date, end_date = pending.pop(0)
+            if verbose:
+                print(f'-----------\nfetching data between {start_date} and {end_date}')
+            range_payload = datePayload(payload, start_date, end_date)
+            pages = self._iterFetch(self.report_service, range_payload, verbose, slow_down)
+            first = next(pages)
+            sampled = any(isSampled(report) for report in first.get('reports'))
+
+            if sampled and start_date != end_date:
+                pages.close()
+                if verbose:
+                    print('Sampled data, splitting the date range')
+                pending = splitDateRange(start_date, end_date) + pending
+                continue
+
+            reports = list(first.get('reports'))
+            for page in pages:
+                reports.extend(page.get('reports'))
+            data.append({'reports': reports})
+            self.ranges_.append({'startDate': start_date, 'endDate': end_date, 'sampled': sampled,
+                                 'golden': all(report.get('data', {}).get('isDataGolden', False)
+                                               for report in reports)})
+
+        return data
+
+
+    def getPackedData(self, payloads, verbose=True, slow_down=0):
+        """
+        Fetch several payloads at once, packing compatible report requests into shared batchGet calls
+        (up to 5 per call). Requests can be packed together when they are for the same view, date ranges,
+        sampling level, segments and cohort group, e.g. several dimension breakdowns of one view. Requests
+        for different views always go in separate calls, as required by the API.
+
+            Args:
+                payloads: list, payloads as returned by formatPayload
+                verbose: bool, display information regarding the calls being sent
+                slow_down: float, number of seconds to wait before each request
+            Return:
+                data: list, one item per payload, in the same order. Each item has the same structure as the
+                      items returned by getData() and can be passed to Management.dataToFrame
+        """
+        return fetchPacked(self.report_service, payloads, verbose, slow_down, self.rate_limiter, self.retry_policy)
+
+
+    def reportSpec(self, dimensions, metrics, view_id=None, dimension_operator=None, dimensions_filters=None,
+                   metric_operator=None, metrics_filters=None, page_size=PAGE_SIZE, order_bys=None, pivots=None,
+                   segments=None, cohorts=None, lifetime_value=False, hide_totals=False, hide_value_ranges=False):
+        """
+        Compile a request into an immutable ReportSpec over the date range of the object. Specs are memoized:
+        the same arguments return the same compiled spec. Takes the same arguments as formatPayload()
+
+            Return:
+                spec: ReportSpec, use spec.payload() for the payload of the whole date range and
+                      spec.payload(date) for the payload of a single day
+        """
+        return compileSpec(view_id, dimensions, metrics, self.start_date, self.end_date, dimension_operator,
+                           dimensions_filters, metric_operator, metrics_filters, page_size, order_bys, pivots,
+                           segments, cohorts, lifetime_value, hide_totals, hide_value_ranges)
+
+
     def formatPayload(self, dimensions, metrics, view_id=None, dimension_operator=None, dimensions_filters=None, 
-                        metric_operator=None, metrics_filters=None):
+                        metric_operator=None, metrics_filters=None, order_bys=None, pivots=None, segments=None,
+                        cohorts=None, lifetime_value=False, hide_totals=False, hide_value_ranges=False):
         """  
             Format the payload for the GA API
             Args:
@@ -200,70 +661,263 @@ class GetGAData(object):
                                         tuple[1] logical expression (True or False) to include or exclude
                                         tuple[2] metric operator ('EQUAL', 'LESS_THAN', 'GREATER_THAN', 'IS_MISSING')
                                         tuple[3] expression
+                order_bys: list of field names to sort ascending, or of tuples
+                                        tuple[0] field name
+                                        tuple[1] sort order ('ASCENDING' or 'DESCENDING'), optional
+                                        tuple[2] order type ('VALUE', 'DELTA', 'SMART', 'HISTOGRAM_BUCKET' or
+                                                 'DIMENSION_AS_INTEGER'), optional
+                pivots: list of at most 2 tuples, each pivoting the values of its dimensions into columns
+                                        tuple[0] list of the pivot dimensions
+                                        tuple[1] list of the pivot metrics
+                                        tuple[2] maximum number of groups returned, optional
+                                        tuple[3] index of the first group returned, optional
+                segments: list of segment ids ('gaid::-3') or dynamic segment dictionnaries. Adds ga:segment
+                          to the dimensions
+                cohorts: list of (name, start date, end date) tuples of first visit date cohorts. Adds ga:cohort
+                         to the dimensions and replaces the date range of the request
+                lifetime_value: bool, True to request the lifetime value of the cohorts
+                hide_totals: bool, True to leave the totals, minimums and maximums out of the response
+                hide_value_ranges: bool, True to leave the minimums and maximums out of the response
             Return:
                 payload: dict, returns a dictionnary representation of the payload to be passed with the service object in the
                         API call            
         """
-        if not view_id:
-            raise ValueError("view_id cannot be None. You must pass a GA View ID")
+        return self.reportSpec(dimensions, metrics, view_id, dimension_operator, dimensions_filters,
+                               metric_operator, metrics_filters, order_bys=order_bys, pivots=pivots,
+                               segments=segments, cohorts=cohorts, lifetime_value=lifetime_value,
+                               hide_totals=hide_totals, hide_value_ranges=hide_value_ranges).payload()
 
-        formated_dimensions = list()
-        formated_metrics = list()
-        
-        for dimension in dimensions:
-            formated_dimensions.append({'name':dimension})
-            
-        for metric in metrics:
-            formated_metrics.append({'expression': metric})
-        
-        dim_filters = list()
-        met_filters = list()
-        
-        if dimensions_filters:
-            for dim_filt in dimensions_filters:
-                dim_filters.append({
-                    'dimensionName': dim_filt[0],
-                    'not': dim_filt[1],
-                    'operator': dim_filt[2],
-                    'expressions': dim_filt[3],
-                    'caseSensitive': dim_filt[4]
-                })
-                
-        if metrics_filters:
-            for met_filt in metrics_filters:
-                met_filters.append({
-                    "metricName": met_filt[0],
-                    "not": met_filt[1],
-                    "operator": met_filt[2],
-                    "comparisonValue": met_filt[3]
-                })
-                
-                
-        payload = {
-            'reportRequests': [{
-                'viewId': view_id,
-                'dateRanges': [
-                    {
-                        'startDate': self.start_date,
-                        'endDate': self.end_date,
-                    }
-                ],
-                'dimensions': formated_dimensions,
-                'metrics': formated_metrics,
-                'pageToken': '0',
-                'pageSize': 100000,
-                "dimensionFilterClauses":  [{ 
-                            "operator": dimension_operator,
-                            "filters": dim_filters
-                }],
-                "metricFilterClauses":  [{ 
-                            "operator": metric_operator,
-                            "filters": met_filters
-                }],
-            }]
-        }
-        
-        return payload
+
+class AsyncGetGAData(object):
+    """
+    The AsyncGetGAData class is the asyncio counterpart of GetGAData. Requests are sent with aiohttp and at
+    most `workers` requests are in flight at once, across every view and date fetched by the object.
+    Results have the same structure as GetGAData.getData() and can be passed to Management.dataToFrame.
+    Use it as an async context manager so its HTTP session is closed:
+
+        async with AsyncGetGAData('2020-01-01', '2020-01-31') as analytics:
+            data = await analytics.getData(payload, batch=False)
+    """
+
+    BATCH_GET_URI = 'https://analyticsreporting.googleapis.com/v4/reports:batchGet'
+
+    def __init__(self, start_date=None, end_date=None, workers=4, rate_limiter=None, retry_policy=None,
+                 endpoint=None, token=None):
+        """
+        Initialize the AsyncGetGAData() class
+
+            Args:
+                start_date: str, start date of the period the data are pulled for
+                end_date: str, end date of the period the data are pulled for
+                workers: int, maximum number of requests in flight
+                rate_limiter: RateLimiter, optional limiter shared with other client objects
+                retry_policy: RetryPolicy, policy used to retry transient API errors. Default to RetryPolicy()
+                endpoint: str, URL of the batchGet endpoint. Default to the Google Analytics Reporting API
+                token: callable, optional function returning an OAuth access token. Default to a token of the
+                       service account set through the GA_API_CREDS and GA_API_SCOPES environment variables
+        """
+        self.start_date = start_date
+        self.end_date = end_date
+        self.workers = workers
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.endpoint = endpoint or self.BATCH_GET_URI
+        self.token = token
+        self._session = None
+        self._semaphore = None
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+    async def close(self):
+        """
+        Close the HTTP session
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+    async def _accessToken(self):
+        if self.token is not None:
+            return self.token()
+
+        import asyncio
+
+        credentials = SERVICES.credentials(os.environ.get('GA_API_CREDS'),
+                                           os.environ.get('GA_API_SCOPES').split(','))
+        info = await asyncio.get_running_loop().run_in_executor(None, credentials.get_access_token)
+        return info.access_token
+
+
+    async def _post(self, body, span=NULL_SPAN):
+        """
+        Send one batchGet request
+
+            Args:
+                body: dict, the payload of the request
+                span: Span, the span the response size is recorded in
+            Return:
+                response: dict, the API response
+        """
+        import aiohttp
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        headers = {'Authorization': f'Bearer {await self._accessToken()}'}
+
+        async with self._session.post(self.endpoint, json=body, headers=headers) as resp:
+            content = await resp.read()
+            if resp.status >= 300:
+                import httplib2
+
+                raise HttpError(httplib2.Response({'status': resp.status, 'content-type': resp.content_type}),
+                                content, uri=self.endpoint)
+            span.set(response_bytes=len(content))
+            return json.loads(content)
+
+
+    async def _batchGet(self, payload):
+        """
+        Send one batchGet request, waiting on the rate limiter and the worker semaphore and retrying
+        transient errors
+        """
+        import asyncio
+        import aiohttp
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        view_id = payload.get('reportRequests')[0].get('viewId')
+
+        with INSTRUMENTATION.span('request', method='analyticsreporting.reports.batchGet', view_id=view_id) as span:
+            async def send():
+                span.add('quota_units')
+                if self.rate_limiter is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, self.rate_limiter.acquire, view_id)
+                async with self._semaphore:
+                    return await self._post(payload, span)
+
+            response = await self.retry_policy.acall(send, retryable=(aiohttp.ClientConnectionError,
+                                                                      asyncio.TimeoutError))
+            span.set(retries=span.attributes.get('quota_units', 1) - 1, rows=reportRows(response))
+
+        return response
+
+
+    async def iterPages(self, payload, verbose=False):
+        """
+        Asynchronously yield the response pages of a payload one at a time
+
+            Args:
+                payload: dict, payload to be passed in the API call. It is not mutated
+                verbose: bool, display information regarding rows being fetched
+            Yield:
+                page: dict, the API response for one page
+        """
+        payload = derivePayload(payload)
+        request = payload.get('reportRequests')[0]
+        while True:
+            if verbose:
+                print(f'Fetching rows starting at position: {request.get("pageToken")}')
+            page = await self._batchGet(payload)
+            yield page
+
+            token = page.get('reports')[0].get('nextPageToken')
+            if token is None:
+                return
+            request.update({'pageToken': token})
+
+
+    async def fetch(self, payload, verbose=False):
+        """
+        Fetch every page of a payload
+
+            Args:
+                payload: dict, payload to be passed in the API call. It is not mutated
+                verbose: bool, display information regarding rows being fetched
+            Return:
+                data: dict, the report data with the same structure as the output of iterResponsePages
+        """
+        if verbose:
+            date_range = (payload.get('reportRequests')[0].get('dateRanges') or [{}])[0]
+            print(f'-----------\nfetching data between {date_range.get("startDate")} and {date_range.get("endDate")}')
+        reports = list()
+        async for page in self.iterPages(payload, verbose):
+            reports.extend(page.get('reports'))
+
+        return {'reports': reports}
+
+
+    def _payloads(self, payload, batch):
+        if batch or isCohort(payload):
+            return [payload]
+        return [datePayload(payload, date, date) for date in formatDates(self.start_date, self.end_date)]
+
+
+    @staticmethod
+    async def _gather(coroutines):
+        """
+        Run coroutines concurrently and return their results in order. If one of them fails or the caller is
+        cancelled, the others are cancelled.
+        """
+        import asyncio
+
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+
+    async def getData(self, payload=None, batch=True, verbose=False):
+        """
+        Fetch the data from the GA API
+
+            Args:
+                payload: dict, payload to be passed in the API call
+                batch: bool, True if to fetch all the data within the data range at once or False to fetch
+                       them day by day, concurrently. Cohort requests have no date range and are always
+                       fetched at once
+                verbose: bool, display information regarding rows being fetched
+            Return:
+                data: list, same as GetGAData.getData()
+        """
+        payloads = self._payloads(payload, batch)
+        self.days_ = len(payloads)
+        return await self._gather([self.fetch(p, verbose) for p in payloads])
+
+
+    async def getManyData(self, payloads, batch=True, verbose=False):
+        """
+        Fetch the data of several payloads, e.g. one per view, sharing the `workers` limit across every view
+        and date
+
+            Args:
+                payloads: list, payloads to be passed in the API calls
+                batch: bool, see getData
+                verbose: bool, display information regarding rows being fetched
+            Return:
+                data: list, one item per payload, each being the output of getData for that payload
+        """
+        per_payload = [self._payloads(payload, batch) for payload in payloads]
+        results = await self._gather([self.fetch(p, verbose) for group in per_payload for p in group])
+
+        data = list()
+        position = 0
+        for group in per_payload:
+            data.append(results[position:position + len(group)])
+            position += len(group)
+
+        return data
 
 
 class DataImport(object):
@@ -272,11 +926,15 @@ class DataImport(object):
     in Google Analytics
     """
 
-    def __init__(self, datasource_id=None):
+    def __init__(self, datasource_id=None, rate_limiter=None, retry_policy=None, account_id=None, property_id=None):
         """
         Instantiate an object for the class. 
             Args:
-                None
+                datasource_id: str, the id of the data source
+                rate_limiter: RateLimiter, optional limiter shared with other client objects
+                retry_policy: RetryPolicy, policy used to retry transient API errors. Default to RetryPolicy()
+                account_id: str, the account id of the data source. Default to the GA_ACCOUNT_ID env variable
+                property_id: str, the property id of the data source. Default to the GA_PROPERTY_ID env variable
 
             Return:
                 None
@@ -287,10 +945,39 @@ class DataImport(object):
                 _propertyId: str, the property id assigned to the custom data source
                 _dataSouceId: str, the id of the data source
         """
-        self._managementService = managementService().management()
-        self._accountId = os.getenv('GA_ACCOUNT_ID')
-        self._propertyId = os.getenv('GA_PROPERTY_ID')
+        self._management = None
+        self._accountId = account_id if account_id is not None else os.getenv('GA_ACCOUNT_ID')
+        self._propertyId = property_id if property_id is not None else os.getenv('GA_PROPERTY_ID')
         self._dataSouceId = datasource_id
+        self._rateLimiter = rate_limiter
+        self._retryPolicy = retry_policy if retry_policy is not None else RetryPolicy()
+
+    @property
+    def _managementService(self):
+        """
+        The management resource of the v3 service, built on first use
+        """
+        if self._management is None:
+            self._management = managementService().management()
+        return self._management
+
+
+    def uploadStatus(self, upload_id):
+        """
+        Fetch the upload status of a specific upload. API errors are raised.
+            Args:
+               upload_id: str, the id of the data uploaded
+
+            Return:
+                dict, a representation of the status of the file
+        """
+        return execute(self._managementService.uploads().get(
+            accountId=self._accountId,
+            webPropertyId=self._propertyId,
+            customDataSourceId=self._dataSouceId,
+            uploadId=upload_id
+        ), self._rateLimiter, retry_policy=self._retryPolicy)
+
 
     def getUploadStatus(self, uploadId):
         """
@@ -302,14 +989,7 @@ class DataImport(object):
                 dict, a representation of the status of the file 
         """
         try:
-            status = self._managementService.uploads().get(
-                accountId=self._accountId,
-                webPropertyId=self._propertyId,
-                customDataSourceId=self._dataSouceId,
-                uploadId=uploadId
-            ).execute()
-
-            return status
+            return self.uploadStatus(uploadId)
         
         except TypeError as err:
             return f'We found an error in your query structure: {err}' 
@@ -318,6 +998,18 @@ class DataImport(object):
             return f'We found an API error while performing your request: {err}'
 
 
+    def listUploads(self):
+        """
+        Fetch every upload of the data source, following the pagination of the list call. API errors are
+        raised.
+            Return:
+                list, the upload resources
+        """
+        return listAll(self._managementService.uploads().list, self._rateLimiter, self._retryPolicy,
+                       accountId=self._accountId, webPropertyId=self._propertyId,
+                       customDataSourceId=self._dataSouceId)
+
+
     def getUploadedData(self):
         """
         Fetch the ids of all table uploaded to a specific data source
@@ -328,11 +1020,7 @@ class DataImport(object):
                 None
         """
         try:
-            lst = self._managementService.uploads().list(
-                accountId=self._accountId,
-                webPropertyId=self._propertyId,
-                customDataSourceId=self._dataSouceId
-            ).execute()
+            lst = self.listUploads()
 
         except TypeError as err:
             return f'We found an error in your query structure: {err}'
@@ -341,30 +1029,49 @@ class DataImport(object):
             return f'We found an API error while performing your request: {err}'
 
         tables = []
-        for table in lst.get('items', []):
+        for table in lst:
             tables.append(table.get('id'))
 
         return tables
 
 
-    def deleteUploadedTables(self, tables):
+    def deleteUploads(self, tables, batch_size=DELETE_BATCH_SIZE):
         """
-        Delete previously uploaded tables in the datasoure
+        Delete uploads of the data source, `batch_size` ids per call. API errors are raised.
             Args:
-                tables: []int, a list of integer representing the id of the tables to delete
+                tables: []str, the ids of the uploads to delete
+                batch_size: int, maximum number of ids sent in one call
 
             Return:
-                1 or error
+                int, the number of calls sent
         """
-        try:
-            self._managementService.uploads().deleteUploadData(
+        tables = list(tables)
+        calls = 0
+        for start in range(0, len(tables), batch_size):
+            execute(self._managementService.uploads().deleteUploadData(
                 accountId=self._accountId,
                 webPropertyId=self._propertyId,
                 customDataSourceId=self._dataSouceId,
                 body={
-                    'customDataImportUids': tables    
+                    'customDataImportUids': tables[start:start + batch_size]
                 }
-            ).execute()
+            ), self._rateLimiter, retry_policy=self._retryPolicy)
+            calls += 1
+
+        return calls
+
+
+    def deleteUploadedTables(self, tables):
+        """
+        Delete previously uploaded tables in the datasoure
+            Args:
+                tables: []int, a list of integer representing the id of the tables to delete
+
+            Return:
+                1 or error
+        """
+        try:
+            self.deleteUploads(tables)
 
             return 0
 
@@ -375,38 +1082,274 @@ class DataImport(object):
             return f'We found an API error while performing your request: {err}'
 
 
-    def uploadData(self, file_path):
+    def waitForUpload(self, upload_id, poll_delay=1, max_poll_delay=60, timeout=None):
+        """
+        Poll the status of an upload until it is not PENDING anymore. The delay between two polls doubles
+        each time, from poll_delay up to max_poll_delay seconds, so long imports do not burn the quota.
+            Args:
+                upload_id: str, the id of the upload
+                poll_delay: float, seconds to wait before the first poll
+                max_poll_delay: float, maximum number of seconds between two polls
+                timeout: float, maximum number of seconds to wait. None to wait until the upload is processed
+
+            Return:
+                dict, the last status of the upload. API errors are raised
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = poll_delay
+        while True:
+            time.sleep(delay)
+            status = self.uploadStatus(upload_id)
+            if status.get('status') != 'PENDING':
+                return status
+            if deadline is not None and time.monotonic() + delay > deadline:
+                return status
+            delay = min(delay * 2, max_poll_delay)
+
+
+    def upload(self, file_path=None, data=None, chunk_size=UPLOAD_CHUNK_SIZE, on_progress=None, verbose=False,
+               poll_delay=1, max_poll_delay=60, timeout=None):
+        """
+        Upload data to the data source and wait for it to be processed. Takes the same arguments as
+        uploadData() but raises errors: HttpError for API errors, UploadTimeoutError if the upload is still
+        PENDING once `timeout` is reached and UploadError for any other status than COMPLETED.
+            Return:
+                dict, the final status of the upload, always COMPLETED
+        """
+        from googleAnalyticUtility._upload import uploadMedia
+
+        media = uploadMedia(file_path, data, chunk_size)
+        request = self._managementService.uploads().uploadData(
+            accountId=self._accountId,
+            webPropertyId=self._propertyId,
+            customDataSourceId=self._dataSouceId,
+            media_body=media
+        )
+
+        with INSTRUMENTATION.span('upload', method='analytics.management.uploads.uploadData',
+                                  datasource_id=self._dataSouceId, pages=0) as span:
+            def sendChunk():
+                span.add('quota_units')
+                if self._rateLimiter is not None:
+                    self._rateLimiter.acquire()
+                return request.next_chunk()
+
+            upload = None
+            while upload is None:
+                # after a failed chunk, next_chunk() asks the server where to resume from
+                progress, upload = self._retryPolicy.call(sendChunk)
+                span.add('pages')
+                if progress is not None:
+                    if on_progress is not None:
+                        on_progress(progress.resumable_progress, progress.total_size)
+                    if verbose:
+                        print(f'{progress.resumable_progress} bytes uploaded')
+            chunks = span.attributes.get('pages', 0)
+            span.set(request_bytes=media.size(), retries=span.attributes.get('quota_units', chunks) - chunks)
+        if on_progress is not None:
+            on_progress(media.size(), media.size())
+
+        status = self.waitForUpload(upload.get('id'), poll_delay, max_poll_delay, timeout)
+        if status.get('status') == 'PENDING':
+            raise UploadTimeoutError(status, f'Upload Timeout: {status.get("id")} still PENDING after {timeout} '
+                                             f'seconds')
+        if status.get('status') != 'COMPLETED':
+            raise UploadError(status)
+
+        return status
+
+
+    def uploadData(self, file_path=None, data=None, chunk_size=UPLOAD_CHUNK_SIZE, on_progress=None, verbose=False,
+                   poll_delay=1, max_poll_delay=60, timeout=None):
         """
-        This method is used to upload a file to the specified Data Source
+        This method is used to upload data to the specified Data Source. The data is sent in chunks with a
+        resumable upload: a chunk interrupted by a transient error is resumed from the last byte received
+        by the server instead of restarting the whole upload.
             Args:
                 file_path: str, a string representation of the file to upload
+                data: pandas.DataFrame or iterable, data to upload instead of a file, without writing a
+                      temporary file. An iterable yields CSV rows (strings or sequences of values), the first
+                      one being the header. Rows are read as the chunks are sent
+                chunk_size: int, number of bytes sent per request, a multiple of 256KiB
+                on_progress: callable, called after each chunk with the number of bytes sent and the total
+                             size (None while unknown)
+                verbose: bool, print the progress of the upload
+                poll_delay: float, seconds to wait before the first status poll, see waitForUpload()
+                max_poll_delay: float, maximum number of seconds between two status polls
+                timeout: float, maximum number of seconds to wait for the upload to be processed
+
+            Return:
+                str, the outcome of the upload. An upload still processed by GA once `timeout` is reached is
+                reported as 'Upload Timeout: ...' with its id
         """
         
         try:
-            media = MediaFileUpload(file_path, mimetype='application/octet-stream',
-                                resumable=False)
-            upload = self._managementService.uploads().uploadData(
-                accountId=self._accountId,
-                webPropertyId=self._propertyId,
-                customDataSourceId=self._dataSouceId,
-                media_body=media    
-            ).execute()
-
-            upload_id = upload.get('id')
-            
-            upload_status = 'PENDING'
+            status = self.upload(file_path, data, chunk_size, on_progress, verbose, poll_delay, max_poll_delay,
+                                 timeout)
 
-            while upload_status == 'PENDING':
-                status = self.getUploadStatus(upload_id)
-                upload_status = status.get('status')
+            return f'Upload Success: {status.get("status")}'
 
-                if upload_status == 'FAILED':
-                    return f'Upload Failed: {status.get("errors")}'
-    
-            return f'Upload Success: {upload_status}'
+        except UploadError as err:
+            return str(err)
         
         except TypeError as err:
             return f'We found an error in your query structure: {err}'
     
         except HttpError as err:
-            return f'We found an API error while performing your request: {err}'
\ No newline at end of file
+            return f'We found an API error while performing your request: {err}'
+
+
+class SourceResult(object):
+    """
+    Outcome of an operation on one data source: what it returned or the error it raised, and how long it took
+    """
+
+    def __init__(self, datasource_id, operation, seconds, result=None, error=None):
+        """
+            Args:
+                datasource_id: str, the id of the data source
+                operation: str, name of the operation ('list', 'delete', 'replace')
+                seconds: float, wall clock duration of the operation
+                result: object, value returned by the operation, None if it failed
+                error: Exception, the error raised by the operation, None if it succeeded
+        """
+        self.datasource_id = datasource_id
+        self.operation = operation
+        self.seconds = seconds
+        self.result = result
+        self.error = error
+
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+    def __repr__(self):
+        outcome = 'ok' if self.ok else f'{type(self.error).__name__}: {self.error}'
+        return f'SourceResult({self.datasource_id!r}, {self.operation!r}, {self.seconds:.3f}s, {outcome})'
+
+
+class DataImportManager(object):
+    """
+    Run DataImport maintenance on many custom data sources of a property at once. Data sources are processed
+    concurrently, each on its own thread and service, and every operation returns a SourceResult per data
+    source with its timing and its error, so one failing data source does not stop the others.
+    """
+
+    def __init__(self, account_id=None, property_id=None, workers=4, delete_batch_size=DELETE_BATCH_SIZE,
+                 rate_limiter=None, retry_policy=None):
+        """
+            Args:
+                account_id: str, the account id of the data sources. Default to the GA_ACCOUNT_ID env variable
+                property_id: str, the property id of the data sources. Default to the GA_PROPERTY_ID env variable
+                workers: int, number of data sources processed in parallel
+                delete_batch_size: int, maximum number of upload ids deleted in one call
+                rate_limiter: RateLimiter, optional limiter shared with other client objects
+                retry_policy: RetryPolicy, policy used to retry transient API errors. Default to RetryPolicy()
+        """
+        self.account_id = account_id
+        self.property_id = property_id
+        self.workers = workers
+        self.delete_batch_size = delete_batch_size
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+
+
+    def dataImport(self, datasource_id):
+        """
+        Return a DataImport object for a data source. Its service is built by the thread using it
+
+            Args:
+                datasource_id: str, the id of the data source
+            Return:
+                DataImport, the client of the data source
+        """
+        return DataImport(datasource_id, self.rate_limiter, self.retry_policy, self.account_id, self.property_id)
+
+
+    def _run(self, operation, func, datasource_ids):
+        """
+        Call func(datasource_id) for every data source on the worker pool
+
+            Args:
+                operation: str, name of the operation, recorded in the results
+                func: callable, function taking a data source id
+                datasource_ids: list, the ids of the data sources
+            Return:
+                results: dict, data source id to SourceResult, in the order of datasource_ids
+        """
+        def run(datasource_id):
+            start = time.monotonic()
+            try:
+                result = func(datasource_id)
+            except Exception as err:
+                return SourceResult(datasource_id, operation, time.monotonic() - start, error=err)
+            return SourceResult(datasource_id, operation, time.monotonic() - start, result=result)
+
+        datasource_ids = list(datasource_ids)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(datasource_ids)))) as executor:
+            results = list(executor.map(run, datasource_ids))
+
+        return {result.datasource_id: result for result in results}
+
+
+    def listUploads(self, datasource_ids):
+        """
+        List the uploads of every data source, following pagination
+
+            Args:
+                datasource_ids: list, the ids of the data sources
+            Return:
+                results: dict, data source id to SourceResult whose result is the list of upload resources
+        """
+        return self._run('list', lambda datasource_id: self.dataImport(datasource_id).listUploads(), datasource_ids)
+
+
+    def deleteUploads(self, uploads):
+        """
+        Delete uploads, in batches of `delete_batch_size` ids per call
+
+            Args:
+                uploads: dict, data source id to the list of upload ids to delete. None deletes every upload
+                         of the data source
+            Return:
+                results: dict, data source id to SourceResult whose result is the number of uploads deleted
+        """
+        def delete(datasource_id):
+            data_import = self.dataImport(datasource_id)
+            ids = uploads.get(datasource_id)
+            if ids is None:
+                ids = [upload.get('id') for upload in data_import.listUploads()]
+            data_import.deleteUploads(ids, self.delete_batch_size)
+            return len(ids)
+
+        return self._run('delete', delete, uploads)
+
+
+    def replaceData(self, sources, **kwargs):
+        """
+        Replace the data of every data source: the new data is uploaded first, then the uploads that existed
+        before are deleted once the new upload is COMPLETED, so a failed upload, or one still processed when
+        a `timeout` is reached, leaves the previous data in place
+
+            Args:
+                sources: dict, data source id to the data to upload: a file path, a pandas.DataFrame or an
+                         iterable of CSV rows
+                kwargs: other arguments of DataImport.upload(), e.g. chunk_size or poll_delay
+            Return:
+                results: dict, data source id to SourceResult whose result is a dictionnary with the
+                         'status' of the new upload and the number of previous uploads 'deleted'
+        """
+        def replace(datasource_id):
+            data_import = self.dataImport(datasource_id)
+            previous = [upload.get('id') for upload in data_import.listUploads()]
+            source = sources.get(datasource_id)
+            if isinstance(source, str):
+                status = data_import.upload(file_path=source, **kwargs)
+            else:
+                status = data_import.upload(data=source, **kwargs)
+            data_import.deleteUploads(previous, self.delete_batch_size)
+            return {'status': status, 'deleted': len(previous)}
+
+        return self._run('replace', replace, sources)
@@ -0,0 +1,22 @@
+"""
+Command line tools of the package:
+
+    python -m googleAnalyticUtility backfill --views 1234 5678 --start-date 2019-01-01 --end-date 2019-12-31 \
+        --dimensions ga:date ga:deviceCategory --metrics ga:sessions --output /data/ga/sessions
+"""
+import sys
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != 'backfill':
+        print(__doc__)
+        return 2
+
+    from googleAnalyticUtility._backfill import main as backfill
+
+    return backfill(argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
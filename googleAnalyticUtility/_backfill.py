@@ -0,0 +1,632 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from googleAnalyticUtility._helpers import RateLimiter, RetryPolicy, QuotaExhaustedError, datePayload, \
+    derivePayload
+from googleAnalyticUtility._storage import readJson, writeJson
+
+
+@contextmanager
+def fileLock(path, poll_delay=0.01):
+    """
+    Hold an exclusive lock on `path`.lock, shared by every process, and every machine mounting the same
+    file system. Uses flock where available and an exclusively created lock file otherwise
+    """
+    lock_path = f'{path}.lock'
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    if fcntl is not None:
+        with open(lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return
+
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            time.sleep(poll_delay)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    RateLimiter whose counters are kept in a json file, so the processes of a backfill, on one or several
+    machines, share the same daily quotas and request rates. Each request reserves the next free send slot
+    of its view and of the project under a file lock, then waits for it. It can be pickled and sent to
+    worker processes.
+    """
+
+    PROJECT = '__project__'
+
+    def __init__(self, path, view_rps=10, project_rps=None, view_daily_quota=10000, project_daily_quota=50000):
+        """
+            Args:
+                path: str, path of the json file holding the counters. Created on first use
+                view_rps, project_rps, view_daily_quota, project_daily_quota: see RateLimiter
+        """
+        super(SharedRateLimiter, self).__init__(view_rps, None, view_daily_quota, project_daily_quota)
+        self.path = path
+        self.project_rps = project_rps
+
+
+    def _state(self, day):
+        try:
+            state = readJson(self.path)
+        except (OSError, ValueError):
+            state = dict()
+        if state.get('day') != day:
+            state = {'day': day, 'project': 0, 'views': dict(), 'next': dict()}
+
+        return state
+
+
+    def acquire(self, view_id=None):
+        """
+        Count a request against the shared quotas and block until its send slot
+
+            Args:
+                view_id: str, the view the request is sent for. None for requests not tied to a view
+            Return:
+                waited: float, number of seconds spent waiting
+        """
+        now = time.time()
+        with fileLock(self.path):
+            state = self._state(time.strftime('%Y-%m-%d', time.gmtime(now)))
+            view_count = state['views'].get(view_id, 0) if view_id is not None else 0
+            if self.project_daily_quota is not None and state['project'] >= self.project_daily_quota:
+                raise QuotaExhaustedError(f'Daily project quota of {self.project_daily_quota} requests reached')
+            if view_id is not None and self.view_daily_quota is not None and view_count >= self.view_daily_quota:
+                raise QuotaExhaustedError(f'Daily quota of {self.view_daily_quota} requests reached for view {view_id}')
+            state['project'] += 1
+            if view_id is not None:
+                state['views'][view_id] = view_count + 1
+
+            rates = list()
+            if self.project_rps:
+                rates.append((self.PROJECT, self.project_rps))
+            if view_id is not None and self.view_rps:
+                rates.append((view_id, self.view_rps))
+            slot = max([now] + [state['next'].get(key, 0) for key, _ in rates])
+            for key, rate in rates:
+                state['next'][key] = slot + 1 / rate
+            writeJson(self.path, state)
+
+        waited = max(0, slot - time.time())
+        if waited > 0:
+            time.sleep(waited)
+
+        return waited
+
+
+    def usage(self):
+        with fileLock(self.path):
+            state = self._state(time.strftime('%Y-%m-%d', time.gmtime()))
+        return {'day': state['day'], 'project': state['project'], 'views': state['views']}
+
+
+    def __getstate__(self):
+        return {'path': self.path, 'view_rps': self.view_rps, 'project_rps': self.project_rps,
+                'view_daily_quota': self.view_daily_quota, 'project_daily_quota': self.project_daily_quota}
+
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class WorkUnit(object):
+    """
+    A view and a date range of a backfill, the unit of work given to a worker process
+    """
+
+    __slots__ = ('view_id', 'start_date', 'end_date')
+
+    def __init__(self, view_id, start_date, end_date):
+        self.view_id = str(view_id)
+        self.start_date = start_date
+        self.end_date = end_date
+
+
+    @property
+    def date(self):
+        """
+        Name of the date partition of the unit, as written by GetGAData.writeParquet
+        """
+        return self.start_date if self.start_date == self.end_date else f'{self.start_date}_{self.end_date}'
+
+
+    @property
+    def key(self):
+        return f'{self.view_id}_{self.date}'
+
+
+    def toDict(self):
+        return {'view_id': self.view_id, 'start_date': self.start_date, 'end_date': self.end_date}
+
+
+    def __eq__(self, other):
+        return isinstance(other, WorkUnit) and self.toDict() == other.toDict()
+
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+    def __repr__(self):
+        return f'WorkUnit({self.view_id!r}, {self.start_date!r}, {self.end_date!r})'
+
+
+def workUnits(view_ids, start_date, end_date, days_per_unit=1):
+    """
+    Split views x date range into work units of `days_per_unit` days, the most recent days first
+
+        Args:
+            view_ids: list, the view ids to backfill
+            start_date: str, first day of the backfill
+            end_date: str, last day of the backfill
+            days_per_unit: int, number of days of each unit
+        Return:
+            units: list, WorkUnit objects
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    ranges = list()
+    while end >= start:
+        unit_start = max(start, end - timedelta(days=days_per_unit - 1))
+        ranges.append((unit_start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')))
+        end = unit_start - timedelta(days=1)
+
+    return [WorkUnit(view_id, unit_start, unit_end) for unit_start, unit_end in ranges for view_id in view_ids]
+
+
+class LeaseQueue(object):
+    """
+    Work queue kept in a directory, so processes on several machines mounting it can share a backfill.
+    A unit is a json file moved between the pending/, leased/, done/ and failed/ sub directories; moves are
+    atomic renames, so a unit is leased by a single worker. A lease expires when its file has not been
+    touched for `lease_seconds` seconds, e.g. because its worker died, and the unit is then leased again.
+    """
+
+    STATES = ('pending', 'leased', 'done', 'failed')
+
+    def __init__(self, directory, lease_seconds=600, max_attempts=3):
+        """
+            Args:
+                directory: str, directory of the queue
+                lease_seconds: float, number of seconds without renewal after which a lease expires
+                max_attempts: int, number of failed attempts after which a unit is moved to failed/
+        """
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        for state in self.STATES:
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+
+    def _path(self, state, unit):
+        return os.path.join(self.directory, state, f'{unit.key}.json')
+
+
+    def populate(self, units):
+        """
+        Add units to the queue. Units already in the queue, whatever their state, are left as they are, so
+        every machine of a backfill can populate the queue with the same units
+
+            Args:
+                units: list, WorkUnit objects
+            Return:
+                added: int, number of units added
+        """
+        added = 0
+        for unit in units:
+            if any(os.path.exists(self._path(state, unit)) for state in self.STATES):
+                continue
+            path = self._path('pending', unit)
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(unit.toDict(), attempts=0), f)
+            added += 1
+
+        return added
+
+
+    def _reclaimExpired(self):
+        """
+        Move the units whose lease expired back to pending/
+        """
+        directory = os.path.join(self.directory, 'leased')
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                expired = time.time() - os.path.getmtime(path) > self.lease_seconds
+                if expired:
+                    os.rename(path, os.path.join(self.directory, 'pending', name))
+            except OSError:
+                pass
+
+
+    def lease(self):
+        """
+        Lease a pending unit
+
+            Return:
+                unit: WorkUnit, the leased unit, or None when no unit is pending
+        """
+        self._reclaimExpired()
+        directory = os.path.join(self.directory, 'pending')
+        for name in sorted(os.listdir(directory)):
+            target = os.path.join(self.directory, 'leased', name)
+            try:
+                os.rename(os.path.join(directory, name), target)
+            except OSError:
+                continue
+            os.utime(target)
+            item = readJson(target)
+            return WorkUnit(item.get('view_id'), item.get('start_date'), item.get('end_date'))
+
+        return None
+
+
+    def renew(self, unit):
+        """
+        Extend the lease of a unit
+        """
+        os.utime(self._path('leased', unit))
+
+
+    @contextmanager
+    def holding(self, unit):
+        """
+        Renew the lease of a unit in a background thread while the block of a with statement runs
+        """
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.renew(unit)
+                except OSError:
+                    return
+
+        thread = threading.Thread(target=renew, daemon=True)
+        thread.start()
+        try:
+            yield unit
+        finally:
+            stop.set()
+            thread.join()
+
+
+    def _move(self, unit, state):
+        """
+        Move a leased unit to another state. Return False when the lease expired and the unit was reclaimed
+        by another worker in the meantime
+        """
+        try:
+            os.rename(self._path('leased', unit), self._path(state, unit))
+        except FileNotFoundError:
+            return False
+        return True
+
+
+    def complete(self, unit):
+        """
+        Move a leased unit to done/
+
+            Return:
+                bool, False if the lease was lost to another worker
+        """
+        return self._move(unit, 'done')
+
+
+    def release(self, unit):
+        """
+        Give a leased unit back to pending/ without counting an attempt, e.g. when it could not run because a
+        quota is exhausted
+
+            Return:
+                bool, False if the lease was lost to another worker
+        """
+        return self._move(unit, 'pending')
+
+
+    def fail(self, unit, error):
+        """
+        Give a unit back to the queue after a failed attempt, or move it to failed/ after max_attempts
+
+            Return:
+                bool, False if the lease was lost to another worker
+        """
+        # take the lease file out of leased/ first, so it cannot be reclaimed while it is updated
+        path = os.path.join(self.directory, f'.{unit.key}.{os.getpid()}.{threading.get_ident()}.json')
+        try:
+            os.rename(self._path('leased', unit), path)
+        except FileNotFoundError:
+            return False
+        item = readJson(path)
+        item.update({'attempts': item.get('attempts', 0) + 1, 'error': repr(error)})
+        writeJson(path, item)
+        state = 'failed' if item.get('attempts') >= self.max_attempts else 'pending'
+        os.replace(path, self._path(state, unit))
+
+        return True
+
+
+    def counts(self):
+        """
+        Return the number of units in each state
+        """
+        return {state: len([name for name in os.listdir(os.path.join(self.directory, state))
+                            if name.endswith('.json')]) for state in self.STATES}
+
+
+def runUnit(task):
+    """
+    Fetch a work unit into its own partition of the output dataset. Runs in a worker process: the
+    partition is written to a temporary directory and then moved into place, so a unit run twice, or
+    interrupted, never leaves partial data in the dataset
+
+        Args:
+            task: dict, the unit and the settings of the runner
+        Return:
+            result: dict, the unit key, the number of rows written and the seconds spent
+    """
+    from googleAnalyticUtility.Analytics import GetGAData
+
+    unit = task.get('unit')
+    output = task.get('output')
+    start = time.perf_counter()
+    analytics = GetGAData(unit.start_date, unit.end_date, rate_limiter=task.get('rate_limiter'),
+                          retry_policy=task.get('retry_policy'), service_factory=task.get('service_factory'))
+    payload = datePayload(derivePayload(task.get('payload'), viewId=unit.view_id), unit.start_date, unit.end_date)
+
+    tmp_root = os.path.join(output, '_tmp')
+    os.makedirs(tmp_root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f'{unit.key}-', dir=tmp_root)
+    try:
+        rows = analytics.writeParquet(payload, tmp_dir, batch=True, verbose=False, compression=task.get('compression'))
+        source = os.path.join(tmp_dir, f'view_id={unit.view_id}', f'date={unit.date}')
+        target = os.path.join(output, f'view_id={unit.view_id}', f'date={unit.date}')
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        if rows:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(source, target)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return {'unit': unit.key, 'rows': rows, 'seconds': time.perf_counter() - start}
+
+
+def runQueue(task):
+    """
+    Lease and run units from a LeaseQueue until none is pending. Runs in a worker process
+
+        Args:
+            task: dict, the settings of the runner and the queue
+        Return:
+            results: list, a result dict per unit attempted, with an `error` key for failed attempts
+    """
+    queue = LeaseQueue(task.get('queue_dir'), task.get('lease_seconds'), task.get('max_attempts'))
+    results = list()
+    while True:
+        unit = queue.lease()
+        if unit is None:
+            return results
+        try:
+            with queue.holding(unit):
+                result = runUnit(dict(task, unit=unit))
+        except QuotaExhaustedError as err:
+            # the daily budget is spent: give the unit back for the next run, attempts untouched, and stop
+            queue.release(unit)
+            results.append({'unit': unit.key, 'rows': 0, 'error': repr(err)})
+            return results
+        except Exception as err:
+            queue.fail(unit, err)
+            results.append({'unit': unit.key, 'rows': 0, 'error': repr(err)})
+        else:
+            queue.complete(unit)
+            results.append(result)
+
+
+class BackfillRunner(object):
+    """
+    Run a backfill of a request over many views and a long date range on a pool of processes. The views x
+    dates are split into work units; each unit is fetched by a worker process and written to its own
+    view_id=<view id>/date=<date> partition of a single parquet dataset at `output`.
+
+    Without `queue_dir`, the units of this runner are spread over its processes, and units already in the
+    dataset are skipped. With `queue_dir`, units go through a LeaseQueue and runners started on several
+    machines with the same arguments share the work. Pass a SharedRateLimiter to keep every process under
+    the same quotas.
+    """
+
+    def __init__(self, payload, view_ids, start_date, end_date, output, days_per_unit=1, processes=4,
+                 queue_dir=None, lease_seconds=600, max_attempts=3, rate_limiter=None, retry_policy=None,
+                 service_factory=None, compression='zstd'):
+        """
+            Args:
+                payload: dict, payload as returned by GetGAData.formatPayload. Its view and dates are replaced
+                         by the ones of each unit
+                view_ids: list, the view ids to backfill
+                start_date: str, first day of the backfill
+                end_date: str, last day of the backfill
+                output: str, root directory of the output parquet dataset
+                days_per_unit: int, number of days of each work unit
+                processes: int, number of worker processes
+                queue_dir: str, optional directory of a LeaseQueue shared between machines
+                lease_seconds: float, see LeaseQueue
+                max_attempts: int, see LeaseQueue
+                rate_limiter: SharedRateLimiter, optional limiter shared by every process. A plain RateLimiter
+                              cannot be sent to the worker processes and raises a ValueError
+                retry_policy: RetryPolicy, policy used by each process. Default to RetryPolicy()
+                service_factory: callable, optional picklable function returning the report service of a
+                                 worker. Default to the service built from the environment variables
+                compression: str, parquet compression codec
+        """
+        if rate_limiter is not None and not isinstance(rate_limiter, SharedRateLimiter):
+            raise ValueError(f'the worker processes cannot share a {type(rate_limiter).__name__}, pass a '
+                             f'SharedRateLimiter')
+
+        self.payload = payload
+        self.view_ids = [str(view_id) for view_id in view_ids]
+        self.start_date = start_date
+        self.end_date = end_date
+        self.output = output
+        self.days_per_unit = days_per_unit
+        self.processes = processes
+        self.queue_dir = queue_dir
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.service_factory = service_factory
+        self.compression = compression
+
+
+    def units(self):
+        """
+        Return the work units of the backfill
+        """
+        return workUnits(self.view_ids, self.start_date, self.end_date, self.days_per_unit)
+
+
+    def _task(self):
+        return {'payload': self.payload, 'output': self.output, 'rate_limiter': self.rate_limiter,
+                'retry_policy': self.retry_policy, 'service_factory': self.service_factory,
+                'compression': self.compression, 'queue_dir': self.queue_dir,
+                'lease_seconds': self.lease_seconds, 'max_attempts': self.max_attempts}
+
+
+    def run(self, verbose=True):
+        """
+        Run the backfill
+
+            Args:
+                verbose: bool, print each unit as it completes
+            Return:
+                summary: dict, number of units done and rows written, the failed units with their error and
+                         the seconds spent. With a queue, also the number of units in each queue state
+        """
+        start = time.perf_counter()
+        task = self._task()
+        results = list()
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            if self.queue_dir is not None:
+                LeaseQueue(self.queue_dir, self.lease_seconds, self.max_attempts).populate(self.units())
+                for worker_results in executor.map(runQueue, [task] * self.processes):
+                    results.extend(worker_results)
+            else:
+                units = [unit for unit in self.units() if not os.path.exists(
+                    os.path.join(self.output, f'view_id={unit.view_id}', f'date={unit.date}'))]
+                futures = {unit.key: executor.submit(runUnit, dict(task, unit=unit)) for unit in units}
+                for key, future in futures.items():
+                    try:
+                        results.append(future.result())
+                    except Exception as err:
+                        results.append({'unit': key, 'rows': 0, 'error': repr(err)})
+                    if verbose:
+                        print(f'{key}: {results[-1].get("error") or results[-1].get("rows")}')
+
+        if verbose and self.queue_dir is not None:
+            for result in results:
+                print(f'{result.get("unit")}: {result.get("error") or result.get("rows")}')
+        summary = {'done': len([r for r in results if 'error' not in r]),
+                   'rows': sum(r.get('rows') for r in results),
+                   'failed': {r.get('unit'): r.get('error') for r in results if 'error' in r},
+                   'seconds': time.perf_counter() - start}
+        if self.queue_dir is not None:
+            summary['queue'] = LeaseQueue(self.queue_dir, self.lease_seconds, self.max_attempts).counts()
+
+        return summary
+
+
+    def toFrame(self, columns=None):
+        """
+        Read the output dataset into a single dataframe. The partitions add the view_id and date columns
+
+            Args:
+                columns: list, optional names of the columns to read
+            Return:
+                df: pandas.DataFrame, the rows of every unit
+        """
+        import pandas as pd
+
+        return pd.read_parquet(self.output, columns=columns)
+
+
+def main(argv=None):
+    """
+    Command line entry point, see `python -m googleAnalyticUtility backfill --help`
+    """
+    from googleAnalyticUtility._spec import compileSpec, PAGE_SIZE
+
+    parser = argparse.ArgumentParser(prog='googleAnalyticUtility backfill',
+                                     description='Backfill a report over views x dates with a pool of processes '
+                                                 'into a parquet dataset partitioned by view and date')
+    parser.add_argument('--views', nargs='+', required=True, help='view ids to backfill')
+    parser.add_argument('--start-date', required=True)
+    parser.add_argument('--end-date', required=True)
+    parser.add_argument('--output', required=True, help='root directory of the parquet dataset')
+    parser.add_argument('--dimensions', nargs='*', default=[])
+    parser.add_argument('--metrics', nargs='+', help='metrics of the report, unless --payload is given')
+    parser.add_argument('--payload', help='json file of a payload, instead of --dimensions and --metrics')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    parser.add_argument('--days-per-unit', type=int, default=1)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--queue-dir', help='directory of a work queue shared with runners on other machines')
+    parser.add_argument('--lease-seconds', type=float, default=600)
+    parser.add_argument('--max-attempts', type=int, default=3)
+    parser.add_argument('--quota-file', help='json file holding the quota counters shared by every process')
+    parser.add_argument('--view-rps', type=float, default=10)
+    parser.add_argument('--project-rps', type=float, default=None)
+    parser.add_argument('--view-daily-quota', type=int, default=10000)
+    parser.add_argument('--project-daily-quota', type=int, default=50000)
+    parser.add_argument('--compression', default='zstd')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.payload is not None:
+        payload = readJson(args.payload)
+    elif args.metrics:
+        payload = compileSpec(args.views[0], args.dimensions, args.metrics, args.start_date, args.end_date,
+                              page_size=args.page_size).payload()
+    else:
+        parser.error('either --metrics or --payload is required')
+
+    rate_limiter = None
+    if args.quota_file is not None:
+        rate_limiter = SharedRateLimiter(args.quota_file, args.view_rps, args.project_rps, args.view_daily_quota,
+                                         args.project_daily_quota)
+    runner = BackfillRunner(payload, args.views, args.start_date, args.end_date, args.output,
+                            days_per_unit=args.days_per_unit, processes=args.processes, queue_dir=args.queue_dir,
+                            lease_seconds=args.lease_seconds, max_attempts=args.max_attempts,
+                            rate_limiter=rate_limiter, compression=args.compression)
+    summary = runner.run(verbose=not args.quiet)
+    print(json.dumps(dict(summary, host=socket.gethostname())))
+
+    return 1 if summary.get('failed') else 0
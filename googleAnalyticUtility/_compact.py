@@ -0,0 +1,191 @@
+from collections import deque
+import os
+import shutil
+import tempfile
+import threading
+
+from googleAnalyticUtility._convert import METRIC_DTYPES, reportHeaders, concatFrames
+from googleAnalyticUtility._metrics import INSTRUMENTATION
+
+
+class _Table(object):
+    """
+    Columns of the reports sharing one set of column headers. Every column is a list of chunks, one per
+    appended report: dictionary codes for the dimensions and the metrics without a numeric type, typed
+    values for the other metrics. `dictionaries` maps the values of an encoded column to their code.
+    """
+
+    def __init__(self, dimensions, metrics):
+        self.dimensions = dimensions
+        self.metrics = metrics
+        self.dtypes = [None] * len(dimensions) + [METRIC_DTYPES.get(metric_type) for _, metric_type in metrics]
+        self.dictionaries = [dict() if dtype is None else None for dtype in self.dtypes]
+        self.chunks = [list() for _ in self.dtypes]
+        self.rows = 0
+
+
+class CompactStore(object):
+    """
+    Compact in-memory representation of report pages. Dimensions are dictionary encoded, each distinct value
+    is kept once and rows only hold an int32 code, and metrics are kept in numpy arrays of their GA type
+    (strings for types without a numeric dtype are dictionary encoded like dimensions). Once the arrays
+    go over `memory_limit` bytes, the oldest ones are spilled to files in `spill_dir` and memory mapped, so
+    a backfill bigger than the RAM of the worker can still be held and converted to a frame.
+    """
+
+    def __init__(self, memory_limit=256 * 1024 ** 2, spill_dir=None):
+        """
+            Args:
+                memory_limit: int, number of bytes of arrays kept in memory before spilling to disk. None to
+                              never spill
+                spill_dir: str, directory where the spill files are written. Default to the temp directory
+        """
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.rows = 0
+        self.memory_bytes = 0
+        self.spilled_bytes = 0
+        self._tables = dict()
+        self._in_memory = deque()
+        self._directory = None
+        self._files = 0
+        self._lock = threading.Lock()
+
+
+    def append(self, page):
+        """
+        Add the reports of a page to the store
+
+            Args:
+                page: dict, an API response with a 'reports' key, as yielded by GetGAData.iterData
+        """
+        for report in page.get('reports'):
+            self.appendReport(report)
+
+
+    def extend(self, pages):
+        """
+        Add the reports of several pages to the store
+
+            Args:
+                pages: iterable, API responses, as returned by GetGAData.getData
+        """
+        for page in pages:
+            self.append(page)
+
+
+    def appendReport(self, report):
+        """
+        Encode the rows of a report and add them to the table of its column headers
+
+            Args:
+                report: dict, a report returned by the reporting API
+        """
+        import numpy as np
+
+        rows = (report.get('data') or {}).get('rows') or []
+        headers = reportHeaders(report)
+        with self._lock:
+            table = self._tables.get(headers)
+            if table is None:
+                table = self._tables[headers] = _Table(*headers)
+            if not rows:
+                return
+
+            columns = list()
+            if table.dimensions:
+                dim_rows = [row.get('dimensions') for row in rows]
+                columns += [[dims[i] for dims in dim_rows] for i in range(len(table.dimensions))]
+            if table.metrics:
+                met_rows = [row.get('metrics')[0].get('values') for row in rows]
+                columns += [[mets[i] for mets in met_rows] for i in range(len(table.metrics))]
+
+            chunks = list()
+            for column, dtype, dictionary in zip(columns, table.dtypes, table.dictionaries):
+                if dictionary is None:
+                    chunks.append(np.array(column, dtype=dtype))
+                else:
+                    chunks.append(np.array([dictionary.setdefault(value, len(dictionary)) for value in column],
+                                           dtype=np.int32))
+
+            for column, chunk in zip(table.chunks, chunks):
+                column.append(chunk)
+                self._in_memory.append((column, len(column) - 1))
+                self.memory_bytes += chunk.nbytes
+            table.rows += len(rows)
+            self.rows += len(rows)
+            self._spill()
+
+
+    def _spill(self):
+        """
+        Move the oldest in-memory arrays to memory mapped files until the store fits in memory_limit
+        """
+        import numpy as np
+
+        if self.memory_limit is None:
+            return
+        while self._in_memory and self.memory_bytes > self.memory_limit:
+            column, index = self._in_memory.popleft()
+            chunk = column[index]
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix='ga-store-', dir=self.spill_dir)
+            path = os.path.join(self._directory, f'chunk-{self._files:08d}.npy')
+            self._files += 1
+            np.save(path, chunk)
+            column[index] = np.load(path, mmap_mode='r')
+            self.memory_bytes -= chunk.nbytes
+            self.spilled_bytes += chunk.nbytes
+
+
+    def toFrame(self):
+        """
+        Build a typed dataframe from the store: dimensions as categoricals and metrics as their GA type.
+        Tables with different headers are concatenated like Management.dataToFrame does
+
+            Return:
+                df: pandas.DataFrame, the rows of every appended report
+        """
+        import numpy as np
+        import pandas as pd
+
+        frames = list()
+        with self._lock, INSTRUMENTATION.span('dataToFrame', typed=True, compact=True) as span:
+            for table in self._tables.values():
+                data = dict()
+                names = list(table.dimensions) + [name for name, _ in table.metrics]
+                for i, (name, dtype, dictionary) in enumerate(zip(names, table.dtypes, table.dictionaries)):
+                    chunks = table.chunks[i]
+                    values = np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype or np.int32)
+                    if dictionary is None:
+                        data[name] = values
+                    elif i < len(table.dimensions):
+                        data[name] = pd.Categorical.from_codes(values, categories=list(dictionary))
+                    else:
+                        data[name] = np.array(list(dictionary), dtype=object)[values]
+                frames.append(pd.DataFrame(data))
+            df = concatFrames(frames, typed=True)
+            span.set(rows=len(df))
+
+        return df
+
+
+    def close(self):
+        """
+        Drop the data of the store and remove its spill files
+        """
+        with self._lock:
+            self._tables = dict()
+            self._in_memory = deque()
+            self.rows = self.memory_bytes = self.spilled_bytes = 0
+            if self._directory is not None:
+                shutil.rmtree(self._directory, ignore_errors=True)
+                self._directory = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,287 @@
+from googleAnalyticUtility._metrics import INSTRUMENTATION
+
+
+METRIC_DTYPES = {
+    'INTEGER': 'int64',
+    'FLOAT': 'float64',
+    'PERCENT': 'float64',
+    'TIME': 'float64',
+    'CURRENCY': 'float64',
+}
+
+
+def reportHeaders(report):
+    """
+    Read the column headers of a report
+
+        Args:
+            report: dict, a report returned by the reporting API
+        Return:
+            dimensions: tuple, names of the dimensions
+            metrics: tuple, (name, type) pairs of the metrics
+    """
+    column_header = report.get('columnHeader')
+    dimensions = tuple(column_header.get('dimensions') or ())
+    entries = column_header.get('metricHeader', {}).get('metricHeaderEntries') or ()
+    metrics = tuple((entry.get('name'), entry.get('type')) for entry in entries)
+
+    return dimensions, metrics
+
+
+def reportsToColumns(reports, typed=True, columns=None):
+    """
+    Convert reports sharing the same headers into columns. Columns are filled one report at a time,
+    column by column, without building intermediate frames. Typed metric columns are preallocated for the
+    total number of rows.
+
+        Args:
+            reports: list, reports returned by the reporting API, all with the same column headers
+            typed: bool, True to cast metrics to the numpy type given by their metric header and to store
+                   dimensions as categoricals. False keeps every value as a string
+            columns: list, optional names of the columns to keep. Other columns are not read at all
+        Return:
+            columns: dict, column name to list, numpy array or pandas.Categorical
+    """
+    import numpy as np
+    import pandas as pd
+
+    dimensions, metrics = reportHeaders(reports[0])
+    dim_index = [i for i, name in enumerate(dimensions) if columns is None or name in columns]
+    met_index = [i for i, (name, _) in enumerate(metrics) if columns is None or name in columns]
+    dimensions = [dimensions[i] for i in dim_index]
+    metrics = [metrics[i] for i in met_index]
+    row_lists = [(report.get('data') or {}).get('rows') or [] for report in reports]
+    n_rows = sum(len(rows) for rows in row_lists)
+
+    # strings are gathered in lists, which extend faster than object arrays are filled, while typed
+    # metrics are parsed into preallocated numpy arrays
+    dim_values = [list() for _ in dimensions]
+    met_values = list()
+    for _, metric_type in metrics:
+        dtype = METRIC_DTYPES.get(metric_type) if typed else None
+        met_values.append(np.empty(n_rows, dtype=dtype) if dtype is not None else list())
+
+    position = 0
+    for rows in row_lists:
+        size = len(rows)
+        if size == 0:
+            continue
+        end = position + size
+
+        # columns are gathered with one comprehension per column: transposing with zip(*rows) creates an
+        # iterator per row, which triggers garbage collections over the whole response
+        if dimensions:
+            dim_rows = [row.get('dimensions') for row in rows]
+            for i, values in zip(dim_index, dim_values):
+                values.extend([dims[i] for dims in dim_rows])
+        if metrics:
+            met_rows = [row.get('metrics')[0].get('values') for row in rows]
+            for i, target in zip(met_index, met_values):
+                column = [mets[i] for mets in met_rows]
+                if isinstance(target, list):
+                    target.extend(column)
+                else:
+                    target[position:end] = np.array(column, dtype=target.dtype)
+
+        position = end
+
+    data = dict()
+    for name, values in zip(dimensions, dim_values):
+        data[name] = pd.Categorical(values) if typed else values
+    for (name, _), values in zip(metrics, met_values):
+        data[name] = values
+
+    return data
+
+
+def reportsToFrame(reports, typed=True):
+    """
+    Convert a list of reports into a single dataframe. Reports are grouped by column headers so requests
+    with different dimensions or metrics end up in the same frame, like pandas.concat would do.
+
+        Args:
+            reports: list, reports returned by the reporting API
+            typed: bool, see reportsToColumns
+        Return:
+            df: pandas.DataFrame, the rows of every report
+    """
+    import pandas as pd
+
+    with INSTRUMENTATION.span('dataToFrame', typed=typed, pages=len(reports)) as span:
+        groups = dict()
+        for report in reports:
+            groups.setdefault(reportHeaders(report), list()).append(report)
+
+        frames = [pd.DataFrame(reportsToColumns(group, typed)) for group in groups.values()]
+        if not frames:
+            df = pd.DataFrame()
+        elif len(frames) == 1:
+            df = frames[0]
+        else:
+            df = pd.concat(frames, ignore_index=True, sort=False)
+        span.set(rows=len(df))
+
+    return df
+
+
+def pivotToFrame(reports, typed=True, pivot=0):
+    """
+    Convert the pivot columns of reports into a long dataframe, with one row per report row and pivot
+    group: the row dimensions, then the pivot dimensions, then one column per pivot metric. Groups differ
+    from one report to the other, so each report is reshaped on its own pivot headers.
+
+        Args:
+            reports: list, reports of a request with pivots
+            typed: bool, see reportsToColumns
+            pivot: int, index of the pivot of the request to convert
+        Return:
+            df: pandas.DataFrame, the pivot values in long format
+    """
+    import numpy as np
+    import pandas as pd
+
+    frames = list()
+    for report in reports:
+        dimensions, _ = reportHeaders(report)
+        pivot_headers = report.get('columnHeader').get('metricHeader', {}).get('pivotHeaders') or []
+        if pivot >= len(pivot_headers):
+            raise ValueError(f'the report has {len(pivot_headers)} pivots, pivot {pivot} requested')
+        entries = pivot_headers[pivot].get('pivotHeaderEntries') or []
+        rows = (report.get('data') or {}).get('rows') or []
+        if not entries:
+            continue
+
+        # entries list every (group, metric) pair: the group is the values of the pivot dimensions
+        pivot_dimensions = entries[0].get('dimensionNames') or []
+        groups, metrics, index = dict(), dict(), dict()
+        for position, entry in enumerate(entries):
+            group = groups.setdefault(tuple(entry.get('dimensionValues') or ()), len(groups))
+            metric = entry.get('metric')
+            metrics.setdefault(metric.get('name'), metric.get('type'))
+            index[group, metric.get('name')] = position
+
+        n_groups = len(groups)
+        values = np.array([row.get('metrics')[0].get('pivotValueRegions')[pivot].get('values') for row in rows],
+                          dtype=object).reshape(len(rows), len(entries))
+        data = dict()
+        dim_rows = [row.get('dimensions') for row in rows]
+        for i, name in enumerate(dimensions):
+            data[name] = np.repeat(np.array([dims[i] for dims in dim_rows], dtype=object), n_groups)
+        group_values = np.array(list(groups), dtype=object).reshape(n_groups, len(pivot_dimensions))
+        for i, name in enumerate(pivot_dimensions):
+            data[name] = np.tile(group_values[:, i], len(rows))
+        for name, metric_type in metrics.items():
+            positions = [index.get((group, name), -1) for group in range(n_groups)]
+            column = np.where(np.array(positions) >= 0, values[:, positions], None).reshape(-1) \
+                if len(rows) else np.empty(0, dtype=object)
+            dtype = METRIC_DTYPES.get(metric_type) if typed else None
+            data[name] = column.astype(dtype) if dtype is not None and None not in column else column
+
+        df = pd.DataFrame(data)
+        if typed:
+            for name in list(dimensions) + list(pivot_dimensions):
+                df[name] = pd.Categorical(df[name])
+        frames.append(df)
+
+    return concatFrames(frames, typed)
+
+
+def concatFrames(frames, typed=True):
+    """
+    Concatenate the frames of several pages. Categorical columns are kept categorical even when the
+    pages have different categories.
+
+        Args:
+            frames: list, dataframes in order
+            typed: bool, True if the frames were built with typed=True
+        Return:
+            df: pandas.DataFrame, the concatenated frame
+    """
+    import pandas as pd
+
+    frames = [frame for frame in frames if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+
+    categorical = set()
+    if typed:
+        for frame in frames:
+            categorical.update(name for name, dtype in frame.dtypes.items()
+                               if isinstance(dtype, pd.CategoricalDtype))
+    df = pd.concat(frames, ignore_index=True, sort=False)
+    for name in categorical:
+        if not isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype('category')
+
+    return df
+
+
+def pipelinedFrame(pages, typed=True, converters=2, queue_size=4):
+    """
+    Convert pages to a dataframe while they are being fetched. A producer thread pulls pages from `pages`
+    (typically a generator sending the API requests) into a bounded queue, and a pool of converter threads
+    turns each page into a frame as soon as it is available. When the converters fall behind, the queue
+    fills up and the producer waits, so at most about `queue_size + converters` pages are held in memory.
+
+        Args:
+            pages: iterable, the pages to convert, each a dictionnary with a 'reports' key
+            typed: bool, see reportsToColumns
+            converters: int, number of converter threads
+            queue_size: int, maximum number of fetched pages waiting to be converted
+        Return:
+            df: pandas.DataFrame, the rows of every page, in order
+    """
+    import queue
+    import threading
+
+    pending = queue.Queue(maxsize=queue_size)
+    frames = dict()
+    errors = list()
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for index, page in enumerate(pages):
+                while not stop.is_set():
+                    try:
+                        pending.put((index, page), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except BaseException as err:
+            errors.append(err)
+        finally:
+            for _ in range(converters):
+                pending.put(done)
+
+    def convert():
+        while True:
+            item = pending.get()
+            if item is done:
+                return
+            if stop.is_set():
+                continue
+            index, page = item
+            try:
+                frames[index] = reportsToFrame(page.get('reports'), typed)
+            except BaseException as err:
+                errors.append(err)
+                stop.set()
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=convert, daemon=True) for _ in range(converters)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return concatFrames([frames[index] for index in sorted(frames)], typed)
+
@@ -0,0 +1,223 @@
+import os
+import tempfile
+
+from googleAnalyticUtility._convert import concatFrames
+from googleAnalyticUtility._storage import requestSignature
+
+
+def hashRows(df, columns):
+    """
+    Hash the values of some columns of each row into a uint64. Categorical columns hash like the values
+    they hold, so frames with different categories can be compared
+
+        Args:
+            df: pandas.DataFrame, the frame
+            columns: list, names of the hashed columns
+        Return:
+            hashes: numpy.ndarray, one uint64 per row
+    """
+    import numpy as np
+    import pandas as pd
+
+    if not columns:
+        return np.zeros(len(df), dtype=np.uint64)
+    return pd.util.hash_pandas_object(df[list(columns)], index=False).to_numpy()
+
+
+class FrameDiff(object):
+    """
+    Changes between two pulls of a report, keyed on its dimensions: `inserts` are the rows of new keys,
+    `updates` the new version of rows whose metrics changed and `deletes` the old rows whose key is gone.
+    """
+
+    def __init__(self, inserts, updates, deletes, key_columns):
+        self.inserts = inserts
+        self.updates = updates
+        self.deletes = deletes
+        self.key_columns = list(key_columns)
+
+
+    @property
+    def empty(self):
+        return not (len(self.inserts) or len(self.updates) or len(self.deletes))
+
+
+    def counts(self):
+        return {'inserts': len(self.inserts), 'updates': len(self.updates), 'deletes': len(self.deletes)}
+
+
+    def changes(self, op_column='op'):
+        """
+        Return every change in one frame, with an `op_column` set to 'insert', 'update' or 'delete', ready to
+        be upserted into a warehouse
+
+            Args:
+                op_column: str, name of the operation column
+            Return:
+                df: pandas.DataFrame, the inserts, updates and deletes
+        """
+        frames = list()
+        for op, frame in (('insert', self.inserts), ('update', self.updates), ('delete', self.deletes)):
+            if len(frame):
+                frames.append(frame.assign(**{op_column: op}))
+        if not frames:
+            return self.inserts.assign(**{op_column: []})
+
+        return concatFrames(frames).reset_index(drop=True)
+
+
+    def apply(self, old):
+        """
+        Apply the changes to the old frame
+
+            Args:
+                old: pandas.DataFrame, the frame the diff was computed from
+            Return:
+                df: pandas.DataFrame, the old rows left unchanged followed by the updated and inserted rows
+        """
+        import numpy as np
+        import pandas as pd
+
+        changed = np.concatenate([hashRows(self.updates, self.key_columns),
+                                  hashRows(self.deletes, self.key_columns)])
+        kept = old[~pd.Index(hashRows(old, self.key_columns)).isin(changed)]
+
+        return concatFrames([kept, self.updates, self.inserts]).reset_index(drop=True)
+
+
+    def __repr__(self):
+        return f'FrameDiff({self.counts()})'
+
+
+def diffFrames(old, new, key_columns, scope_column=None):
+    """
+    Compare two pulls of the same report. Rows are matched on the hash of their key columns and their
+    values are compared through the hash of the other columns, so the comparison is vectorized whatever
+    the size of the frames. Keys are 64 bit hashes: a collision between two keys is possible but
+    vanishingly unlikely.
+
+        Args:
+            old: pandas.DataFrame, the previous pull, e.g. as returned by Management.dataToFrame
+            new: pandas.DataFrame, the new pull, with the same columns
+            key_columns: list, the columns identifying a row, usually the dimensions of the request
+            scope_column: str, optional column restricting the comparison to the old rows whose value of that
+                          column appears in the new pull. Use 'ga:date' when the new pull only covers some days
+        Return:
+            diff: FrameDiff, the inserts, updates and deletes turning old into new
+    """
+    import pandas as pd
+
+    if set(old.columns) != set(new.columns) and len(old.columns):
+        raise ValueError(f'the frames have different columns: {sorted(set(old.columns) ^ set(new.columns))}')
+    key_columns = list(key_columns)
+    value_columns = [name for name in new.columns if name not in key_columns]
+    if scope_column is not None and len(old):
+        old = old[pd.Index(hashRows(old, [scope_column])).isin(hashRows(new, [scope_column]))]
+    if not len(old.columns):
+        old = new.iloc[:0]
+
+    # keys are matched through the hash tables of pandas indexes, much faster than sorting them
+    old_keys = pd.Index(hashRows(old, key_columns))
+    new_keys = pd.Index(hashRows(new, key_columns))
+    for name, keys in (('old', old_keys), ('new', new_keys)):
+        if not keys.is_unique:
+            raise ValueError(f'the {name} frame has duplicate keys, add the missing dimensions to key_columns')
+
+    old_positions = old_keys.get_indexer(new_keys)
+    in_old = old_positions >= 0
+    in_new = new_keys.get_indexer(old_keys) >= 0
+    new_positions = in_old.nonzero()[0]
+    old_positions = old_positions[in_old]
+    changed = hashRows(old, value_columns)[old_positions] != hashRows(new, value_columns)[new_positions]
+
+    return FrameDiff(inserts=new[~in_old], updates=new.iloc[new_positions[changed]], deletes=old[~in_new],
+                     key_columns=key_columns)
+
+
+class ChangeTracker(object):
+    """
+    Keep the last pull of each request to turn new pulls into changes. Frames are stored per view and
+    request signature, so every date range and page of a request share one frame:
+        <directory>/<view id>/<request signature>.pkl
+    """
+
+    def __init__(self, directory):
+        """
+            Args:
+                directory: str, directory where the last pull of each request is stored
+        """
+        self.directory = directory
+
+
+    def path(self, payload):
+        request = payload.get('reportRequests')[0]
+        return os.path.join(self.directory, str(request.get('viewId')), f'{requestSignature(payload)}.pkl')
+
+
+    @staticmethod
+    def keyColumns(payload):
+        """
+        Return the dimensions of the requests of a payload, the key of their rows
+        """
+        columns = list()
+        for request in payload.get('reportRequests'):
+            for dimension in request.get('dimensions') or []:
+                if dimension.get('name') not in columns:
+                    columns.append(dimension.get('name'))
+        return columns
+
+
+    def load(self, payload):
+        """
+        Return the stored frame of a request, None if it was never committed
+        """
+        import pandas as pd
+
+        path = self.path(payload)
+        if not os.path.exists(path):
+            return None
+        return pd.read_pickle(path)
+
+
+    def diff(self, payload, df, scope_column=None, commit=True):
+        """
+        Compare a new pull of a request with the stored one. The first pull of a request is all inserts
+
+            Args:
+                payload: dict, the payload the frame was fetched with
+                df: pandas.DataFrame, the new pull, e.g. Management.dataToFrame(analytics.getData(payload))
+                scope_column: str, see diffFrames. With 'ga:date', the stored days missing from df are kept
+                commit: bool, True to store the result of the changes right away. With False, call commit()
+                        once the changes are applied downstream
+            Return:
+                diff: FrameDiff, the changes since the stored pull
+        """
+        import pandas as pd
+
+        old = self.load(payload)
+        diff = diffFrames(old if old is not None else pd.DataFrame(), df, self.keyColumns(payload), scope_column)
+        if commit:
+            self.commit(payload, diff.apply(old) if old is not None else df)
+
+        return diff
+
+
+    def commit(self, payload, df):
+        """
+        Store a frame as the last pull of a request
+
+            Args:
+                payload: dict, the payload of the request
+                df: pandas.DataFrame, the frame to store, e.g. diff.apply(tracker.load(payload))
+        """
+        path = self.path(payload)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            df.to_pickle(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
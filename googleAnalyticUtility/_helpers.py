@@ -1,15 +1,163 @@
-from oauth2client.service_account import ServiceAccountCredentials
-from apiclient.discovery import build
+from googleapiclient.errors import HttpError
 from datetime import datetime, timedelta
+import json
+import random
+import socket
+import threading
 import time
 
 import os
 
+from googleAnalyticUtility._metrics import INSTRUMENTATION, reportRows
+
+
+DISCOVERY_URIS = (
+    'https://www.googleapis.com/discovery/v1/apis/{api}/{apiVersion}/rest',
+    'https://{api}.googleapis.com/$discovery/rest?version={apiVersion}',
+)
+
+
+def discoveryCacheDir():
+    """
+    Return the directory where discovery documents are cached, set through the GA_DISCOVERY_CACHE_DIR
+    environment variable and default to ~/.cache/googleAnalyticUtility
+    """
+    return os.environ.get('GA_DISCOVERY_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'googleAnalyticUtility'))
+
+
+BUNDLED_DISCOVERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'discovery')
+
+
+def discoveryDocument(name, version):
+    """
+    Return the discovery document of an API. Documents are looked up in the local cache, then in the
+    documents bundled with the package (analytics v3 and analyticsreporting v4), and are only downloaded,
+    then cached, when neither has them.
+
+        Args:
+            name: str, name of the API, e.g. analyticsreporting
+            version: str, version of the API, e.g. v4
+        Return:
+            document: dict, the discovery document
+    """
+    path = os.path.join(discoveryCacheDir(), f'{name}.{version}.json')
+    for candidate in (path, os.path.join(BUNDLED_DISCOVERY_DIR, f'{name}.{version}.json')):
+        try:
+            with open(candidate) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    import httplib2
+
+    for uri in DISCOVERY_URIS:
+        resp, content = httplib2.Http().request(uri.format(api=name, apiVersion=version))
+        if resp.status < 400:
+            break
+    else:
+        raise HttpError(resp, content, uri=uri)
+
+    document = json.loads(content.decode('utf-8') if isinstance(content, bytes) else content)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(document, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+    return document
+
+
+class ServiceRegistry(object):
+    """
+    Process wide registry of Google API services. For each (API, version, scopes, key file):
+        - the key file is read and the credentials are created once, so the access token is shared and
+          only refreshed when it expires
+        - the discovery document is loaded once (see discoveryDocument)
+        - each thread gets its own service and HTTP connection, since httplib2 is not thread safe
+    """
+
+    def __init__(self):
+        self._credentials = dict()
+        self._documents = dict()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+
+    def credentials(self, file_path, scopes):
+        from oauth2client.service_account import ServiceAccountCredentials
+
+        key = (file_path, tuple(scopes))
+        with self._lock:
+            credentials = self._credentials.get(key)
+            if credentials is None:
+                credentials = ServiceAccountCredentials.from_json_keyfile_name(file_path, scopes=scopes)
+                self._credentials[key] = credentials
+        return credentials
+
+
+    def document(self, name, version):
+        key = (name, version)
+        with self._lock:
+            document = self._documents.get(key)
+            if document is None:
+                document = discoveryDocument(name, version)
+                self._documents[key] = document
+        return document
+
+
+    def service(self, name, version, scopes, file_path):
+        """
+        Return the service of the calling thread, building it on first use
+
+            Args:
+                name: str, name of the API
+                version: str, version of the API
+                scopes: list, OAuth scopes
+                file_path: str, path of the service account json key file
+            Return:
+                service: googleapiclient.discovery.Resource object, a Google API service object
+        """
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            services = self._local.services = dict()
+
+        key = (name, version, tuple(scopes), file_path)
+        service = services.get(key)
+        if service is None:
+            import httplib2
+            from googleapiclient.discovery import build_from_document
+
+            http = self.credentials(file_path, scopes).authorize(httplib2.Http())
+            service = build_from_document(self.document(name, version), http=http)
+            services[key] = service
+
+        return service
+
+
+    def clear(self):
+        """
+        Forget every credentials, document and service. Services already built by other threads are kept
+        by those threads
+        """
+        with self._lock:
+            self._credentials = dict()
+            self._documents = dict()
+        self._local = threading.local()
+
+
+SERVICES = ServiceRegistry()
+
+
 def managementService():
         """
         v4 API currently does not support the `management()` method, hence, we need to define
         an new service object with the API version set to v3.
-        The value used for this method need to be created through an environment variable
+        The value used for this method need to be created through an environment variable.
+        Services come from the process wide registry: they are built once per thread and share credentials.
         
             Return:
                 service: googleapiclient.discovery.Resource object, a Google API service object v3
@@ -19,19 +167,15 @@ def managementService():
         version = 'v3'
         file_path = os.environ.get('GA_API_CREDS')
 
-        credentials = ServiceAccountCredentials.from_json_keyfile_name(
-            file_path, 
-            scopes=scopes
-        )
-
-        management_service = build(name, version, credentials=credentials)
+        management_service = SERVICES.service(name, version, scopes, file_path)
 
         return management_service
 
 
 def reportService():
         """
-        The value used for this method need to be created through an environment variable
+        The value used for this method need to be created through an environment variable.
+        Services come from the process wide registry: they are built once per thread and share credentials.
 
             Return:
                 service: googleapiclient.discovery.Resource object, a Google API service object
@@ -41,52 +185,624 @@ def reportService():
         version = os.environ.get('GA_API_VERSION')
         file_path = os.environ.get('GA_API_CREDS')
 
-        credentials = ServiceAccountCredentials.from_json_keyfile_name(
-            file_path, 
-            scopes=scopes
-        )
+        service = SERVICES.service(name, version, scopes, file_path)
+
+        return service
 
-        service = build(name, version, credentials=credentials)
 
+def copyService(service):
+    """
+    Build a copy of a service with its own HTTP connection, for a thread other than the one using the
+    service. The copy targets the same discovery document and endpoint and is authorized with the same
+    credentials. Objects that are not googleapiclient services are returned as is
+
+        Args:
+            service: googleapiclient.discovery.Resource object, the service to copy
+        Return:
+            service: googleapiclient.discovery.Resource object, the copy
+    """
+    document = getattr(service, '_rootDesc', None)
+    if document is None:
         return service
 
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import build_http
+
+    http = getattr(service, '_http', None)
+    # google-auth keeps the credentials on the AuthorizedHttp, oauth2client on the wrapped request method
+    if type(http).__name__ == 'AuthorizedHttp':
+        from google_auth_httplib2 import AuthorizedHttp
+        http = AuthorizedHttp(http.credentials, http=build_http())
+    else:
+        credentials = getattr(getattr(http, 'request', None), 'credentials', None)
+        http = credentials.authorize(httplib2.Http()) if credentials is not None else build_http()
+
+    copy = build_from_document(document, http=http)
+    copy._baseUrl = service._baseUrl
+
+    return copy
 
-def iterResponsePages(service, payload, verbose, slow_down):
+
+class QuotaExhaustedError(RuntimeError):
     """
-    iter through the response pages and concat the data from different pages under one 
-    'reports' key dictionnary.
+    Raised when a daily request budget of a RateLimiter has been used up
+    """
+
+
+class UploadError(RuntimeError):
+    """
+    Raised when Google Analytics does not complete the processing of an uploaded file. `status` holds the
+    upload status
+    """
+
+    def __init__(self, status, message=None):
+        super(UploadError, self).__init__(message or f'Upload Failed: {status.get("errors") or status.get("status")}')
+        self.status = status
+
+
+class UploadTimeoutError(UploadError):
+    """
+    Raised when an uploaded file is still PENDING once the wait for its processing timed out
+    """
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket refilled at a constant rate. A bucket allows bursts of up to `capacity`
+    requests and then `rate` requests per second.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+            Args:
+                rate: float, number of tokens added per second
+                capacity: float, maximum number of tokens the bucket can hold. Default to `rate`
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+
+    def acquire(self, tokens=1):
+        """
+        Block until `tokens` tokens are available and consume them
+
+            Args:
+                tokens: float, number of tokens to consume
+            Return:
+                waited: float, number of seconds spent waiting
+        """
+        waited = 0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class RateLimiter(object):
+    """
+    Shared rate limiter enforcing per view and per project request rates as well as daily quotas.
+    A single instance can be passed to any number of GetGAData, Management and DataImport objects,
+    including objects used from several threads.
+    Default values follow the Google Analytics quotas: 10 requests per second per view, 10,000 requests
+    per view per day and 50,000 requests per project per day.
+    """
+
+    def __init__(self, view_rps=10, project_rps=None, view_daily_quota=10000, project_daily_quota=50000):
+        """
+            Args:
+                view_rps: float, maximum number of requests per second for a single view. None to disable
+                project_rps: float, maximum number of requests per second for the whole project. None to disable
+                view_daily_quota: int, maximum number of requests per view per day. None to disable
+                project_daily_quota: int, maximum number of requests per project per day. None to disable
+        """
+        self.view_rps = view_rps
+        self.view_daily_quota = view_daily_quota
+        self.project_daily_quota = project_daily_quota
+        self._project_bucket = TokenBucket(project_rps) if project_rps else None
+        self._view_buckets = dict()
+        self._day = None
+        self._view_counts = dict()
+        self._project_count = 0
+        self._lock = threading.Lock()
+
+
+    def _viewBucket(self, view_id):
+        bucket = self._view_buckets.get(view_id)
+        if bucket is None:
+            bucket = self._view_buckets.setdefault(view_id, TokenBucket(self.view_rps))
+        return bucket
+
+
+    def _consumeQuota(self, view_id):
+        """
+        Count one request against the daily quotas. Counters are reset when the UTC day changes.
+        """
+        with self._lock:
+            day = time.strftime('%Y-%m-%d', time.gmtime())
+            if day != self._day:
+                self._day = day
+                self._view_counts = dict()
+                self._project_count = 0
+
+            view_count = self._view_counts.get(view_id, 0)
+            if self.project_daily_quota is not None and self._project_count >= self.project_daily_quota:
+                raise QuotaExhaustedError(f'Daily project quota of {self.project_daily_quota} requests reached')
+            if view_id is not None and self.view_daily_quota is not None and view_count >= self.view_daily_quota:
+                raise QuotaExhaustedError(f'Daily quota of {self.view_daily_quota} requests reached for view {view_id}')
+
+            self._project_count += 1
+            if view_id is not None:
+                self._view_counts[view_id] = view_count + 1
+
+
+    def acquire(self, view_id=None):
+        """
+        Block until a request can be sent without going over the configured rates
+
+            Args:
+                view_id: str, the view the request is sent for. None for requests not tied to a view
+                         (e.g. management API calls)
+            Return:
+                waited: float, number of seconds spent waiting
+        """
+        self._consumeQuota(view_id)
+        waited = 0
+        if self._project_bucket is not None:
+            waited += self._project_bucket.acquire()
+        if view_id is not None and self.view_rps:
+            with self._lock:
+                bucket = self._viewBucket(view_id)
+            waited += bucket.acquire()
+
+        return waited
+
+
+    def usage(self):
+        """
+        Return the number of requests counted against the daily quotas
+
+            Return:
+                usage: dict, the project count and a count per view
+        """
+        with self._lock:
+            return {'day': self._day, 'project': self._project_count, 'views': dict(self._view_counts)}
+
+
+class RetryPolicy(object):
+    """
+    Retry failed API calls with exponential backoff and jitter. Only transient errors are retried: HTTP
+    status codes listed in `retryable_status`, 403 errors whose reason is in `retryable_reasons` and
+    connection errors. The policy keeps counters of retries and time spent in backoff.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=1, max_delay=64, jitter=True,
+                 retryable_status=(429, 500, 502, 503, 504),
+                 retryable_reasons=('rateLimitExceeded', 'userRateLimitExceeded', 'backendError',
+                                    'internalServerError')):
+        """
+            Args:
+                max_attempts: int, maximum number of attempts, including the first one
+                base_delay: float, delay in seconds before the first retry. The delay doubles on each retry
+                max_delay: float, upper bound of the delay between two attempts
+                jitter: bool, True to draw the delay uniformly between 0 and the exponential delay
+                retryable_status: tuple, HTTP status codes that are retried
+                retryable_reasons: tuple, Google API error reasons that are retried
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retryable_status = tuple(retryable_status)
+        self.retryable_reasons = tuple(retryable_reasons)
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.backoff_seconds = 0.0
+        self._lock = threading.Lock()
+
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def errorReason(err):
+        """
+        Extract the reason of a Google API error
+
+            Args:
+                err: HttpError, the error raised by the API client
+            Return:
+                reason: str, the reason of the first error or None
+        """
+        try:
+            content = err.content.decode('utf-8') if isinstance(err.content, bytes) else err.content
+            errors = json.loads(content).get('error', {}).get('errors', [])
+            return errors[0].get('reason') if errors else None
+        except (ValueError, AttributeError, TypeError):
+            return None
+
+
+    def isRetryable(self, err):
+        """
+        Check if an exception is a transient error worth retrying
+
+            Args:
+                err: Exception, the error raised by the call
+            Return:
+                bool, True if the call should be retried
+        """
+        if isinstance(err, HttpError):
+            status = int(err.resp.status)
+            if status in self.retryable_status:
+                return True
+            return status == 403 and self.errorReason(err) in self.retryable_reasons
+
+        return isinstance(err, (ConnectionError, socket.timeout))
+
+
+    def delay(self, attempt):
+        """
+        Return the delay before the next attempt
+
+            Args:
+                attempt: int, number of attempts already made
+            Return:
+                delay: float, number of seconds to wait
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+    def call(self, func):
+        """
+        Call `func` until it succeeds, raises a non retryable error or `max_attempts` is reached
+
+            Args:
+                func: callable, function taking no argument
+            Return:
+                the value returned by func
+        """
+        attempt = 0
+        with self._lock:
+            self.calls += 1
+        while True:
+            attempt += 1
+            try:
+                return func()
+            except Exception as err:
+                if attempt >= self.max_attempts or not self.isRetryable(err):
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                delay = self.delay(attempt)
+                with self._lock:
+                    self.retries += 1
+                    self.backoff_seconds += delay
+                time.sleep(delay)
+
+
+    async def acall(self, coroutine_function, retryable=()):
+        """
+        Asynchronous counterpart of call(): await `coroutine_function()` until it succeeds, raises a non
+        retryable error or `max_attempts` is reached. Backoff delays do not block the event loop.
+
+            Args:
+                coroutine_function: callable, function taking no argument and returning an awaitable
+                retryable: tuple, extra exception types to retry, e.g. the connection errors of the HTTP client
+            Return:
+                the value returned by the awaitable
+        """
+        import asyncio
+
+        attempt = 0
+        with self._lock:
+            self.calls += 1
+        while True:
+            attempt += 1
+            try:
+                return await coroutine_function()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                transient = self.isRetryable(err) or isinstance(err, tuple(retryable))
+                if attempt >= self.max_attempts or not transient:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                delay = self.delay(attempt)
+                with self._lock:
+                    self.retries += 1
+                    self.backoff_seconds += delay
+                await asyncio.sleep(delay)
+
+
+    def stats(self):
+        """
+        Return the counters of the policy
+
+            Return:
+                stats: dict, number of calls, retries, failures and seconds spent in backoff
+        """
+        with self._lock:
+            return {'calls': self.calls, 'retries': self.retries, 'failures': self.failures,
+                    'backoff_seconds': self.backoff_seconds}
+
+
+def execute(request, rate_limiter=None, view_id=None, retry_policy=None):
+    """
+    Execute an API request. Every call to the Google APIs goes through this function, and is measured in a
+    'request' span when instrumentation sinks are registered (see _metrics.INSTRUMENTATION).
+
+        Args:
+            request: googleapiclient.http.HttpRequest, the request to execute
+            rate_limiter: RateLimiter, optional limiter the request waits on before being sent
+            view_id: str, the view the request is sent for, used by the rate limiter
+            retry_policy: RetryPolicy, optional policy used to retry transient errors
+        Return:
+            response: dict, the API response
+    """
+    if not INSTRUMENTATION.enabled:
+        def send():
+            if rate_limiter is not None:
+                rate_limiter.acquire(view_id)
+            return request.execute()
+
+        if retry_policy is None:
+            return send()
+        return retry_policy.call(send)
+
+    with INSTRUMENTATION.span('request', method=getattr(request, 'methodId', None), view_id=view_id) as span:
+        postproc = getattr(request, 'postproc', None)
+        if postproc is not None:
+            def measuredPostproc(resp, content):
+                span.set(response_bytes=len(content or b''))
+                return postproc(resp, content)
+            request.postproc = measuredPostproc
+
+        def measuredSend():
+            span.add('quota_units')
+            if rate_limiter is not None:
+                rate_limiter.acquire(view_id)
+            return request.execute()
+
+        response = measuredSend() if retry_policy is None else retry_policy.call(measuredSend)
+        span.set(retries=span.attributes.get('quota_units') - 1, rows=reportRows(response or {}))
+
+    return response
+
+
+MANAGEMENT_PAGE_SIZE = 1000
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+DELETE_BATCH_SIZE = 100
+
+
+def listAll(list_method, rate_limiter=None, retry_policy=None, max_results=None, **kwargs):
+    """
+    Call a management API list method and follow its pagination (`max-results` / `start-index`)
+
+        Args:
+            list_method: callable, a list method of the management API, e.g. management().profiles().list
+            rate_limiter: RateLimiter, optional limiter shared between requests
+            retry_policy: RetryPolicy, optional policy used to retry transient errors
+            max_results: int, number of items requested per page. Default to MANAGEMENT_PAGE_SIZE
+            kwargs: other parameters of the list method
+        Return:
+            items: list, the items of every page
+    """
+    max_results = max_results or MANAGEMENT_PAGE_SIZE
+    items = list()
+    start_index = 1
+    while True:
+        response = execute(list_method(max_results=max_results, start_index=start_index, **kwargs), rate_limiter,
+                           retry_policy=retry_policy)
+        page = response.get('items') or []
+        items.extend(page)
+        if not page or len(items) >= response.get('totalResults', len(items)):
+            return items
+        start_index += len(page)
+
+
+def iterPages(service, payload, verbose, slow_down, rate_limiter=None, retry_policy=None):
+    """
+    Yield the response pages of a payload one at a time, so only one page needs to be held in memory.
+    Each page is requested with a payload derived from `payload`, which is not mutated, so a consumer
+    stopping early leaves it on its original page token.
 
         Args:
             service: googleapiclient.discovery.Resource, a Google API service object v4
             payload: dict, a dictionnary representation of a the payload to be passed with the request
             verbose: bool, True will display the starting row being fetch, while False will mute this behavior 
+            slow_down: float, number of seconds to wait before each request
+            rate_limiter: RateLimiter, optional limiter shared between requests
+            retry_policy: RetryPolicy, optional policy used to retry transient errors on each page
+        Yield:
+            data: dict, the API response for one page
     """
-    token = 0
-    next_page = True
-    data = {'reports': []}
+    token = payload.get('reportRequests')[0].get('pageToken', 0)
+    view_id = payload.get('reportRequests')[0].get('viewId')
+    span = INSTRUMENTATION.start('report', view_id=view_id, pages=0, rows=0)
+    error = None
+
+    try:
+        while True:
+            if verbose:
+                print(f'Fetching rows starting at position: {token}')
+            if slow_down > 0:
+                time.sleep(slow_down)
+
+            with INSTRUMENTATION.activate(span):
+                data_tmp = execute(service.reports().batchGet(body=payload), rate_limiter, view_id, retry_policy)
+            span.add('pages')
+            span.add('rows', reportRows(data_tmp))
+            yield data_tmp
 
+            token = data_tmp.get('reports')[0].get('nextPageToken')
+            if token is None:
+                return
+            payload = derivePayload(payload, pageToken=token)
+    except Exception as err:
+        error = err
+        raise
+    finally:
+        INSTRUMENTATION.finish(span, error)
 
-    while next_page:
-        if verbose:
-            print(f'Fetching rows starting at position: {token}')
-        if slow_down > 0:
-            time.sleep(slow_down)
-            
-        data_tmp = service.reports().batchGet(body=payload).execute()
-        token = data_tmp.get('reports')[0].get('nextPageToken')
 
-        if token != None:
-            payload.get('reportRequests')[0].update({'pageToken': token})
-        else:
-            next_page = False
-            payload.get('reportRequests')[0].update({'pageToken': '0'})
+def iterResponsePages(service, payload, verbose, slow_down, rate_limiter=None, retry_policy=None):
+    """
+    iter through the response pages and concat the data from different pages under one 
+    'reports' key dictionnary.
+
+        Args:
+            service: googleapiclient.discovery.Resource, a Google API service object v4
+            payload: dict, a dictionnary representation of a the payload to be passed with the request
+            verbose: bool, True will display the starting row being fetch, while False will mute this behavior 
+            slow_down: float, number of seconds to wait before each request
+            rate_limiter: RateLimiter, optional limiter shared between requests
+            retry_policy: RetryPolicy, optional policy used to retry transient errors on each page
+    """
+    data = {'reports': []}
 
+    for data_tmp in iterPages(service, payload, verbose, slow_down, rate_limiter, retry_policy):
         for report in data_tmp.get('reports'):
             data.get('reports').append(report)
 
     return data
         
 
+MAX_REPORT_REQUESTS = 5
+BATCH_KEYS = ('viewId', 'dateRanges', 'samplingLevel', 'segments', 'cohortGroup')
+
+
+def batchKey(request):
+    """
+    Return the fields a report request must share with the other requests of a same batchGet call.
+    The API requires every request of a batch to have the same view, date ranges, sampling level,
+    segments and cohort group.
+
+        Args:
+            request: dict, one item of the `reportRequests` list of a payload
+        Return:
+            key: str, canonical representation of the shared fields
+    """
+    return json.dumps([request.get(key) for key in BATCH_KEYS], sort_keys=True, default=str)
+
+
+def fetchPacked(service, payloads, verbose, slow_down, rate_limiter=None, retry_policy=None,
+                max_requests=MAX_REPORT_REQUESTS):
+    """
+    Fetch several payloads with as few batchGet calls as possible. Compatible report requests (see batchKey)
+    are packed up to `max_requests` per call. Each report request keeps its own page token: once a request
+    has no more pages, its slot is given to another pending request of the same group.
+
+        Args:
+            service: googleapiclient.discovery.Resource, a Google API service object v4
+            payloads: list, payloads as returned by formatPayload. They are not mutated
+            verbose: bool, True will display the number of requests sent in each call
+            slow_down: float, number of seconds to wait before each request
+            rate_limiter: RateLimiter, optional limiter shared between requests
+            retry_policy: RetryPolicy, optional policy used to retry transient errors
+            max_requests: int, maximum number of report requests per batchGet call
+        Return:
+            data: list, one dictionnary per payload, in the same order, with the same structure as the
+                  output of iterResponsePages
+    """
+    data = [{'reports': []} for _ in payloads]
+    groups = dict()
+    for index, payload in enumerate(payloads):
+        for request in payload.get('reportRequests'):
+            request = dict(request, pageToken='0')
+            groups.setdefault(batchKey(request), list()).append((index, request))
+
+    for pending in groups.values():
+        while pending:
+            batch, pending = pending[:max_requests], pending[max_requests:]
+            if verbose:
+                print(f'Fetching {len(batch)} report requests in one call')
+            if slow_down > 0:
+                time.sleep(slow_down)
+
+            body = {'reportRequests': [request for _, request in batch]}
+            view_id = batch[0][1].get('viewId')
+            response = execute(service.reports().batchGet(body=body), rate_limiter, view_id, retry_policy)
+
+            unfinished = list()
+            for (index, request), report in zip(batch, response.get('reports')):
+                data[index].get('reports').append(report)
+                token = report.get('nextPageToken')
+                if token is not None:
+                    request.update({'pageToken': token})
+                    unfinished.append((index, request))
+            pending = pending + unfinished
+
+    return data
+
+
+def derivePayload(payload, **fields):
+    """
+    Return a payload whose report requests have some fields replaced. Only the payload and its requests are
+    copied, nested values (dimensions, metrics, filters, ...) are shared with the source payload, so deriving
+    a payload per date or page token stays cheap. Shared values must not be modified.
+
+        Args:
+            payload: dict, a dictionnary representation of a the payload to be passed with the request
+            fields: request fields to set, e.g. pageToken='0'
+        Return:
+            payload: dict, the new payload
+    """
+    derived = dict(payload)
+    derived['reportRequests'] = [dict(request, **fields) for request in payload.get('reportRequests')]
+
+    return derived
+
+
+def datePayload(payload, start_date, end_date):
+    """
+    Derive a payload with the date range of its report requests set. The source payload is left untouched so
+    it can be shared between days fetched concurrently.
+
+        Args:
+            payload: dict, a dictionnary representation of a the payload to be passed with the request
+            start_date: str, a string representation of the start date
+            end_date: str, a string representation of the end date
+        Return:
+            payload: dict, a new payload for the date range
+    """
+    if isCohort(payload):
+        raise ValueError('the dates of a cohort request are the dates of its cohorts')
+    derived = dict(payload)
+    derived['reportRequests'] = list()
+    for request in payload.get('reportRequests'):
+        date_ranges = [{'startDate': start_date, 'endDate': end_date}] + list(request.get('dateRanges')[1:])
+        derived['reportRequests'].append(dict(request, dateRanges=date_ranges, pageToken='0'))
+
+    return derived
+
+
 def formatDates(start_date, end_date):
     """
     Iterate over the date range provided to create a list of single days
@@ -104,3 +820,45 @@ def formatDates(start_date, end_date):
     return dates
 
 
+def isCohort(payload):
+    """
+    Check if a payload requests cohorts. Cohort requests have no date range and cannot be split by day
+
+        Args:
+            payload: dict, a dictionnary representation of a the payload to be passed with the request
+        Return:
+            bool, True if a report request of the payload has a cohort group
+    """
+    return any('cohortGroup' in request for request in payload.get('reportRequests'))
+
+
+def isSampled(report):
+    """
+    Check if a report is based on sampled data
+
+        Args:
+            report: dict, a report returned by the reporting API
+        Return:
+            bool, True if the report data is sampled
+    """
+    data = report.get('data') or {}
+    return bool(data.get('samplesReadCounts') or data.get('samplingSpaceSizes'))
+
+
+def splitDateRange(start_date, end_date):
+    """
+    Split a date range in two halves
+
+        Args:
+            start_date: str, a string representation of the start date for the desired date range
+            end_date: str, a string representation of the end date for the desired date range
+        Return:
+            ranges: list, two (start_date, end_date) tuples in chronological order
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    middle = start + timedelta(days=(end - start).days // 2)
+
+    return [(start_date, middle.strftime('%Y-%m-%d')),
+            ((middle + timedelta(days=1)).strftime('%Y-%m-%d'), end_date)]
+
@@ -0,0 +1,315 @@
+from contextlib import contextmanager
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+
+
+_CURRENT_SPAN = contextvars.ContextVar('ga_current_span', default=None)
+_IDS = itertools.count(1)
+
+
+class Span(object):
+    """
+    Timing and measures of one operation: an API request, the pages of a report or a conversion.
+    Attributes follow the names used by the sinks:
+        view_id, method: what the operation was for
+        response_bytes, rows, pages: what it returned
+        retries, quota_units: the retries it needed and the requests counted against the quotas
+    """
+
+    __slots__ = ('name', 'span_id', 'parent_id', 'trace_id', 'start', 'end', 'start_time', 'attributes', 'error')
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.span_id = next(_IDS)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else self.span_id
+        self.start = time.perf_counter()
+        self.start_time = time.time()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+
+    @property
+    def duration(self):
+        """
+        Number of seconds the operation took, None while it is running
+        """
+        return None if self.end is None else self.end - self.start
+
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+    def add(self, name, value=1):
+        """
+        Increment a numeric attribute
+        """
+        self.attributes[name] = self.attributes.get(name, 0) + value
+
+
+class _NullSpan(object):
+    """
+    Span returned when no sink is registered: every measure is dropped
+    """
+
+    attributes = {}
+
+    def set(self, **attributes):
+        pass
+
+
+    def add(self, name, value=1):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Instrumentation(object):
+    """
+    Hook surface of the package. Every API request, every report fetched page by page and every dataframe
+    conversion is measured in a Span, which is passed to the registered sinks once finished. Sinks are
+    objects with a record(span) method, or plain callables. Nothing is measured while no sink is registered.
+    """
+
+    def __init__(self):
+        self._sinks = list()
+        self._lock = threading.Lock()
+
+
+    @property
+    def enabled(self):
+        return bool(self._sinks)
+
+
+    def addSink(self, sink):
+        """
+        Register a sink
+
+            Args:
+                sink: object with a record(span) method, or callable taking a span
+            Return:
+                sink: the registered sink
+        """
+        with self._lock:
+            self._sinks = self._sinks + [sink]
+        return sink
+
+
+    def removeSink(self, sink):
+        with self._lock:
+            self._sinks = [s for s in self._sinks if s is not sink]
+
+
+    def start(self, name, **attributes):
+        """
+        Start a span without making it the current one, for operations spanning generator steps
+
+            Return:
+                span: Span, or a span dropping its measures if no sink is registered. Call finish() on it
+        """
+        if not self._sinks:
+            return NULL_SPAN
+        return Span(name, _CURRENT_SPAN.get(), **attributes)
+
+
+    def finish(self, span, error=None):
+        """
+        End a span started with start() and send it to the sinks
+        """
+        if span is NULL_SPAN:
+            return
+        span.end = time.perf_counter()
+        span.error = error
+        for sink in self._sinks:
+            try:
+                record = getattr(sink, 'record', sink)
+                record(span)
+            except Exception:
+                logging.getLogger(__name__).exception('instrumentation sink %r failed', sink)
+
+
+    @contextmanager
+    def activate(self, span):
+        """
+        Make a span started with start() the parent of the spans started in the block of a with statement
+        """
+        if span is NULL_SPAN:
+            yield span
+            return
+
+        token = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        finally:
+            _CURRENT_SPAN.reset(token)
+
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Measure the block of a with statement. Spans started inside it get it as parent
+
+            Yield:
+                span: Span, to set the measures of the operation
+        """
+        span = self.start(name, **attributes)
+        if span is NULL_SPAN:
+            yield span
+            return
+
+        token = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        except BaseException as err:
+            _CURRENT_SPAN.reset(token)
+            self.finish(span, err)
+            raise
+        _CURRENT_SPAN.reset(token)
+        self.finish(span)
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+def reportRows(response):
+    """
+    Count the rows of a batchGet response
+    """
+    return sum(len((report.get('data') or {}).get('rows') or []) for report in response.get('reports') or [])
+
+
+class LoggingSink(object):
+    """
+    Log one line per finished span
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        """
+            Args:
+                logger: logging.Logger, default to the 'googleAnalyticUtility' logger
+                level: int, level of the log records
+        """
+        self.logger = logger if logger is not None else logging.getLogger('googleAnalyticUtility')
+        self.level = level
+
+
+    def record(self, span):
+        attributes = ' '.join(f'{key}={value}' for key, value in sorted(span.attributes.items()))
+        status = 'error' if span.error is not None else 'ok'
+        self.logger.log(self.level, '%s %s %.1fms %s', span.name, status, span.duration * 1000, attributes)
+
+
+class PrometheusSink(object):
+    """
+    Aggregate spans into counters exposed in the Prometheus text format, labelled by operation, method and
+    view id: number of operations and errors, total seconds, response bytes, rows, pages, retries and
+    quota units
+    """
+
+    MEASURES = (('response_bytes', 'bytes'), ('rows', 'rows'), ('pages', 'pages'), ('retries', 'retries'),
+                ('quota_units', 'quota units'))
+
+    def __init__(self, prefix='ga'):
+        """
+            Args:
+                prefix: str, prefix of the metric names
+        """
+        self.prefix = prefix
+        self.series = dict()
+        self._lock = threading.Lock()
+
+
+    def record(self, span):
+        labels = (('operation', span.name), ('method', span.attributes.get('method')),
+                  ('view_id', span.attributes.get('view_id')))
+        labels = tuple((key, str(value)) for key, value in labels if value is not None)
+        with self._lock:
+            series = self.series.setdefault(labels, dict())
+            series['count'] = series.get('count', 0) + 1
+            series['errors'] = series.get('errors', 0) + (span.error is not None)
+            series['seconds'] = series.get('seconds', 0) + span.duration
+            for name, _ in self.MEASURES:
+                value = span.attributes.get(name)
+                if value is not None:
+                    series[name] = series.get(name, 0) + value
+
+
+    def render(self):
+        """
+        Return the counters in the Prometheus text exposition format
+
+            Return:
+                text: str, the exposition
+        """
+        metrics = [('count', 'operations'), ('errors', 'failed operations'), ('seconds', 'seconds spent')]
+        metrics += list(self.MEASURES)
+        lines = list()
+        with self._lock:
+            for name, description in metrics:
+                metric = f'{self.prefix}_{name}_total'
+                samples = list()
+                for labels, series in self.series.items():
+                    if name in series:
+                        text = ','.join(f'{key}="{value}"' for key, value in labels)
+                        samples.append(f'{metric}{{{text}}} {series[name]}')
+                if samples:
+                    lines.append(f'# HELP {metric} Total {description}')
+                    lines.append(f'# TYPE {metric} counter')
+                    lines.extend(samples)
+
+        return '\n'.join(lines) + '\n'
+
+
+    def write(self, path):
+        """
+        Atomically write the exposition to a file, e.g. for the node exporter textfile collector
+        """
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+class SpanSink(object):
+    """
+    Keep finished spans in the OpenTelemetry data model (trace id, span id, parent id, start and end time in
+    nanoseconds, attributes and status). When an OpenTelemetry tracer is given, every span is also emitted
+    through it.
+    """
+
+    def __init__(self, tracer=None, max_spans=10000):
+        """
+            Args:
+                tracer: opentelemetry.trace.Tracer, optional tracer the spans are emitted to
+                max_spans: int, number of spans kept in `spans`, the oldest are dropped
+        """
+        self.tracer = tracer
+        self.max_spans = max_spans
+        self.spans = list()
+        self._lock = threading.Lock()
+
+
+    def record(self, span):
+        start = int(span.start_time * 1e9)
+        end = start + int(span.duration * 1e9)
+        status = 'ERROR' if span.error is not None else 'OK'
+        data = {'name': f'googleAnalyticUtility.{span.name}', 'trace_id': span.trace_id, 'span_id': span.span_id,
+                'parent_id': span.parent_id, 'start_time_unix_nano': start, 'end_time_unix_nano': end,
+                'attributes': dict(span.attributes), 'status': status}
+        if span.error is not None:
+            data['attributes']['exception.type'] = type(span.error).__name__
+        with self._lock:
+            self.spans.append(data)
+            del self.spans[:-self.max_spans]
+
+        if self.tracer is not None:
+            otel_span = self.tracer.start_span(data['name'], start_time=start, attributes={
+                key: value for key, value in data['attributes'].items() if value is not None})
+            otel_span.end(end_time=end)
@@ -0,0 +1,156 @@
+import os
+
+from googleAnalyticUtility._convert import METRIC_DTYPES, reportHeaders, reportsToColumns
+
+
+def _pyarrow():
+    """
+    Import pyarrow, which is only needed to write parquet files
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError('pyarrow is required to write parquet files: pip install pyarrow') from err
+
+    return pyarrow
+
+
+def arrowSchema(report, columns=None):
+    """
+    Build the arrow schema of a report from its column headers. Dimensions are dictionary encoded strings
+    and metrics are typed from their metric header.
+
+        Args:
+            report: dict, a report returned by the reporting API
+            columns: list, optional names of the columns to keep
+        Return:
+            schema: pyarrow.Schema, the schema of the report
+    """
+    pa = _pyarrow()
+    dimensions, metrics = reportHeaders(report)
+    types = {'int64': pa.int64(), 'float64': pa.float64()}
+    fields = list()
+    for name in dimensions:
+        if columns is None or name in columns:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+    for name, metric_type in metrics:
+        if columns is None or name in columns:
+            dtype = METRIC_DTYPES.get(metric_type)
+            fields.append(pa.field(name, types.get(dtype, pa.string())))
+
+    return pa.schema(fields)
+
+
+def reportsToRecordBatch(reports, columns=None):
+    """
+    Convert reports sharing the same headers into an arrow record batch, without going through a dataframe
+
+        Args:
+            reports: list, reports returned by the reporting API, all with the same column headers
+            columns: list, optional names of the columns to keep
+        Return:
+            batch: pyarrow.RecordBatch, the rows of the reports
+    """
+    pa = _pyarrow()
+    schema = arrowSchema(reports[0], columns)
+    data = reportsToColumns(reports, typed=True, columns=columns)
+    arrays = list()
+    for field in schema:
+        values = data.get(field.name)
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.DictionaryArray.from_arrays(pa.array(values.codes, type=pa.int32()),
+                                                         pa.array(values.categories, type=pa.string())))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class ParquetSink(object):
+    """
+    Append report pages to a parquet dataset partitioned by view id and date:
+        <path>/view_id=<view id>/date=<date>/part-<n>.parquet
+    Each page is written as a row group as soon as it is received, so only one page is held in memory.
+    A partition stays open until close() is called; use the sink as a context manager.
+    """
+
+    def __init__(self, path, compression='zstd', columns=None):
+        """
+            Args:
+                path: str, root directory of the dataset
+                compression: str, parquet compression codec ('zstd', 'snappy', 'gzip', None, ...)
+                columns: list, optional names of the columns to write. Other columns are not converted
+        """
+        _pyarrow()
+        self.path = path
+        self.compression = compression
+        self.columns = columns
+        self.rows = 0
+        self._writers = dict()
+
+
+    def partitionPath(self, view_id, date):
+        """
+        Return the directory of a partition
+
+            Args:
+                view_id: str, the view id
+                date: str, the date, or the date range, of the data
+            Return:
+                path: str, the partition directory
+        """
+        return os.path.join(self.path, f'view_id={view_id}', f'date={date}')
+
+
+    def _writer(self, view_id, date, schema):
+        pq = _pyarrow().parquet
+        key = (view_id, date, schema)
+        writer = self._writers.get(key)
+        if writer is None:
+            directory = self.partitionPath(view_id, date)
+            os.makedirs(directory, exist_ok=True)
+            index = len([f for f in os.listdir(directory) if f.endswith('.parquet')])
+            writer = pq.ParquetWriter(os.path.join(directory, f'part-{index:05d}.parquet'), schema,
+                                      compression=self.compression)
+            self._writers[key] = writer
+
+        return writer
+
+
+    def write(self, page, view_id, date):
+        """
+        Append a page to the partition of a view and date
+
+            Args:
+                page: dict, the response of one page, as yielded by GetGAData.iterData
+                view_id: str, the view id the page was fetched for
+                date: str, the date, or the date range, of the page
+        """
+        groups = dict()
+        for report in page.get('reports'):
+            groups.setdefault(reportHeaders(report), list()).append(report)
+
+        for reports in groups.values():
+            batch = reportsToRecordBatch(reports, self.columns)
+            if batch.num_rows == 0:
+                continue
+            self._writer(view_id, date, batch.schema).write_batch(batch)
+            self.rows += batch.num_rows
+
+
+    def close(self):
+        """
+        Close every open parquet file
+        """
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = dict()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
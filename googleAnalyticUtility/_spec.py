@@ -0,0 +1,316 @@
+import functools
+
+from googleAnalyticUtility._storage import requestSignature
+
+
+CLAUSE_OPERATORS = ('AND', 'OR')
+DIMENSION_FILTER_OPERATORS = ('REGEXP', 'BEGINS_WITH', 'ENDS_WITH', 'PARTIAL', 'EXACT', 'NUMERIC_EQUAL',
+                              'NUMERIC_GREATER_THAN', 'NUMERIC_LESS_THAN', 'IN_LIST')
+METRIC_FILTER_OPERATORS = ('EQUAL', 'LESS_THAN', 'GREATER_THAN', 'IS_MISSING')
+SORT_ORDERS = ('ASCENDING', 'DESCENDING')
+ORDER_TYPES = ('VALUE', 'DELTA', 'SMART', 'HISTOGRAM_BUCKET', 'DIMENSION_AS_INTEGER')
+MAX_DIMENSIONS = 9
+MAX_METRICS = 10
+MAX_PIVOTS = 2
+PAGE_SIZE = 100000
+
+
+class _FrozenDict(tuple):
+    """
+    Sorted (key, value) pairs of a frozen dictionary, told apart from frozen lists by thaw()
+    """
+
+
+def freeze(value):
+    """
+    Recursively convert lists to tuples and dictionaries to sorted pairs so a value can be hashed
+    """
+    if isinstance(value, _FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return _FrozenDict((key, freeze(item)) for key, item in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """
+    Recursively convert frozen values back to lists and dictionaries for the JSON body
+    """
+    if isinstance(value, _FrozenDict):
+        return {key: thaw(item) for key, item in value}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+class ReportSpec(object):
+    """
+    Immutable and validated description of a report request. The request body is compiled and frozen once
+    when the spec is created; payload() then thaws it into a new payload for a date range or page token, so
+    editing a payload never changes the spec nor the payloads returned later. Two specs describing the same
+    request are equal and have the same hash, and `signature` is the key used by Checkpoint and SyncState
+    for the payloads of the spec.
+
+    Pivots, orders, segments and cohorts let GA aggregate the rows before sending them. A segment adds the
+    ga:segment dimension and a cohort the ga:cohort dimension when they are not requested. Cohort requests
+    have no date range: their dates are the ones of the cohorts.
+    """
+
+    __slots__ = ('view_id', 'dimensions', 'metrics', 'start_date', 'end_date', 'dimension_operator',
+                 'dimensions_filters', 'metric_operator', 'metrics_filters', 'page_size', 'order_bys', 'pivots',
+                 'segments', 'cohorts', 'lifetime_value', 'hide_totals', 'hide_value_ranges', '_payload',
+                 '_signature', '_key')
+
+    def __init__(self, view_id, dimensions, metrics, start_date, end_date, dimension_operator=None,
+                 dimensions_filters=None, metric_operator=None, metrics_filters=None, page_size=PAGE_SIZE,
+                 order_bys=None, pivots=None, segments=None, cohorts=None, lifetime_value=False, hide_totals=False,
+                 hide_value_ranges=False):
+        """
+            Args:
+                view_id: str, the view id from which the data should be retrieved
+                dimensions: list, GA dimensions to be returned
+                metrics: list, GA metrics to be returned
+                start_date: str, start date of the date range
+                end_date: str, end date of the date range
+                dimension_operator: str, 'AND' or 'OR' to combine the dimension filters. None for the API
+                                    default ('OR')
+                dimensions_filters: list, (dimension name, not, operator, expression, case sensitive) tuples
+                metric_operator: str, 'AND' or 'OR' to combine the metric filters. None for the API default
+                metrics_filters: list, (metric name, not, operator, comparison value) tuples
+                page_size: int, number of rows per page
+                order_bys: list, field names sorted ascending, or (field name, sort order, order type) tuples.
+                           The sort order ('ASCENDING' or 'DESCENDING') and order type ('VALUE', 'DELTA',
+                           'SMART', 'HISTOGRAM_BUCKET' or 'DIMENSION_AS_INTEGER') can be left out
+                pivots: list, at most 2 (dimensions, metrics, max group count, start group) tuples. The max
+                        group count and start group can be left out
+                segments: list, segment ids such as 'gaid::-3', or dynamic segment dictionaries
+                cohorts: list, (name, start date, end date) tuples of first visit date cohorts
+                lifetime_value: bool, True for the lifetime value of the cohorts
+                hide_totals: bool, True to leave the totals, minimums and maximums out of the response
+                hide_value_ranges: bool, True to leave the minimums and maximums out of the response
+        """
+        if not view_id:
+            raise ValueError("view_id cannot be None. You must pass a GA View ID")
+        dimensions = freeze(dimensions or ())
+        metrics = freeze(metrics or ())
+        dimensions_filters = freeze(dimensions_filters or ())
+        metrics_filters = freeze(metrics_filters or ())
+        order_bys = tuple((order,) if isinstance(order, str) else freeze(order) for order in order_bys or ())
+        pivots = tuple(self._pivot(pivot) for pivot in pivots or ())
+        segments = tuple(freeze({'segmentId': segment} if isinstance(segment, str) else segment)
+                         for segment in segments or ())
+        cohorts = freeze(cohorts or ())
+        if segments and 'ga:segment' not in dimensions:
+            dimensions += ('ga:segment',)
+        if cohorts and 'ga:cohort' not in dimensions:
+            dimensions += ('ga:cohort',)
+        if not metrics:
+            raise ValueError('at least one metric is required')
+        if len(dimensions) > MAX_DIMENSIONS:
+            raise ValueError(f'a request accepts at most {MAX_DIMENSIONS} dimensions, got {len(dimensions)}')
+        if len(metrics) > MAX_METRICS:
+            raise ValueError(f'a request accepts at most {MAX_METRICS} metrics, got {len(metrics)}')
+        for operator in (dimension_operator, metric_operator):
+            if operator is not None and operator not in CLAUSE_OPERATORS:
+                raise ValueError(f'unknown clause operator {operator!r}, expected one of {CLAUSE_OPERATORS}')
+        for dim_filt in dimensions_filters:
+            if len(dim_filt) != 5 or dim_filt[2] not in DIMENSION_FILTER_OPERATORS:
+                raise ValueError(f'invalid dimension filter {dim_filt!r}')
+        for met_filt in metrics_filters:
+            if len(met_filt) != 4 or met_filt[2] not in METRIC_FILTER_OPERATORS:
+                raise ValueError(f'invalid metric filter {met_filt!r}')
+        for order in order_bys:
+            if not 1 <= len(order) <= 3 or order[1:2] and order[1] not in SORT_ORDERS \
+                    or order[2:3] and order[2] not in ORDER_TYPES:
+                raise ValueError(f'invalid order {order!r}')
+        if len(pivots) > MAX_PIVOTS:
+            raise ValueError(f'a request accepts at most {MAX_PIVOTS} pivots, got {len(pivots)}')
+        for cohort in cohorts:
+            if len(cohort) != 3:
+                raise ValueError(f'invalid cohort {cohort!r}, expected (name, start date, end date)')
+
+        for name, value in (('view_id', view_id), ('dimensions', dimensions), ('metrics', metrics),
+                            ('start_date', start_date), ('end_date', end_date),
+                            ('dimension_operator', dimension_operator), ('dimensions_filters', dimensions_filters),
+                            ('metric_operator', metric_operator), ('metrics_filters', metrics_filters),
+                            ('page_size', page_size), ('order_bys', order_bys), ('pivots', pivots),
+                            ('segments', segments), ('cohorts', cohorts), ('lifetime_value', lifetime_value),
+                            ('hide_totals', hide_totals), ('hide_value_ranges', hide_value_ranges)):
+            object.__setattr__(self, name, value)
+
+        payload = self._compile()
+        object.__setattr__(self, '_payload', freeze(payload))
+        object.__setattr__(self, '_signature', requestSignature(payload))
+        object.__setattr__(self, '_key', requestSignature(payload, keep_dates=True))
+
+
+    @staticmethod
+    def _pivot(pivot):
+        """
+        Validate a pivot and fill in its optional max group count and start group
+        """
+        pivot = freeze(pivot)
+        if not 2 <= len(pivot) <= 4 or not pivot[0] or not pivot[1]:
+            raise ValueError(f'invalid pivot {pivot!r}, expected (dimensions, metrics, max group count, start group)')
+        if len(pivot[1]) > MAX_METRICS:
+            raise ValueError(f'a pivot accepts at most {MAX_METRICS} metrics, got {len(pivot[1])}')
+        dimensions, metrics, max_group_count, start_group = pivot + (None, None)[len(pivot) - 2:]
+
+        return freeze(dimensions), freeze(metrics), max_group_count, start_group
+
+
+    def _compile(self):
+        """
+        Build the payload of the spec. Filter clauses without filters are left out and so is the operator of
+        a clause when it is None. Optional features are only added to the request when they are used, so the
+        signature of a plain request does not depend on them
+        """
+        request = {
+            'viewId': self.view_id,
+            'dimensions': [{'name': dimension} for dimension in self.dimensions],
+            'metrics': [{'expression': metric} for metric in self.metrics],
+            'pageToken': '0',
+            'pageSize': self.page_size,
+        }
+        if not self.cohorts:
+            request['dateRanges'] = [{'startDate': self.start_date, 'endDate': self.end_date}]
+
+        if self.dimensions_filters:
+            clause = {'filters': [{
+                'dimensionName': dim_filt[0],
+                'not': dim_filt[1],
+                'operator': dim_filt[2],
+                'expressions': thaw(dim_filt[3]),
+                'caseSensitive': dim_filt[4]
+            } for dim_filt in self.dimensions_filters]}
+            if self.dimension_operator is not None:
+                clause['operator'] = self.dimension_operator
+            request['dimensionFilterClauses'] = [clause]
+
+        if self.metrics_filters:
+            clause = {'filters': [{
+                'metricName': met_filt[0],
+                'not': met_filt[1],
+                'operator': met_filt[2],
+                'comparisonValue': met_filt[3]
+            } for met_filt in self.metrics_filters]}
+            if self.metric_operator is not None:
+                clause['operator'] = self.metric_operator
+            request['metricFilterClauses'] = [clause]
+
+        if self.order_bys:
+            request['orderBys'] = [dict(zip(('fieldName', 'sortOrder', 'orderType'), order))
+                                   for order in self.order_bys]
+
+        if self.pivots:
+            request['pivots'] = list()
+            for dimensions, metrics, max_group_count, start_group in self.pivots:
+                pivot = {'dimensions': [{'name': dimension} for dimension in dimensions],
+                         'metrics': [{'expression': metric} for metric in metrics]}
+                if max_group_count is not None:
+                    pivot['maxGroupCount'] = max_group_count
+                if start_group is not None:
+                    pivot['startGroup'] = start_group
+                request['pivots'].append(pivot)
+
+        if self.segments:
+            request['segments'] = [thaw(segment) for segment in self.segments]
+
+        if self.cohorts:
+            request['cohortGroup'] = {'cohorts': [{
+                'name': name,
+                'type': 'FIRST_VISIT_DATE',
+                'dateRange': {'startDate': start_date, 'endDate': end_date}
+            } for name, start_date, end_date in self.cohorts]}
+            if self.lifetime_value:
+                request['cohortGroup']['lifetimeValue'] = True
+
+        if self.hide_totals:
+            request['hideTotals'] = True
+        if self.hide_value_ranges:
+            request['hideValueRanges'] = True
+
+        return {'reportRequests': [request]}
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ReportSpec is immutable')
+
+
+    @property
+    def signature(self):
+        """
+        Hash of the request without its date range, shared by every date and page of the spec
+        """
+        return self._signature
+
+
+    @property
+    def key(self):
+        """
+        Hash of the request and its date range, the key of the spec payload in a ResponseCache
+        """
+        return self._key
+
+
+    def payload(self, start_date=None, end_date=None, page_token='0'):
+        """
+        Build the payload of a date range and page token. Every call returns a new payload, nested values
+        included, which the caller is free to modify.
+
+            Args:
+                start_date: str, start date of the payload. Default to the date range of the spec
+                end_date: str, end date of the payload. Default to start_date if set, else to the spec
+                page_token: str, the page token of the payload
+            Return:
+                payload: dict, a payload to be passed with the request
+        """
+        if start_date is not None and self.cohorts:
+            raise ValueError('the dates of a cohort request are the dates of its cohorts')
+        payload = thaw(self._payload)
+        for request in payload.get('reportRequests'):
+            request['pageToken'] = page_token
+            if start_date is not None:
+                request['dateRanges'][0] = {'startDate': start_date,
+                                            'endDate': end_date if end_date is not None else start_date}
+
+        return payload
+
+
+    def __eq__(self, other):
+        return isinstance(other, ReportSpec) and self._key == other._key
+
+
+    def __hash__(self):
+        return hash(self._key)
+
+
+    def __repr__(self):
+        return (f'ReportSpec(view_id={self.view_id!r}, dimensions={self.dimensions!r}, metrics={self.metrics!r}, '
+                f'start_date={self.start_date!r}, end_date={self.end_date!r})')
+
+
+@functools.lru_cache(maxsize=256)
+def _compileSpec(*args):
+    return ReportSpec(*args)
+
+
+def compileSpec(view_id, dimensions, metrics, start_date, end_date, dimension_operator=None,
+                dimensions_filters=None, metric_operator=None, metrics_filters=None, page_size=PAGE_SIZE,
+                order_bys=None, pivots=None, segments=None, cohorts=None, lifetime_value=False, hide_totals=False,
+                hide_value_ranges=False):
+    """
+    Return the ReportSpec of a request, reusing the one already compiled for the same arguments
+
+        Args:
+            see ReportSpec
+        Return:
+            spec: ReportSpec, the compiled spec
+    """
+    return _compileSpec(view_id, freeze(dimensions or ()), freeze(metrics or ()), start_date, end_date,
+                        dimension_operator, freeze(dimensions_filters or ()), metric_operator,
+                        freeze(metrics_filters or ()), page_size, freeze(order_bys or ()), freeze(pivots or ()),
+                        freeze(segments or ()), freeze(cohorts or ()), lifetime_value, hide_totals,
+                        hide_value_ranges)
@@ -0,0 +1,417 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def requestSignature(payload, keep_dates=False):
+    """
+    Compute a stable signature of a payload. The page token is always ignored and the date ranges are
+    ignored unless keep_dates is True, so every day and page of a same request share one signature.
+
+        Args:
+            payload: dict, a dictionnary representation of a the payload to be passed with the request
+            keep_dates: bool, True to include the date ranges in the signature
+        Return:
+            signature: str, hexadecimal sha256 digest of the canonical payload
+    """
+    requests = list()
+    for request in payload.get('reportRequests'):
+        request = {k: v for k, v in request.items() if k != 'pageToken' and (keep_dates or k != 'dateRanges')}
+        requests.append(request)
+
+    canonical = json.dumps(requests, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def requestDateRanges(request):
+    """
+    Return the date ranges of a report request. Cohort requests have no dateRanges, the date ranges of their
+    cohorts are returned instead
+
+        Args:
+            request: dict, a report request of a payload
+        Return:
+            date_ranges: list, dictionaries with a startDate and an endDate
+    """
+    if 'cohortGroup' in request:
+        return [cohort.get('dateRange') for cohort in request.get('cohortGroup').get('cohorts')]
+    return request.get('dateRanges') or list()
+
+
+def writeJson(path, obj):
+    """
+    Atomically write a json file: the content is written to a temporary file which then replaces `path`
+
+        Args:
+            path: str, path of the file to write
+            obj: object, json serializable object
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def readJson(path):
+    """
+    Read a json file
+
+        Args:
+            path: str, path of the file to read
+        Return:
+            obj: object, the decoded content
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def fileSize(path):
+    """
+    Return the size of a file in bytes, 0 if it does not exist
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class Checkpoint(object):
+    """
+    Persist every fetched page of a report to disk so an interrupted backfill can be resumed.
+    A unit of work is a (view, date range, page token) triple. Pages are stored under
+        <directory>/<view id>/<request signature>/<start date>_<end date>/page-<index>.json
+    and a `_DONE` marker is written once the last page of a date range has been fetched. The date range of a
+    cohort request goes from the start of its first cohort to the end of its last one.
+    """
+
+    DONE = '_DONE'
+
+    def __init__(self, directory):
+        """
+            Args:
+                directory: str, root directory of the checkpoint files
+        """
+        self.directory = directory
+
+
+    def unitPath(self, payload):
+        """
+        Return the directory holding the pages of a payload
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+            Return:
+                path: str, directory of the date range
+        """
+        request = payload.get('reportRequests')[0]
+        date_ranges = requestDateRanges(request)
+        start_date = min(str(date_range.get('startDate')) for date_range in date_ranges)
+        end_date = max(str(date_range.get('endDate')) for date_range in date_ranges)
+        return os.path.join(self.directory, str(request.get('viewId')), requestSignature(payload),
+                            f'{start_date}_{end_date}')
+
+
+    def pageFiles(self, path):
+        if not os.path.isdir(path):
+            return list()
+        return sorted(f for f in os.listdir(path) if f.startswith('page-') and f.endswith('.json'))
+
+
+    def iterPages(self, payload):
+        """
+        Yield the responses already saved for a payload, one page at a time
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+            Yield:
+                response: dict, the API response of a saved page
+        """
+        path = self.unitPath(payload)
+        for page in self.pageFiles(path):
+            yield readJson(os.path.join(path, page)).get('response')
+
+
+    def isDone(self, payload):
+        """
+        Check if the date range of a payload has been completely fetched
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+            Return:
+                bool, True if the `_DONE` marker exists
+        """
+        return os.path.exists(os.path.join(self.unitPath(payload), self.DONE))
+
+
+    def savePage(self, payload, response):
+        """
+        Write a fetched page to disk
+
+            Args:
+                payload: dict, the payload used for the request, its pageToken is the one of the page
+                response: dict, the API response for the page
+        """
+        path = self.unitPath(payload)
+        index = len(self.pageFiles(path))
+
+        page_token = payload.get('reportRequests')[0].get('pageToken')
+        writeJson(os.path.join(path, f'page-{index:06d}.json'), {'pageToken': page_token, 'response': response})
+
+
+    def markDone(self, payload):
+        """
+        Flag the date range of a payload as completely fetched
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+        """
+        path = self.unitPath(payload)
+        os.makedirs(path, exist_ok=True)
+        open(os.path.join(path, self.DONE), 'w').close()
+
+
+class ResponseCache(object):
+    """
+    On disk cache of report responses keyed by a canonical hash of the report request and its date range.
+    Entries expire after `ttl` seconds, except the ones whose date range ended more than
+    `immutable_after_days` days ago: GA data for those days is final and is kept until evicted.
+    When the cache grows above `max_bytes`, the least recently used entries are removed.
+    """
+
+    def __init__(self, directory, ttl=3600, max_bytes=512 * 1024 ** 2, immutable_after_days=3):
+        """
+            Args:
+                directory: str, directory where the cache entries are written
+                ttl: float, number of seconds an entry for recent days stays valid. None to never expire
+                max_bytes: int, maximum size of the cache on disk. None for no limit
+                immutable_after_days: int, number of days after which a day is considered final. None to
+                                      apply the ttl to every entry
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.immutable_after_days = immutable_after_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # running size of the cache, measured by the first eviction and kept up to date by put()
+        self._size = None
+
+
+    def key(self, payload):
+        """
+        Return the cache key of a payload
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+            Return:
+                key: str, hexadecimal digest of the request and its date range
+        """
+        return requestSignature(payload, keep_dates=True)
+
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+
+    def isImmutable(self, payload):
+        """
+        Check if every date range of a payload, or of its cohorts, ended more than `immutable_after_days` days
+        ago
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+            Return:
+                bool, True if the cached response never expires
+        """
+        if self.immutable_after_days is None:
+            return False
+
+        limit = datetime.now() - timedelta(days=self.immutable_after_days)
+        for request in payload.get('reportRequests'):
+            for date_range in requestDateRanges(request):
+                try:
+                    end_date = datetime.strptime(date_range.get('endDate'), '%Y-%m-%d')
+                except (TypeError, ValueError):
+                    return False
+                if end_date >= limit:
+                    return False
+
+        return True
+
+
+    def get(self, payload):
+        """
+        Return the cached response of a payload
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+            Return:
+                data: dict, the cached report data or None on a cache miss
+        """
+        path = self.path(self.key(payload))
+        try:
+            entry = readJson(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        expired = self.ttl is not None and time.time() - entry.get('created') > self.ttl
+        if expired and not self.isImmutable(payload):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+
+        return entry.get('data')
+
+
+    def put(self, payload, data):
+        """
+        Store the response of a payload and evict the least recently used entries if needed
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+                data: dict, the report data returned for the payload
+        """
+        path = self.path(self.key(payload))
+        old_size = fileSize(path)
+        writeJson(path, {'created': time.time(), 'data': data})
+        if self.max_bytes is None:
+            return
+
+        with self._lock:
+            if self._size is not None:
+                self._size += fileSize(path) - old_size
+            full = self._size is None or self._size > self.max_bytes
+        if full:
+            self.evict()
+
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in `max_bytes`. The directory is only
+        walked here, and put() only calls it once the running size goes above `max_bytes`
+        """
+        with self._lock:
+            entries = list()
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith('.json'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+            self._size = total
+
+
+    def clear(self):
+        """
+        Remove every entry of the cache
+        """
+        with self._lock:
+            self._size = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith('.json'):
+                        os.remove(os.path.join(root, name))
+
+
+class SyncState(object):
+    """
+    Local state store of incremental syncs. For each (view, request signature) it records the dates that have
+    been fetched and whether their data was final (isDataGolden), in
+        <directory>/<view id>/<request signature>.json
+    so later runs only fetch the dates that are missing or were not final yet.
+    """
+
+    def __init__(self, directory):
+        """
+            Args:
+                directory: str, directory where the state files are written
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+
+
+    def path(self, payload):
+        request = payload.get('reportRequests')[0]
+        return os.path.join(self.directory, str(request.get('viewId')), f'{requestSignature(payload)}.json')
+
+
+    def load(self, payload):
+        """
+        Return the recorded dates of a payload
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+            Return:
+                dates: dict, date to {'golden': bool, 'fetched_at': float}
+        """
+        try:
+            return readJson(self.path(payload)).get('dates', dict())
+        except (OSError, ValueError):
+            return dict()
+
+
+    def pendingDates(self, payload, dates):
+        """
+        Filter the dates that still need to be fetched
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+                dates: list, candidate dates
+            Return:
+                dates: list, the dates never fetched or whose data was not final, in the input order
+        """
+        recorded = self.load(payload)
+        return [date for date in dates if not recorded.get(date, {}).get('golden', False)]
+
+
+    def record(self, payload, date, golden):
+        """
+        Record that a date has been fetched
+
+            Args:
+                payload: dict, a dictionnary representation of a the payload to be passed with the request
+                date: str, the date fetched
+                golden: bool, True if the data of the date is final
+        """
+        with self._lock:
+            dates = self.load(payload)
+            dates[date] = {'golden': bool(golden), 'fetched_at': time.time()}
+            writeJson(self.path(payload), {'dates': dates})
+
@@ -0,0 +1,118 @@
+import csv
+import io
+
+from googleapiclient.http import MediaUpload, MediaIoBaseUpload, MediaFileUpload
+from googleAnalyticUtility._helpers import UPLOAD_CHUNK_SIZE
+
+
+UPLOAD_MIMETYPE = 'application/octet-stream'
+
+
+class CsvRowsUpload(MediaUpload):
+    """
+    Resumable media reading its content from an iterable of CSV rows. Rows are only read as the chunks are
+    sent, so the data never has to be fully held in memory or written to a file. The bytes of a chunk are
+    kept until the server acknowledges them, which lets an interrupted chunk be sent again.
+    """
+
+    def __init__(self, rows, chunksize=UPLOAD_CHUNK_SIZE, mimetype=UPLOAD_MIMETYPE):
+        """
+            Args:
+                rows: iterable, CSV rows, either already formatted strings or sequences of values. The first
+                      row is the header
+                chunksize: int, number of bytes sent per request, a multiple of 256KiB
+                mimetype: str, mime type of the content
+        """
+        super(CsvRowsUpload, self).__init__()
+        self._rows = iter(rows)
+        self._chunksize = chunksize
+        self._mimetype = mimetype
+        self._buffer = bytearray()
+        self._offset = 0
+        self._next = 0
+        self._exhausted = False
+
+
+    def _encode(self, row):
+        if isinstance(row, str):
+            return row.encode('utf-8') if row.endswith('\n') else f'{row}\n'.encode('utf-8')
+        line = io.StringIO()
+        csv.writer(line, lineterminator='\n').writerow(row)
+        return line.getvalue().encode('utf-8')
+
+
+    def _fill(self, end):
+        """
+        Read rows until the buffer goes past byte `end` or the rows are exhausted
+        """
+        while not self._exhausted and self._offset + len(self._buffer) <= end:
+            try:
+                self._buffer.extend(self._encode(next(self._rows)))
+            except StopIteration:
+                self._exhausted = True
+
+
+    def chunksize(self):
+        return self._chunksize
+
+
+    def mimetype(self):
+        return self._mimetype
+
+
+    def resumable(self):
+        return True
+
+
+    def has_stream(self):
+        return False
+
+
+    def size(self):
+        """
+        Return the total size once known. The rows are read one chunk ahead so the last chunk is always
+        sent with the total size, even when it is a full chunk.
+        """
+        self._fill(self._next + self._chunksize)
+        return self._offset + len(self._buffer) if self._exhausted else None
+
+
+    def getbytes(self, begin, length):
+        """
+        Return the bytes between `begin` and `begin + length`. Bytes before `begin` have been acknowledged
+        by the server and are released.
+        """
+        if begin < self._offset:
+            raise ValueError(f'bytes before {self._offset} have already been released')
+        del self._buffer[:begin - self._offset]
+        self._offset = begin
+        self._fill(begin + length)
+        data = bytes(self._buffer[:length])
+        self._next = begin + len(data)
+
+        return data
+
+
+def uploadMedia(file_path=None, data=None, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Build the resumable media of an upload from a file, a dataframe or an iterable of CSV rows
+
+        Args:
+            file_path: str, path of the file to upload
+            data: pandas.DataFrame or iterable, the data to upload when file_path is None. A dataframe is
+                  written to an in-memory CSV, its columns are the header. An iterable yields CSV rows,
+                  the first one being the header
+            chunk_size: int, number of bytes sent per request, a multiple of 256KiB
+        Return:
+            media: googleapiclient.http.MediaUpload, the media to pass as media_body
+    """
+    if (file_path is None) == (data is None):
+        raise TypeError('exactly one of file_path and data must be given')
+
+    if file_path is not None:
+        return MediaFileUpload(file_path, mimetype=UPLOAD_MIMETYPE, chunksize=chunk_size, resumable=True)
+    if hasattr(data, 'to_csv'):
+        content = io.BytesIO(data.to_csv(index=False).encode('utf-8'))
+        return MediaIoBaseUpload(content, mimetype=UPLOAD_MIMETYPE, chunksize=chunk_size, resumable=True)
+
+    return CsvRowsUpload(data, chunksize=chunk_size)
@@ -17,10 +17,20 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url ="https://github.com/TeddyCr/google-analytics-utility",
     packages=setuptools.find_packages(),
+    package_data={
+        'googleAnalyticUtility': ['discovery/*.json'],
+    },
     classifiers=[
         "Python :: 3",
         "Operating Sytem :: OS Independent",
     ],
     install_requires=requirements,
-    python_requires= '>=3.6',
+    extras_require={
+        'parquet': ['pyarrow'],
+        'async': ['aiohttp'],
+    },
+    entry_points={
+        'console_scripts': ['ga-backfill=googleAnalyticUtility._backfill:main'],
+    },
+    python_requires= '>=3.7',
 )
\ No newline at end of file
@@ -0,0 +1,205 @@
+"""
+Offline stand-ins for the Google API objects used by the tests
+"""
+from datetime import datetime
+
+from googleAnalyticUtility._storage import requestDateRanges
+
+
+def fakePayload(view_id='1'):
+    return {'reportRequests': [{'viewId': view_id, 'pageToken': '0', 'pageSize': 2,
+                                'dateRanges': [{'startDate': '2020-01-01', 'endDate': '2020-01-01'}],
+                                'dimensions': [{'name': 'ga:date'}], 'metrics': [{'expression': 'ga:sessions'}]}]}
+
+
+def fakeCohortPayload(view_id='1'):
+    cohorts = [{'name': f'week {i + 1}', 'type': 'FIRST_VISIT_DATE',
+                'dateRange': {'startDate': f'2020-01-{7 * i + 1:02d}', 'endDate': f'2020-01-{7 * i + 7:02d}'}}
+               for i in range(2)]
+    return {'reportRequests': [{'viewId': view_id, 'pageToken': '0', 'pageSize': 2,
+                                'cohortGroup': {'cohorts': cohorts},
+                                'dimensions': [{'name': 'ga:cohort'}], 'metrics': [{'expression': 'ga:users'}]}]}
+
+
+class FakeService(object):
+    """
+    Minimal stand-in for the reporting service returning `pages` pages and failing after `fail_after` calls.
+    Ranges longer than `max_unsampled_days` days come back sampled and ranges starting on one of the
+    `recent_dates` are not golden.
+    """
+
+    def __init__(self, pages=3, fail_after=None, max_unsampled_days=None, recent_dates=()):
+        self.pages = pages
+        self.fail_after = fail_after
+        self.max_unsampled_days = max_unsampled_days
+        self.recent_dates = set(recent_dates)
+        self.calls = list()
+        self.batches = list()
+
+    def reports(self):
+        return self
+
+    def batchGet(self, body):
+        requests = body.get('reportRequests')
+        service = self
+
+        class Request(object):
+            def execute(self):
+                if service.fail_after is not None and len(service.calls) >= service.fail_after:
+                    raise ConnectionError('preempted')
+                service.calls.append(int(requests[0].get('pageToken')))
+                service.batches.append(len(requests))
+                return {'reports': [service.report(request) for request in requests]}
+
+        return Request()
+
+    def report(self, request):
+        token = int(request.get('pageToken'))
+        date_range = requestDateRanges(request)[0]
+        date = date_range.get('startDate')
+        dimensions = [d.get('name') for d in request.get('dimensions', [{'name': 'ga:date'}])]
+        report = {
+            'columnHeader': {'dimensions': dimensions,
+                             'metricHeader': {'metricHeaderEntries': [{'name': 'ga:sessions',
+                                                                       'type': 'INTEGER'}]}},
+            'data': {'rows': [{'dimensions': [date] * len(dimensions), 'metrics': [{'values': [str(token)]}]}]}
+        }
+        if token + 1 < self.pages:
+            report['nextPageToken'] = str(token + 1)
+        days = (datetime.strptime(date_range.get('endDate'), '%Y-%m-%d') -
+                datetime.strptime(date, '%Y-%m-%d')).days + 1
+        if self.max_unsampled_days is not None and days > self.max_unsampled_days:
+            report.get('data').update({'samplesReadCounts': ['1000'], 'samplingSpaceSizes': ['5000']})
+        elif date not in self.recent_dates:
+            report.get('data').update({'isDataGolden': True})
+        return report
+
+
+class FakeRequest(object):
+    def __init__(self, response, calls):
+        self.response = response
+        self.calls = calls
+
+    def execute(self):
+        self.calls.append(self.response)
+        return self.response
+
+
+class FakeCollection(object):
+    """
+    Paginated list method of the management API returning `items` filtered on the accountId and
+    webPropertyId parameters, which accept the `~all` wildcard
+    """
+
+    def __init__(self, items, calls):
+        self.items = items
+        self.calls = calls
+
+    def list(self, max_results=1000, start_index=1, **kwargs):
+        items = [item for item in self.items
+                 if all(value == '~all' or item.get(key) == value for key, value in kwargs.items())]
+        page = items[start_index - 1:start_index - 1 + max_results]
+        return FakeRequest({'items': page, 'totalResults': len(items), 'startIndex': start_index}, self.calls)
+
+
+class FakeUploadRequest(object):
+    def __init__(self, uploads, datasource_id):
+        self.uploads = uploads
+        self.datasource_id = datasource_id
+
+    def next_chunk(self):
+        upload = {'id': f'{self.datasource_id}-new', 'accountId': 'a1', 'webPropertyId': 'p1',
+                  'customDataSourceId': self.datasource_id}
+        self.uploads.items.append(upload)
+        return None, upload
+
+
+class FakeUploads(FakeCollection):
+    """
+    Uploads of custom data sources. Calls on the data sources listed in `broken` fail with a 404
+    """
+
+    def __init__(self, items, calls, broken=()):
+        super(FakeUploads, self).__init__(items, calls)
+        self.broken = set(broken)
+        self.deleted = list()
+        self.status = 'COMPLETED'
+
+    def check(self, datasource_id):
+        if datasource_id in self.broken:
+            import httplib2
+            from googleapiclient.errors import HttpError
+            raise HttpError(httplib2.Response({'status': 404}), b'{"error": {"message": "not found"}}')
+
+    def list(self, max_results=1000, start_index=1, **kwargs):
+        self.check(kwargs.get('customDataSourceId'))
+        return super(FakeUploads, self).list(max_results, start_index, **kwargs)
+
+    def deleteUploadData(self, customDataSourceId=None, body=None, **kwargs):
+        ids = body.get('customDataImportUids')
+        self.deleted.append((customDataSourceId, ids))
+        self.items[:] = [item for item in self.items if item.get('id') not in ids]
+        return FakeRequest({}, self.calls)
+
+    def uploadData(self, customDataSourceId=None, media_body=None, **kwargs):
+        return FakeUploadRequest(self, customDataSourceId)
+
+    def get(self, uploadId=None, **kwargs):
+        return FakeRequest({'id': uploadId, 'status': self.status}, self.calls)
+
+
+class FakeManagementService(object):
+    """
+    Minimal stand-in for the v3 management service with 2 accounts, 3 properties and 4 views
+    """
+
+    def __init__(self):
+        self.calls = list()
+        self.accounts_ = FakeCollection([{'id': 'a1', 'name': 'A1'}, {'id': 'a2', 'name': 'A2'}], self.calls)
+        self.webproperties_ = FakeCollection([{'id': 'p1', 'name': 'P1', 'accountId': 'a1'},
+                                              {'id': 'p2', 'name': 'P2', 'accountId': 'a1'},
+                                              {'id': 'p3', 'name': 'P3', 'accountId': 'a2'}], self.calls)
+        self.profiles_ = FakeCollection([{'id': f'v{i}', 'name': f'V{i}', 'accountId': a, 'webPropertyId': p}
+                                         for i, (a, p) in enumerate([('a1', 'p1'), ('a1', 'p1'), ('a1', 'p2'),
+                                                                     ('a2', 'p3')])], self.calls)
+        self.uploads_ = FakeUploads([{'id': f'{d}-{i}', 'accountId': 'a1', 'webPropertyId': 'p1',
+                                      'customDataSourceId': d} for d in ('ds1', 'ds2') for i in range(5)],
+                                    self.calls, broken={'ds3'})
+
+    def management(self):
+        return self
+
+    def accounts(self):
+        return self.accounts_
+
+    def webproperties(self):
+        return self.webproperties_
+
+    def profiles(self):
+        return self.profiles_
+
+    def uploads(self):
+        return self.uploads_
+
+
+class FakeHttp(object):
+    """
+    Stand-in for httplib2.Http answering with the queued (headers, content) pairs. A queued exception is
+    raised instead, like a dropped connection. Sent requests are recorded in `requests`
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = list()
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        import httplib2
+
+        if hasattr(body, 'read'):
+            body = body.read()
+        self.requests.append((uri, method, body, dict(headers or {})))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        headers, content = response
+        return httplib2.Response(headers), content.encode('utf-8')
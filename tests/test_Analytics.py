@@ -1,10 +1,16 @@
 import unittest
 import sys
 import os
+import shutil
+import tempfile
 import apiclient
 import pandas as pd
 
-from googleAnalyticUtility.Analytics import GetGAData, Management
+from unittest import mock
+from googleAnalyticUtility.Analytics import GetGAData, Management, SyncState, DataImport, DataImportManager, \
+    RetryPolicy, UploadError, UploadTimeoutError
+from googleAnalyticUtility._helpers import discoveryDocument
+from tests.fakes import FakeService, FakeManagementService, FakeHttp, fakePayload
 
 
 class testAnalyticsAPI(unittest.TestCase):
@@ -132,5 +138,312 @@ class testAnalyticsAPI(unittest.TestCase):
         self.assertIsInstance(df, pd.DataFrame)
 
 
+class testGetGADataOffline(unittest.TestCase):
+    """
+    Test GetGAData against a fake reporting service
+    """
+
+    def setUp(self):
+        self.service = FakeService(pages=2)
+        patcher = mock.patch('googleAnalyticUtility.Analytics.reportService', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.analytics = GetGAData('2020-01-01', '2020-01-03')
+
+
+    def testConcurrentDaysKeepOrder(self):
+        """
+        """
+        payload = fakePayload()
+        serial = self.analytics.getData(payload, batch=False, verbose=False)
+        concurrent = self.analytics.getData(payload, batch=False, verbose=False, workers=3)
+        self.assertEqual(serial, concurrent)
+        self.assertEqual(payload, fakePayload())
+
+
+    def testIterDataPages(self):
+        """
+        """
+        pages = list(self.analytics.iterData(fakePayload(), batch=False, verbose=False))
+        self.assertEqual(len(pages), 6)
+        self.assertEqual(pages, [page for day in self.analytics.getData(fakePayload(), batch=False, verbose=False)
+                                 for page in [{'reports': [report]} for report in day.get('reports')]])
+
+
+    def testAbandonedIterDataLeavesPayload(self):
+        """
+        """
+        payload = fakePayload()
+        pages = self.analytics.iterData(payload, verbose=False)
+        next(pages)
+        next(pages)
+        pages.close()
+        self.assertEqual(payload, fakePayload())
+        data = self.analytics.getData(payload, verbose=False)
+        self.assertEqual(len(data[0].get('reports')), 2)
+        self.assertEqual(self.service.calls[-2:], [0, 1])
+
+
+    def testIterDataFrames(self):
+        """
+        """
+        frames = list(self.analytics.iterData(fakePayload(), batch=False, verbose=False, as_frame=True, typed=True))
+        df = pd.concat(frames, ignore_index=True)
+        self.assertEqual(df['ga:date'].tolist(), ['2020-01-03'] * 2 + ['2020-01-02'] * 2 + ['2020-01-01'] * 2)
+        self.assertEqual(df['ga:sessions'].sum(), 3)
+
+
+    def testPipelinedFrame(self):
+        """
+        """
+        df = self.analytics.getFrame(fakePayload(), batch=False, verbose=False, converters=3, queue_size=1)
+        frames = list(self.analytics.iterData(fakePayload(), batch=False, verbose=False, as_frame=True, typed=True))
+        expected = pd.concat(frames, ignore_index=True)
+        self.assertEqual(df['ga:date'].tolist(), expected['ga:date'].tolist())
+        self.assertEqual(df['ga:sessions'].tolist(), expected['ga:sessions'].tolist())
+        self.assertIsInstance(df['ga:date'].dtype, pd.CategoricalDtype)
+
+
+    def testCompactData(self):
+        """
+        """
+        store = self.analytics.getCompactData(fakePayload(), batch=False, verbose=False, memory_limit=0)
+        self.addCleanup(store.close)
+        self.assertEqual(store.rows, 6)
+        self.assertGreater(store.spilled_bytes, 0)
+        df = Management.dataToFrame(store)
+        expected = Management.dataToFrame(self.analytics.getData(fakePayload(), batch=False, verbose=False), True)
+        self.assertEqual(df['ga:date'].tolist(), expected['ga:date'].tolist())
+        self.assertEqual(df['ga:sessions'].tolist(), expected['ga:sessions'].tolist())
+
+
+    def testUnsampledSplitting(self):
+        """
+        """
+        self.service.max_unsampled_days = 4
+        analytics = GetGAData('2020-01-01', '2020-01-10')
+        data = analytics.getUnsampledData(fakePayload(), verbose=False)
+        ranges = [(r.get('startDate'), r.get('endDate')) for r in analytics.ranges_]
+        self.assertEqual(ranges, [('2020-01-01', '2020-01-03'), ('2020-01-04', '2020-01-05'),
+                                  ('2020-01-06', '2020-01-08'), ('2020-01-09', '2020-01-10')])
+        self.assertEqual(len(data), 4)
+        self.assertTrue(all(not r.get('sampled') and r.get('golden') for r in analytics.ranges_))
+
+
+    def testIncrementalSync(self):
+        """
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        state = SyncState(directory)
+        self.service.recent_dates = {'2020-01-03'}
+
+        data = self.analytics.getIncrementalData(fakePayload(), state, verbose=False)
+        self.assertEqual(self.analytics.dates_, ['2020-01-03', '2020-01-02', '2020-01-01'])
+        self.assertEqual(len(data), 3)
+
+        self.service.recent_dates = set()
+        analytics = GetGAData('2020-01-01', '2020-01-04')
+        data = analytics.getIncrementalData(fakePayload(), state, verbose=False, workers=2)
+        self.assertEqual(analytics.dates_, ['2020-01-04', '2020-01-03'])
+        self.assertEqual(len(data), 2)
+        self.assertEqual(analytics.getIncrementalData(fakePayload(), state, verbose=False), [])
+
+
+class testManagementOffline(unittest.TestCase):
+    """
+    Test Management against a fake management service
+    """
+
+    def setUp(self):
+        self.service = FakeManagementService()
+        patcher = mock.patch('googleAnalyticUtility.Analytics.managementService', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Management._account_cache.clear()
+
+
+    def testAccountTree(self):
+        """
+        """
+        accounts = Management().getAccountDetails().get('accounts')
+        self.assertEqual([a.get('account_id') for a in accounts], ['a1', 'a2'])
+        properties = accounts[0].get('account_properties')
+        self.assertEqual([p.get('property_id') for p in properties], ['p1', 'p2'])
+        self.assertEqual([v.get('view_id') for v in properties[0].get('property_views')], ['v0', 'v1'])
+        self.assertEqual(len(self.service.calls), 3)
+
+
+    def testPaginationAndCache(self):
+        """
+        """
+        with mock.patch('googleAnalyticUtility._helpers.MANAGEMENT_PAGE_SIZE', 1):
+            first = Management().getAccountDetails()
+        calls = len(self.service.calls)
+        self.assertEqual(calls, 2 + 3 + 4)
+        self.assertEqual(Management().getAccountDetails(), first)
+        self.assertEqual(len(self.service.calls), calls)
+        Management().getAccountDetails(refresh=True)
+        self.assertEqual(len(self.service.calls), calls + 3)
+
+
+    def testCachePerInjectedService(self):
+        """
+        """
+        Management().getAccountDetails()
+        other = FakeManagementService()
+        management = Management()
+        management.management_service = other
+        management.getAccountDetails()
+        self.assertEqual(len(other.calls), 3)
+
+        again = Management()
+        again.management_service = other
+        again.getAccountDetails()
+        self.assertEqual(len(other.calls), 3)
+        self.assertEqual(len(self.service.calls), 3)
+
+
+class testDataImportOffline(unittest.TestCase):
+    """
+    Test DataImport uploads against a fake http transport
+    """
+
+    def setUp(self):
+        patcher = mock.patch('googleAnalyticUtility.Analytics.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+    def dataImport(self, responses):
+        from googleapiclient.discovery import build_from_document
+
+        self.http = FakeHttp(responses)
+        data_import = DataImport('a' * 22, retry_policy=RetryPolicy(base_delay=0, jitter=False))
+        data_import._accountId, data_import._propertyId = '1', 'UA-1-1'
+        data_import._management = build_from_document(discoveryDocument('analytics', 'v3'), http=self.http).management()
+        return data_import
+
+
+    def uploaded(self):
+        return b''.join(body for _, method, body, _ in self.http.requests if method == 'PUT' and body)
+
+
+    def testChunkedUploadFromRows(self):
+        """
+        """
+        data_import = self.dataImport([
+            ({'status': '200', 'location': 'http://upload/1'}, ''),
+            ({'status': '308', 'range': 'bytes=0-19'}, ''),
+            ({'status': '200'}, '{"id": "uuuuuuuuuuuuuuuuuuuuuu"}'),
+            ({'status': '200'}, '{"status": "PENDING"}'),
+            ({'status': '200'}, '{"status": "PENDING"}'),
+            ({'status': '200'}, '{"status": "COMPLETED"}'),
+        ])
+        progress = list()
+        rows = iter([('ga:dimension1', 'ga:metric1'), ('a', 1), 'b,2'])
+        result = data_import.uploadData(data=rows, chunk_size=20, on_progress=lambda *args: progress.append(args))
+
+        self.assertEqual(result, 'Upload Success: COMPLETED')
+        self.assertEqual(self.uploaded(), b'ga:dimension1,ga:metric1\na,1\nb,2\n')
+        self.assertEqual(progress, [(20, 33), (33, 33)])
+        ranges = [headers.get('Content-Range') for _, method, _, headers in self.http.requests if method == 'PUT']
+        self.assertEqual(ranges, ['bytes 0-19/*', 'bytes 20-32/33'])
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [1, 2, 4])
+
+
+    def testUploadTimeout(self):
+        """
+        """
+        data_import = self.dataImport([
+            ({'status': '200', 'location': 'http://upload/1'}, ''),
+            ({'status': '200'}, '{"id": "uuuuuuuuuuuuuuuuuuuuuu"}'),
+            ({'status': '200'}, '{"id": "uuuuuuuuuuuuuuuuuuuuuu", "status": "PENDING"}'),
+        ])
+        result = data_import.uploadData(data=[('ga:dimension1', 'ga:metric1'), ('a', 1)], timeout=0)
+        self.assertEqual(result, 'Upload Timeout: uuuuuuuuuuuuuuuuuuuuuu still PENDING after 0 seconds')
+
+
+    def testResumeAfterDroppedChunk(self):
+        """
+        """
+        df = pd.DataFrame({'ga:dimension1': ['a', 'b'], 'ga:metric1': [1, 2]})
+        content = df.to_csv(index=False).encode('utf-8')
+        data_import = self.dataImport([
+            ({'status': '200', 'location': 'http://upload/1'}, ''),
+            ConnectionError('reset'),
+            ({'status': '308', 'range': 'bytes=0-3'}, ''),
+            ({'status': '200'}, '{"id": "uuuuuuuuuuuuuuuuuuuuuu"}'),
+            ({'status': '200'}, '{"status": "FAILED", "errors": ["bad header"]}'),
+        ])
+        result = data_import.uploadData(data=df, chunk_size=len(content))
+
+        self.assertEqual(result, "Upload Failed: ['bad header']")
+        puts = [(body, headers) for _, method, body, headers in self.http.requests if method == 'PUT']
+        self.assertEqual(puts[1][1].get('Content-Range'), f'bytes */{len(content)}')
+        self.assertEqual(puts[2][0], content[4:])
+        self.assertEqual(puts[2][1].get('Content-Range'), f'bytes 4-{len(content) - 1}/{len(content)}')
+
+
+class testDataImportManagerOffline(unittest.TestCase):
+    """
+    Test bulk DataImport operations against a fake management service
+    """
+
+    def setUp(self):
+        self.service = FakeManagementService()
+        for target in ('googleAnalyticUtility.Analytics.managementService',
+                       'googleAnalyticUtility.Analytics.time.sleep'):
+            patcher = mock.patch(target, return_value=self.service)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.manager = DataImportManager('a1', 'p1', workers=3, delete_batch_size=2)
+
+
+    def testListAndDelete(self):
+        """
+        """
+        with mock.patch('googleAnalyticUtility._helpers.MANAGEMENT_PAGE_SIZE', 2):
+            results = self.manager.listUploads(['ds1', 'ds2', 'ds3'])
+        self.assertEqual(list(results), ['ds1', 'ds2', 'ds3'])
+        self.assertEqual(len(results['ds1'].result), 5)
+        self.assertFalse(results['ds3'].ok)
+        self.assertEqual(int(results['ds3'].error.resp.status), 404)
+
+        results = self.manager.deleteUploads({'ds1': None, 'ds2': ['ds2-0']})
+        self.assertEqual(results['ds1'].result, 5)
+        self.assertEqual(sorted(len(ids) for ds, ids in self.service.uploads_.deleted if ds == 'ds1'), [1, 2, 2])
+        self.assertEqual([item.get('id') for item in self.service.uploads_.items],
+                         ['ds2-1', 'ds2-2', 'ds2-3', 'ds2-4'])
+
+
+    def testReplace(self):
+        """
+        """
+        results = self.manager.replaceData({'ds1': [('ga:dimension1', 'ga:metric1'), ('a', 1)], 'ds3': 'costs.csv'})
+        self.assertEqual(results['ds1'].result.get('deleted'), 5)
+        self.assertEqual(results['ds1'].result.get('status').get('status'), 'COMPLETED')
+        self.assertFalse(results['ds3'].ok)
+        self.assertGreaterEqual(results['ds1'].seconds, 0)
+        remaining = [item.get('id') for item in self.service.uploads_.items if item.get('customDataSourceId') == 'ds1']
+        self.assertEqual(remaining, ['ds1-new'])
+
+
+    def testReplaceKeepsDataOfPendingUploads(self):
+        """
+        """
+        self.service.uploads_.status = 'PENDING'
+        results = self.manager.replaceData({'ds1': [('ga:dimension1', 'ga:metric1'), ('a', 1)]}, timeout=0)
+        self.assertIsInstance(results['ds1'].error, UploadTimeoutError)
+        self.assertEqual(self.service.uploads_.deleted, [])
+
+        self.service.uploads_.status = 'DELETED'
+        results = self.manager.replaceData({'ds1': [('ga:dimension1', 'ga:metric1'), ('a', 1)]})
+        self.assertIsInstance(results['ds1'].error, UploadError)
+        self.assertEqual(self.service.uploads_.deleted, [])
+
+
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import asyncio
+
+from unittest import mock
+from benchmarks.fake_api import FakeGAServer
+from googleAnalyticUtility.Analytics import AsyncGetGAData, GetGAData, Management, RetryPolicy
+from tests.fakes import FakeService, fakePayload
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+
+class FakeReportingServer(object):
+    """
+    Local aiohttp stand-in for the reports:batchGet endpoint, answering with FakeService reports after
+    `latency` seconds. The first `errors` requests get a 503.
+    """
+
+    def __init__(self, pages=2, latency=0, errors=0):
+        self.service = FakeService(pages=pages)
+        self.latency = latency
+        self.errors = errors
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def batchGet(self, request):
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.errors > 0:
+                self.errors -= 1
+                return web.json_response({'error': {'code': 503}}, status=503)
+            body = await request.json()
+            return web.json_response({'reports': [self.service.report(r) for r in body.get('reportRequests')]})
+        finally:
+            self.in_flight -= 1
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v4/reports:batchGet', self.batchGet)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return f'http://127.0.0.1:{port}/v4/reports:batchGet'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+@unittest.skipIf(web is None, 'aiohttp is not installed')
+class testAsyncGetGAData(unittest.IsolatedAsyncioTestCase):
+    """
+    Test the asyncio client against a local fake of the reporting API
+    """
+
+    async def asyncSetUp(self):
+        self.server = FakeReportingServer(pages=2, latency=0.01)
+        self.endpoint = await self.server.start()
+
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+
+    def client(self, **kwargs):
+        return AsyncGetGAData('2020-01-01', '2020-01-05', endpoint=self.endpoint, token=lambda: 'token', **kwargs)
+
+
+    async def testSameFramesAsSync(self):
+        """
+        """
+        async with self.client(workers=3) as analytics:
+            data = await analytics.getData(fakePayload(), batch=False)
+
+        with mock.patch('googleAnalyticUtility.Analytics.reportService', return_value=FakeService(pages=2)):
+            expected = GetGAData('2020-01-01', '2020-01-05').getData(fakePayload(), batch=False, verbose=False)
+
+        self.assertTrue(Management.dataToFrame(data, typed=True).equals(Management.dataToFrame(expected, typed=True)))
+        self.assertLessEqual(self.server.max_in_flight, 3)
+
+
+    async def testManyViewsShareWorkers(self):
+        """
+        """
+        async with self.client(workers=2) as analytics:
+            data = await analytics.getManyData([fakePayload('1'), fakePayload('2')], batch=False)
+        self.assertEqual([len(d) for d in data], [5, 5])
+        self.assertEqual(self.server.requests, 20)
+        self.assertEqual(self.server.max_in_flight, 2)
+
+
+    async def testRetry(self):
+        """
+        """
+        self.server.errors = 2
+        async with self.client(retry_policy=RetryPolicy(base_delay=0.01)) as analytics:
+            data = await analytics.getData(fakePayload())
+            self.assertEqual(analytics.retry_policy.stats().get('retries'), 2)
+        self.assertEqual(len(data[0].get('reports')), 2)
+
+
+    async def testCancellation(self):
+        """
+        """
+        self.server.latency = 0.2
+        async with self.client(workers=2) as analytics:
+            task = asyncio.ensure_future(analytics.getData(fakePayload(), batch=False))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            await asyncio.sleep(0.3)
+        self.assertEqual(self.server.requests, 2)
+
+
+    async def testCohorts(self):
+        """
+        """
+        payload = GetGAData().formatPayload([], ['ga:cohortActiveUsers'], view_id='100000',
+                                            cohorts=[('week 1', '2020-01-01', '2020-01-07'),
+                                                     ('week 2', '2020-01-08', '2020-01-14')])
+        with FakeGAServer(rows_per_day=5) as server:
+            async with AsyncGetGAData('2020-01-01', '2020-01-05', endpoint=f'{server.url}/v4/reports:batchGet',
+                                      token=lambda: 'token') as analytics:
+                with mock.patch('builtins.print'):
+                    data = await analytics.getData(payload, batch=False, verbose=True)
+                many = await analytics.getManyData([payload, payload], batch=False)
+        self.assertEqual(len(data), 1)
+        self.assertEqual([len(d) for d in many], [1, 1])
+        self.assertEqual(sorted(Management.dataToFrame(data)['ga:cohort'].unique()), ['week 1', 'week 2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
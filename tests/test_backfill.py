@@ -0,0 +1,173 @@
+import functools
+import os
+import pickle
+import tempfile
+import time
+import unittest
+
+from benchmarks.fake_api import FakeGAServer, fakeService
+from googleAnalyticUtility.Analytics import GetGAData, BackfillRunner, LeaseQueue, SharedRateLimiter, WorkUnit, \
+    workUnits, QuotaExhaustedError, RateLimiter, RetryPolicy
+from googleAnalyticUtility.__main__ import main
+
+
+class testBackfill(unittest.TestCase):
+    """
+    Run backfills on process pools against the local fake of the reporting API
+    """
+
+    def setUp(self):
+        self.server = FakeGAServer(rows_per_day=20)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.output = os.path.join(self.directory.name, 'dataset')
+        self.payload = GetGAData('2020-01-01', '2020-01-01').formatPayload(['ga:date', 'ga:browser'],
+                                                                          ['ga:sessions'], view_id='100000')
+        self.service_factory = functools.partial(fakeService, self.server.url, 'analyticsreporting', 'v4')
+
+
+    def runner(self, **kwargs):
+        return BackfillRunner(self.payload, ['100000', '100001'], '2020-01-01', '2020-01-04', self.output,
+                              processes=2, service_factory=self.service_factory,
+                              retry_policy=RetryPolicy(base_delay=0, jitter=False), **kwargs)
+
+
+    def testWorkUnits(self):
+        """
+        """
+        units = workUnits(['1', '2'], '2020-01-01', '2020-01-05', days_per_unit=2)
+        self.assertEqual(units[:2], [WorkUnit('1', '2020-01-04', '2020-01-05'),
+                                     WorkUnit('2', '2020-01-04', '2020-01-05')])
+        self.assertEqual([unit.date for unit in units[::2]], ['2020-01-04_2020-01-05', '2020-01-02_2020-01-03',
+                                                             '2020-01-01'])
+
+
+    def testProcessPool(self):
+        """
+        """
+        summary = self.runner(days_per_unit=2).run(verbose=False)
+        self.assertEqual(summary.get('done'), 4)
+        self.assertEqual(summary.get('rows'), 2 * 4 * 20)
+        self.assertEqual(summary.get('failed'), {})
+        df = self.runner().toFrame()
+        self.assertEqual(len(df), 160)
+        self.assertEqual(sorted(df['view_id'].astype(str).unique()), ['100000', '100001'])
+        self.assertEqual(sorted(df['ga:date'].astype(str).unique()),
+                         ['20200101', '20200102', '20200103', '20200104'])
+
+        requests = self.server.requests
+        self.assertEqual(self.runner(days_per_unit=2).run(verbose=False).get('done'), 0)
+        self.assertEqual(self.server.requests, requests)
+
+
+    def testLeaseQueue(self):
+        """
+        """
+        queue_dir = os.path.join(self.directory.name, 'queue')
+        queue = LeaseQueue(queue_dir, lease_seconds=60)
+        self.assertEqual(queue.populate(self.runner().units()), 8)
+        self.assertEqual(queue.populate(self.runner().units()), 0)
+
+        # a unit leased by a worker that died is leased again once its lease expires
+        unit = queue.lease()
+        os.utime(os.path.join(queue_dir, 'leased', f'{unit.key}.json'), (time.time() - 120, time.time() - 120))
+        summary = self.runner(queue_dir=queue_dir, lease_seconds=60).run(verbose=False)
+        self.assertEqual(summary.get('done'), 8)
+        self.assertEqual(summary.get('queue'), {'pending': 0, 'leased': 0, 'done': 8, 'failed': 0})
+        self.assertEqual(len(self.runner().toFrame()), 160)
+
+
+    def testRejectsUnsharedRateLimiter(self):
+        """
+        """
+        with self.assertRaises(ValueError):
+            self.runner(rate_limiter=RateLimiter(10))
+        limiter = SharedRateLimiter(os.path.join(self.directory.name, 'quota.json'), view_rps=10)
+        self.assertIs(self.runner(rate_limiter=limiter).rate_limiter, limiter)
+
+
+    def testFailedUnits(self):
+        """
+        """
+        queue = LeaseQueue(os.path.join(self.directory.name, 'queue'), max_attempts=2)
+        queue.populate([WorkUnit('1', '2020-01-01', '2020-01-01')])
+        for _ in range(2):
+            unit = queue.lease()
+            queue.fail(unit, ValueError('broken'))
+        self.assertIsNone(queue.lease())
+        self.assertEqual(queue.counts().get('failed'), 1)
+
+
+    def testLostLeases(self):
+        """
+        """
+        queue = LeaseQueue(os.path.join(self.directory.name, 'queue'), lease_seconds=60, max_attempts=1)
+        queue.populate([WorkUnit('1', '2020-01-01', '2020-01-01'), WorkUnit('1', '2020-01-02', '2020-01-02')])
+        for _ in range(3):
+            self.assertTrue(queue.release(queue.lease()))
+        self.assertEqual(queue.counts().get('pending'), 2)
+
+        # a lease reclaimed by another worker is neither completed nor failed by its former holder
+        unit = queue.lease()
+        os.utime(os.path.join(queue.directory, 'leased', f'{unit.key}.json'), (time.time() - 120, time.time() - 120))
+        other = LeaseQueue(queue.directory, lease_seconds=60)
+        self.assertEqual(other.lease(), unit)
+        self.assertTrue(other.complete(unit))
+        self.assertFalse(queue.complete(unit))
+        self.assertFalse(queue.fail(unit, ValueError('late')))
+        self.assertFalse(queue.release(unit))
+        self.assertEqual(queue.counts(), {'pending': 1, 'leased': 0, 'done': 1, 'failed': 0})
+
+
+    def testSharedQuota(self):
+        """
+        """
+        limiter = SharedRateLimiter(os.path.join(self.directory.name, 'quota.json'), view_rps=None,
+                                    view_daily_quota=3)
+        copy = pickle.loads(pickle.dumps(limiter))
+        limiter.acquire('1')
+        copy.acquire('1')
+        copy.acquire('2')
+        self.assertEqual(limiter.usage().get('views'), {'1': 2, '2': 1})
+        limiter.acquire('1')
+        with self.assertRaises(QuotaExhaustedError):
+            copy.acquire('1')
+
+        limiter = SharedRateLimiter(os.path.join(self.directory.name, 'rate.json'), view_rps=20)
+        start = time.perf_counter()
+        for _ in range(5):
+            pickle.loads(pickle.dumps(limiter)).acquire('1')
+        self.assertGreaterEqual(time.perf_counter() - start, 4 / 20)
+
+
+    def testQuotaStopsBackfill(self):
+        """
+        """
+        limiter = SharedRateLimiter(os.path.join(self.directory.name, 'quota.json'), view_rps=None,
+                                    project_daily_quota=3)
+        summary = self.runner(rate_limiter=limiter).run(verbose=False)
+        self.assertEqual(summary.get('done'), 3)
+        self.assertEqual(len(summary.get('failed')), 5)
+        self.assertIn('QuotaExhaustedError', list(summary.get('failed').values())[0])
+
+        queue_dir = os.path.join(self.directory.name, 'queue')
+        limiter = SharedRateLimiter(os.path.join(self.directory.name, 'queue_quota.json'), view_rps=None,
+                                    project_daily_quota=0)
+        summary = self.runner(rate_limiter=limiter, queue_dir=queue_dir, max_attempts=1).run(verbose=False)
+        self.assertEqual(summary.get('done'), 0)
+        self.assertEqual(summary.get('queue'), {'pending': 8, 'leased': 0, 'done': 0, 'failed': 0})
+
+
+    def testCommandLine(self):
+        """
+        """
+        self.assertEqual(main([]), 2)
+        with self.assertRaises(SystemExit):
+            main(['backfill', '--views', '1', '--start-date', '2020-01-01', '--end-date', '2020-01-01',
+                  '--output', self.output])
+
+
+if __name__ == '__main__':
+    unittest.main()
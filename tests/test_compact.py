@@ -0,0 +1,64 @@
+import os
+import unittest
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from googleAnalyticUtility._compact import CompactStore
+from googleAnalyticUtility._convert import reportsToFrame
+from tests.test_convert import fakeReport
+
+
+class testCompactStore(unittest.TestCase):
+    """
+    Test the compact representation of report pages
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.reports = [fakeReport([(('mobile',), ('10', '50.5')), (('desktop',), ('3', '12.0'))]),
+                        fakeReport([(('mobile',), ('1', '0.0'))]),
+                        fakeReport([(('a', 'b'), ('2', 'x'))], dimensions=('ga:browser', 'ga:city'),
+                                   metrics=(('ga:users', 'INTEGER'), ('ga:custom', 'STRING'))),
+                        fakeReport([])]
+
+
+    def assertSameFrame(self, store):
+        expected = reportsToFrame(self.reports, typed=True)
+        df = store.toFrame()
+        self.assertEqual(list(df.columns), list(expected.columns))
+        for name in expected.columns:
+            self.assertEqual(df[name].astype(object).fillna('').tolist(),
+                             expected[name].astype(object).fillna('').tolist())
+        self.assertEqual(df['ga:sessions'].dtype, np.float64)
+        self.assertIsInstance(df['ga:deviceCategory'].dtype, pd.CategoricalDtype)
+
+
+    def testEncoding(self):
+        """
+        """
+        store = CompactStore(spill_dir=self.directory)
+        store.extend([{'reports': self.reports[:2]}, {'reports': self.reports[2:]}])
+        self.assertEqual(store.rows, 4)
+        self.assertEqual(store.spilled_bytes, 0)
+        self.assertSameFrame(store)
+        self.assertEqual(store.toFrame()['ga:deviceCategory'].cat.categories.tolist(), ['mobile', 'desktop'])
+
+
+    def testSpill(self):
+        """
+        """
+        with CompactStore(memory_limit=16, spill_dir=self.directory) as store:
+            for report in self.reports:
+                store.appendReport(report)
+            self.assertLessEqual(store.memory_bytes, 16)
+            self.assertGreater(store.spilled_bytes, 0)
+            self.assertTrue(os.listdir(self.directory))
+            self.assertSameFrame(store)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+import threading
+from unittest import mock
+
+from googleAnalyticUtility._convert import reportsToFrame, pivotToFrame, pipelinedFrame
+
+
+def fakeReport(rows, dimensions=('ga:deviceCategory',), metrics=(('ga:sessions', 'INTEGER'),
+                                                                  ('ga:bounceRate', 'PERCENT'))):
+    return {
+        'columnHeader': {
+            'dimensions': list(dimensions),
+            'metricHeader': {'metricHeaderEntries': [{'name': n, 'type': t} for n, t in metrics]}
+        },
+        'data': {'rows': [{'dimensions': list(d), 'metrics': [{'values': list(m)}]} for d, m in rows]}
+    }
+
+
+def fakePivotReport(rows, groups, metrics=(('ga:sessions', 'INTEGER'), ('ga:bounceRate', 'PERCENT'))):
+    report = fakeReport([(dims, ('0',)) for dims, _ in rows], metrics=(('ga:users', 'INTEGER'),))
+    report['columnHeader']['metricHeader']['pivotHeaders'] = [{'pivotHeaderEntries': [
+        {'dimensionNames': ['ga:browser'], 'dimensionValues': [group], 'metric': {'name': n, 'type': t}}
+        for group in groups for n, t in metrics]}]
+    for row, (_, values) in zip(report['data']['rows'], rows):
+        row['metrics'][0]['pivotValueRegions'] = [{'values': list(values)}]
+    return report
+
+
+class testDataToFrame(unittest.TestCase):
+    """
+    Test the conversion of raw reports to dataframes
+    """
+
+    def setUp(self):
+        self.reports = [fakeReport([(('mobile',), ('10', '50.5')), (('desktop',), ('3', '12.0'))]),
+                        fakeReport([(('tablet',), ('1', '0.0'))])]
+
+
+    def testUntypedValues(self):
+        """
+        """
+        df = reportsToFrame(self.reports, typed=False)
+        self.assertEqual(list(df.columns), ['ga:deviceCategory', 'ga:sessions', 'ga:bounceRate'])
+        self.assertEqual(df['ga:sessions'].tolist(), ['10', '3', '1'])
+        self.assertEqual(df['ga:deviceCategory'].tolist(), ['mobile', 'desktop', 'tablet'])
+
+
+    def testTypedValues(self):
+        """
+        """
+        df = reportsToFrame(self.reports, typed=True)
+        self.assertEqual(df['ga:sessions'].dtype, np.int64)
+        self.assertEqual(df['ga:bounceRate'].dtype, np.float64)
+        self.assertIsInstance(df['ga:deviceCategory'].dtype, pd.CategoricalDtype)
+        self.assertEqual(df['ga:sessions'].sum(), 14)
+
+
+    def testMixedHeadersAndEmptyReports(self):
+        """
+        """
+        other = fakeReport([(('a', 'b'), ('2',))], dimensions=('ga:browser', 'ga:city'),
+                           metrics=(('ga:users', 'INTEGER'),))
+        empty = fakeReport([])
+        del empty['data']['rows']
+        df = reportsToFrame(self.reports + [other, empty], typed=True)
+        self.assertEqual(len(df), 4)
+        self.assertIn('ga:users', df.columns)
+
+
+
+class testPivotToFrame(unittest.TestCase):
+    """
+    Test the conversion of pivot columns to long dataframes
+    """
+
+    def testLongFormat(self):
+        """
+        """
+        reports = [fakePivotReport([(('mobile',), ('1', '10.0', '2', '20.0')),
+                                    (('desktop',), ('3', '30.0', '4', '40.0'))], ['Chrome', 'Safari']),
+                   fakePivotReport([(('tablet',), ('5', '50.0'))], ['Edge'])]
+        df = pivotToFrame(reports, typed=True)
+        self.assertEqual(list(df.columns), ['ga:deviceCategory', 'ga:browser', 'ga:sessions', 'ga:bounceRate'])
+        self.assertEqual(df['ga:deviceCategory'].tolist(), ['mobile', 'mobile', 'desktop', 'desktop', 'tablet'])
+        self.assertEqual(df['ga:browser'].tolist(), ['Chrome', 'Safari', 'Chrome', 'Safari', 'Edge'])
+        self.assertEqual(df['ga:sessions'].tolist(), [1, 2, 3, 4, 5])
+        self.assertEqual(df['ga:bounceRate'].dtype, np.float64)
+        self.assertIsInstance(df['ga:browser'].dtype, pd.CategoricalDtype)
+
+        df = pivotToFrame(reports[:1], typed=False)
+        self.assertEqual(df['ga:sessions'].tolist(), ['1', '2', '3', '4'])
+        with self.assertRaises(ValueError):
+            pivotToFrame(reports, pivot=1)
+
+
+class testPipelinedFrame(unittest.TestCase):
+    """
+    Test the conversion of pages while they are being fetched
+    """
+
+    def testBoundedQueue(self):
+        """
+        """
+        produced = list()
+        release = threading.Event()
+        reports = [fakeReport([((f'd{i}',), (str(i), '1.0'))]) for i in range(20)]
+
+        def pages():
+            for i, report in enumerate(reports):
+                produced.append(i)
+                yield {'reports': [report]}
+
+        def slowConvert(page_reports, typed):
+            release.wait(5)
+            return reportsToFrame(page_reports, typed)
+
+        def unblock():
+            # converters are stuck so the producer stops once the queue is full
+            in_flight.append(len(produced))
+            release.set()
+
+        in_flight = list()
+        timer = threading.Timer(0.3, unblock)
+        timer.start()
+        with mock.patch('googleAnalyticUtility._convert.reportsToFrame', side_effect=slowConvert):
+            df = pipelinedFrame(pages(), converters=2, queue_size=2)
+        timer.join()
+        self.assertLessEqual(in_flight[0], 2 + 2 + 1)
+        self.assertEqual(df['ga:sessions'].tolist(), list(range(20)))
+        self.assertIsInstance(df['ga:deviceCategory'].dtype, pd.CategoricalDtype)
+
+
+    def testErrorsPropagate(self):
+        """
+        """
+        def pages():
+            yield {'reports': [fakeReport([(('a',), ('1', '1.0'))])]}
+            raise ConnectionError('lost')
+
+        with self.assertRaises(ConnectionError):
+            pipelinedFrame(pages())
+        with self.assertRaises(ValueError):
+            pipelinedFrame([{'reports': [fakeReport([(('a',), ('x', '1.0'))])]}] * 10, queue_size=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from googleAnalyticUtility.Analytics import ChangeTracker, Management, diffFrames
+from tests.test_convert import fakeReport
+
+
+def frame(rows, typed=True):
+    report = fakeReport([((date, device), values) for date, device, *values in rows],
+                        dimensions=('ga:date', 'ga:deviceCategory'))
+    return Management.dataToFrame([{'reports': [report]}], typed)
+
+
+class testDiffFrames(unittest.TestCase):
+    """
+    Test the change data diff between pulls of a report
+    """
+
+    def setUp(self):
+        self.old = frame([('20200101', 'mobile', '10', '50.0'), ('20200101', 'desktop', '3', '12.0'),
+                          ('20200102', 'mobile', '7', '20.0'), ('20200102', 'tablet', '1', '0.0')])
+        self.new = frame([('20200102', 'mobile', '8', '20.0'), ('20200102', 'desktop', '2', '10.0'),
+                          ('20200101', 'mobile', '10', '50.0'), ('20200101', 'desktop', '3', '12.0')])
+        self.keys = ['ga:date', 'ga:deviceCategory']
+
+
+    def testChanges(self):
+        """
+        """
+        diff = diffFrames(self.old, self.new, self.keys)
+        self.assertEqual(diff.counts(), {'inserts': 1, 'updates': 1, 'deletes': 1})
+        self.assertEqual(diff.inserts['ga:deviceCategory'].tolist(), ['desktop'])
+        self.assertEqual(diff.updates['ga:sessions'].tolist(), [8])
+        self.assertEqual(diff.deletes['ga:deviceCategory'].tolist(), ['tablet'])
+        self.assertEqual(diff.changes()['op'].tolist(), ['insert', 'update', 'delete'])
+
+        applied = diff.apply(self.old).sort_values(self.keys).reset_index(drop=True)
+        expected = self.new.sort_values(self.keys).reset_index(drop=True)
+        self.assertEqual(applied.astype(str).values.tolist(), expected.astype(str).values.tolist())
+        self.assertTrue(diffFrames(self.new, self.new, self.keys).empty)
+
+
+    def testScopeAndErrors(self):
+        """
+        """
+        recent = self.new[self.new['ga:date'] == '20200102']
+        diff = diffFrames(self.old, recent, self.keys, scope_column='ga:date')
+        self.assertEqual(diff.counts(), {'inserts': 1, 'updates': 1, 'deletes': 1})
+        self.assertEqual(len(diff.apply(self.old)), 4)
+
+        with self.assertRaises(ValueError):
+            diffFrames(self.old, self.new, ['ga:date'])
+        with self.assertRaises(ValueError):
+            diffFrames(self.old, self.new.drop(columns=['ga:bounceRate']), self.keys)
+
+
+    def testTracker(self):
+        """
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        tracker = ChangeTracker(directory.name)
+        payload = {'reportRequests': [{'viewId': '1', 'dateRanges': [{'startDate': '2020-01-01'}],
+                                       'dimensions': [{'name': 'ga:date'}, {'name': 'ga:deviceCategory'}],
+                                       'metrics': [{'expression': 'ga:sessions'}]}]}
+        self.assertEqual(tracker.diff(payload, self.old).counts(), {'inserts': 4, 'updates': 0, 'deletes': 0})
+
+        other_dates = dict(payload, reportRequests=[dict(payload['reportRequests'][0],
+                                                         dateRanges=[{'startDate': '2020-01-02'}])])
+        diff = tracker.diff(other_dates, self.new, commit=False)
+        self.assertEqual(diff.counts(), {'inserts': 1, 'updates': 1, 'deletes': 1})
+        self.assertEqual(tracker.diff(payload, self.new).counts(), {'inserts': 1, 'updates': 1, 'deletes': 1})
+        self.assertTrue(tracker.diff(payload, self.new).empty)
+        self.assertIsInstance(tracker.load(payload)['ga:sessions'].dtype, np.dtype)
+        self.assertIsInstance(tracker.load(payload)['ga:date'].dtype, pd.CategoricalDtype)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+from unittest import mock
+
+from benchmarks.fake_api import FakeGAServer
+from googleAnalyticUtility.Analytics import GetGAData, Management, DataImport, RetryPolicy
+
+
+class testFakeGAServer(unittest.TestCase):
+    """
+    Run the clients end to end, through googleapiclient and HTTP, against the local fake of the Google
+    Analytics APIs used by the benchmarks
+    """
+
+    def setUp(self):
+        self.server = FakeGAServer(rows_per_day=25, error_rate=0.2, seed=3)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.retry_policy = RetryPolicy(base_delay=0, jitter=False, max_attempts=10)
+
+
+    def testReports(self):
+        """
+        """
+        analytics = GetGAData('2020-01-01', '2020-01-04', retry_policy=self.retry_policy)
+        analytics.report_service = self.server.reportService()
+        payload = analytics.formatPayload(['ga:date', 'ga:browser'], ['ga:sessions'], view_id='100000')
+        payload.get('reportRequests')[0].update({'pageSize': 10})
+
+        df = Management.dataToFrame(analytics.getData(payload, batch=False, verbose=False), typed=True)
+        self.assertEqual(len(df), 100)
+        self.assertEqual(sorted(df['ga:date'].unique()), ['20200101', '20200102', '20200103', '20200104'])
+        self.assertGreater(self.server.errors, 0)
+        self.assertEqual(self.server.rows, 100)
+
+
+    def testWorkerServices(self):
+        """
+        """
+        payload = GetGAData().formatPayload(['ga:date', 'ga:browser'], ['ga:sessions'], view_id='100000')
+        injected = GetGAData('2020-01-01', '2020-01-04', retry_policy=self.retry_policy)
+        injected.report_service = self.server.reportService()
+        built = GetGAData('2020-01-01', '2020-01-04', retry_policy=self.retry_policy,
+                          service_factory=self.server.reportService)
+        serial = injected.getData(payload, batch=False, verbose=False)
+        with mock.patch('googleAnalyticUtility.Analytics.reportService', side_effect=AssertionError):
+            self.assertEqual(injected.getData(payload, batch=False, verbose=False, workers=2), serial)
+            self.assertEqual(built.getData(payload, batch=False, verbose=False, workers=3), serial)
+        self.assertEqual(self.server.rows, 3 * 100)
+
+
+    def testPivotsAndCohorts(self):
+        """
+        """
+        analytics = GetGAData('2020-01-01', '2020-01-04', retry_policy=self.retry_policy)
+        analytics.report_service = self.server.reportService()
+        payload = analytics.formatPayload(['ga:deviceCategory'], ['ga:sessions'], view_id='100000',
+                                          pivots=[(['ga:browser'], ['ga:users', 'ga:pageviews'], 3)],
+                                          order_bys=[('ga:sessions', 'DESCENDING')], hide_totals=True)
+        data = analytics.getData(payload, verbose=False)
+        df = Management.pivotToFrame(data, typed=True)
+        self.assertEqual(len(df), 100 * 3)
+        self.assertEqual(list(df.columns), ['ga:deviceCategory', 'ga:browser', 'ga:users', 'ga:pageviews'])
+        self.assertEqual(sorted(df['ga:browser'].unique()), ['browser-0', 'browser-1', 'browser-2'])
+        self.assertEqual(len(Management.dataToFrame(data)), 100)
+
+        payload = analytics.formatPayload([], ['ga:cohortActiveUsers'], view_id='100000',
+                                          cohorts=[('week 1', '2020-01-01', '2020-01-07'),
+                                                   ('week 2', '2020-01-08', '2020-01-14')])
+        data = analytics.getData(payload, batch=False, verbose=False)
+        self.assertEqual(len(data), 1)
+        df = Management.dataToFrame(data)
+        self.assertEqual(sorted(df['ga:cohort'].unique()), ['week 1', 'week 2'])
+
+
+    def testManagementAndUploads(self):
+        """
+        """
+        management = Management(retry_policy=self.retry_policy)
+        management.management_service = self.server.managementService()
+        accounts = management.getAccountDetails(refresh=True).get('accounts')
+        self.assertEqual(len(accounts), 2)
+        Management._account_cache.clear()
+
+        data_import = DataImport('d' * 22, retry_policy=self.retry_policy, account_id='1000', property_id='UA-1000-1')
+        data_import._management = self.server.managementService().management()
+        rows = [('ga:dimension1', 'ga:metric1')] + [(f'value{i}', i) for i in range(5000)]
+        self.assertEqual(data_import.uploadData(data=rows, chunk_size=256 * 1024, poll_delay=0),
+                         'Upload Success: COMPLETED')
+        self.assertEqual(len(data_import.listUploads()), 1)
+        data_import.deleteUploads([upload.get('id') for upload in data_import.listUploads()])
+        self.assertEqual(data_import.listUploads(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import httplib2
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+from apiclient.errors import HttpError
+from apiclient.http import HttpRequest
+from googleAnalyticUtility._helpers import TokenBucket, RateLimiter, QuotaExhaustedError, RetryPolicy, \
+    datePayload, execute, fetchPacked, discoveryDocument, ServiceRegistry
+from tests.fakes import FakeService, fakePayload
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Answer with the (status, body) pairs queued in `responses`, then with a 200
+    """
+    responses = list()
+
+    def do_GET(self):
+        status, body = self.responses.pop(0) if self.responses else (200, {'ok': True})
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class testRateLimiter(unittest.TestCase):
+    """
+    Test the token bucket and rate limiter used to throttle API calls
+    """
+
+    def testBucketBurst(self):
+        """
+        """
+        bucket = TokenBucket(rate=1000, capacity=5)
+        waited = sum(bucket.acquire() for _ in range(5))
+        self.assertEqual(waited, 0)
+
+
+    def testBucketRate(self):
+        """
+        """
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+    def testViewDailyQuota(self):
+        """
+        """
+        limiter = RateLimiter(view_rps=None, view_daily_quota=2)
+        limiter.acquire('1')
+        limiter.acquire('1')
+        limiter.acquire('2')
+        with self.assertRaises(QuotaExhaustedError):
+            limiter.acquire('1')
+        self.assertEqual(limiter.usage().get('project'), 3)
+
+
+    def testProjectDailyQuota(self):
+        """
+        """
+        limiter = RateLimiter(view_rps=None, project_daily_quota=1)
+        limiter.acquire()
+        with self.assertRaises(QuotaExhaustedError):
+            limiter.acquire('1')
+
+
+class testRetryPolicy(unittest.TestCase):
+    """
+    Test the retry policy against a local HTTP server
+    """
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FlakyHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.uri = f'http://127.0.0.1:{self.server.server_port}/'
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def request(self):
+        return HttpRequest(httplib2.Http(), lambda resp, content: json.loads(content), self.uri)
+
+
+    def testRetryTransientErrors(self):
+        """
+        """
+        rate_limit = {'error': {'errors': [{'reason': 'rateLimitExceeded'}]}}
+        FlakyHandler.responses = [(503, {}), (403, rate_limit)]
+        policy = RetryPolicy(base_delay=0.01)
+        response = execute(self.request(), retry_policy=policy)
+        self.assertEqual(response, {'ok': True})
+        self.assertEqual(policy.stats().get('retries'), 2)
+        self.assertGreaterEqual(policy.stats().get('backoff_seconds'), 0)
+
+
+    def testNoRetryOnClientError(self):
+        """
+        """
+        FlakyHandler.responses = [(400, {})]
+        policy = RetryPolicy(base_delay=0.01)
+        with self.assertRaises(HttpError):
+            execute(self.request(), retry_policy=policy)
+        self.assertEqual(policy.stats().get('retries'), 0)
+        self.assertEqual(policy.stats().get('failures'), 1)
+
+
+    def testMaxAttempts(self):
+        """
+        """
+        FlakyHandler.responses = [(500, {})] * 3
+        policy = RetryPolicy(max_attempts=2, base_delay=0.01)
+        with self.assertRaises(HttpError):
+            execute(self.request(), retry_policy=policy)
+        self.assertEqual(policy.stats().get('retries'), 1)
+        FlakyHandler.responses = list()
+
+
+class testPayloadHelpers(unittest.TestCase):
+    """
+    Test the payload helpers
+    """
+
+    def testDatePayloadCopy(self):
+        """
+        """
+        payload = {'reportRequests': [{'viewId': '1', 'pageToken': '5',
+                                       'dateRanges': [{'startDate': '2020-01-01', 'endDate': '2020-01-31'}]}]}
+        day = datePayload(payload, '2020-01-02', '2020-01-02')
+        self.assertEqual(day.get('reportRequests')[0].get('dateRanges')[0],
+                         {'startDate': '2020-01-02', 'endDate': '2020-01-02'})
+        self.assertEqual(day.get('reportRequests')[0].get('pageToken'), '0')
+        self.assertEqual(payload.get('reportRequests')[0].get('dateRanges')[0].get('startDate'), '2020-01-01')
+
+
+class testFetchPacked(unittest.TestCase):
+    """
+    Test packing several report requests in shared batchGet calls
+    """
+
+    def testPackingAndRouting(self):
+        """
+        """
+        payloads = list()
+        for i in range(7):
+            payload = fakePayload()
+            payload.get('reportRequests')[0].update({'dimensions': [{'name': f'ga:dimension{i}'}]})
+            payloads.append(payload)
+        payloads.append(fakePayload('2'))
+
+        service = FakeService(pages=2)
+        data = fetchPacked(service, payloads, False, 0)
+        self.assertEqual(service.batches, [5, 5, 4, 1, 1])
+        for i, datum in enumerate(data[:7]):
+            self.assertEqual(len(datum.get('reports')), 2)
+            self.assertEqual(datum.get('reports')[0].get('columnHeader').get('dimensions'), [f'ga:dimension{i}'])
+        self.assertEqual(len(data[7].get('reports')), 2)
+        self.assertEqual(payloads[0].get('reportRequests')[0].get('pageToken'), '0')
+
+
+class testServiceRegistry(unittest.TestCase):
+    """
+    Test the process wide service registry and the discovery document cache
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = mock.patch.dict(os.environ, {'GA_DISCOVERY_CACHE_DIR': self.directory})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testCachedDiscoveryDocument(self):
+        """
+        """
+        with open(os.path.join(self.directory, 'analytics.v3.json'), 'w') as f:
+            json.dump({'name': 'analytics'}, f)
+        with mock.patch('httplib2.Http.request') as request:
+            self.assertEqual(discoveryDocument('analytics', 'v3'), {'name': 'analytics'})
+            request.assert_not_called()
+
+
+    def testBundledDiscoveryDocuments(self):
+        """
+        """
+        from googleapiclient.discovery import build_from_document
+
+        with mock.patch('httplib2.Http.request') as request:
+            for name, version in [('analytics', 'v3'), ('analyticsreporting', 'v4')]:
+                document = discoveryDocument(name, version)
+                self.assertEqual((document.get('name'), document.get('version')), (name, version))
+                build_from_document(document, http=httplib2.Http())
+            request.assert_not_called()
+
+
+    def testServicePerThreadSharedCredentials(self):
+        """
+        """
+        registry = ServiceRegistry()
+        with mock.patch('oauth2client.service_account.ServiceAccountCredentials') as credentials, \
+                mock.patch('googleAnalyticUtility._helpers.discoveryDocument', return_value={}) as document, \
+                mock.patch('googleapiclient.discovery.build_from_document', side_effect=lambda *a, **k: object()):
+            main = registry.service('analytics', 'v3', ['scope'], 'key.json')
+            self.assertIs(registry.service('analytics', 'v3', ['scope'], 'key.json'), main)
+
+            services = list()
+            thread = threading.Thread(target=lambda: services.append(
+                registry.service('analytics', 'v3', ['scope'], 'key.json')))
+            thread.start()
+            thread.join()
+            self.assertIsNot(services[0], main)
+            self.assertEqual(credentials.from_json_keyfile_name.call_count, 1)
+            self.assertEqual(document.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+import subprocess
+import sys
+
+
+class testImport(unittest.TestCase):
+    """
+    Make sure importing the package stays cheap: heavy dependencies must only be loaded by the features
+    that need them
+    """
+
+    def testHeavyModulesNotImported(self):
+        """
+        """
+        heavy = ['pandas', 'numpy', 'pyarrow', 'oauth2client', 'httplib2', 'googleapiclient.discovery',
+                 'googleapiclient.http']
+        code = ('import sys, googleAnalyticUtility.Analytics; '
+                f'print(",".join(m for m in {heavy!r} if m in sys.modules))')
+        loaded = subprocess.check_output([sys.executable, '-c', code]).decode().strip()
+        self.assertEqual(loaded, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
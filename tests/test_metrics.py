@@ -0,0 +1,93 @@
+import logging
+import unittest
+
+from benchmarks.fake_api import FakeGAServer
+from googleAnalyticUtility.Analytics import GetGAData, Management, RetryPolicy
+from googleAnalyticUtility._metrics import INSTRUMENTATION, NULL_SPAN, LoggingSink, PrometheusSink, SpanSink
+
+
+class testInstrumentation(unittest.TestCase):
+    """
+    Test the metrics and tracing hooks against the local fake of the reporting API
+    """
+
+    def setUp(self):
+        self.server = FakeGAServer(rows_per_day=25, error_rate=0.2, seed=3)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.analytics = GetGAData('2020-01-01', '2020-01-02',
+                                   retry_policy=RetryPolicy(base_delay=0, jitter=False, max_attempts=10))
+        self.analytics.report_service = self.server.reportService()
+        self.payload = self.analytics.formatPayload(['ga:date', 'ga:browser'], ['ga:sessions'], view_id='100000')
+        self.payload.get('reportRequests')[0].update({'pageSize': 10})
+        self.spans = INSTRUMENTATION.addSink(SpanSink())
+        self.addCleanup(INSTRUMENTATION.removeSink, self.spans)
+
+
+    def testSpans(self):
+        """
+        """
+        data = self.analytics.getData(self.payload, batch=False, verbose=False)
+        Management.dataToFrame(data, typed=True)
+
+        requests = [s for s in self.spans.spans if s.get('name') == 'googleAnalyticUtility.request']
+        report = [s for s in self.spans.spans if s.get('name') == 'googleAnalyticUtility.report']
+        convert = [s for s in self.spans.spans if s.get('name') == 'googleAnalyticUtility.dataToFrame']
+        # one report per day of 25 rows, in pages of 10 rows
+        self.assertEqual(len(requests), 6)
+        self.assertEqual(len(report), 2)
+        self.assertEqual([s.get('attributes').get('pages') for s in report], [3, 3])
+        self.assertEqual([s.get('attributes').get('rows') for s in report], [25, 25])
+        self.assertTrue(all(s.get('parent_id') in {r.get('span_id') for r in report} for s in requests))
+        self.assertEqual(sum(s.get('attributes').get('rows') for s in requests), 50)
+        self.assertEqual(sum(s.get('attributes').get('quota_units') for s in requests), self.server.requests)
+        self.assertEqual(sum(s.get('attributes').get('retries') for s in requests), self.server.errors)
+        self.assertTrue(all(s.get('attributes').get('response_bytes') > 0 for s in requests))
+        self.assertEqual(convert[0].get('attributes').get('rows'), 50)
+        self.assertLessEqual(convert[0].get('start_time_unix_nano'), convert[0].get('end_time_unix_nano'))
+
+
+    def testPrometheus(self):
+        """
+        """
+        sink = INSTRUMENTATION.addSink(PrometheusSink())
+        self.addCleanup(INSTRUMENTATION.removeSink, sink)
+        self.analytics.getData(self.payload, batch=False, verbose=False)
+
+        text = sink.render()
+        self.assertIn('# TYPE ga_count_total counter', text)
+        self.assertIn('ga_rows_total{operation="report",view_id="100000"} 50', text)
+        self.assertIn('ga_count_total{operation="request",method="analyticsreporting.reports.batchGet",'
+                      'view_id="100000"} 6', text)
+        self.assertIn(f'ga_quota_units_total{{operation="request",method="analyticsreporting.reports.batchGet",'
+                      f'view_id="100000"}} {self.server.requests}', text)
+
+
+    def testLoggingAndErrors(self):
+        """
+        """
+        sink = INSTRUMENTATION.addSink(LoggingSink(logging.getLogger('test_metrics')))
+        self.addCleanup(INSTRUMENTATION.removeSink, sink)
+        INSTRUMENTATION.addSink(lambda span: 1 / 0)
+        self.addCleanup(INSTRUMENTATION.removeSink, INSTRUMENTATION._sinks[-1])
+
+        with self.assertLogs('test_metrics', logging.INFO) as logs:
+            with self.assertRaises(KeyError):
+                with INSTRUMENTATION.span('custom', view_id='1'):
+                    raise KeyError('missing')
+        self.assertTrue(logs.output[0].startswith('INFO:test_metrics:custom error'))
+        self.assertEqual(self.spans.spans[-1].get('status'), 'ERROR')
+        self.assertEqual(self.spans.spans[-1].get('attributes').get('exception.type'), 'KeyError')
+
+
+    def testDisabled(self):
+        """
+        """
+        INSTRUMENTATION.removeSink(self.spans)
+        self.assertIs(INSTRUMENTATION.start('request'), NULL_SPAN)
+        self.assertEqual(len(self.analytics.getData(self.payload, batch=False, verbose=False)), 2)
+        self.assertEqual(self.spans.spans, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from unittest import mock
+from googleAnalyticUtility.Analytics import GetGAData
+from tests.fakes import FakeService, fakePayload
+from tests.test_convert import fakeReport
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class testParquetSink(unittest.TestCase):
+    """
+    Test writing report pages to a partitioned parquet dataset
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = mock.patch('googleAnalyticUtility.Analytics.reportService', return_value=FakeService(pages=2))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testPartitionsAndTypes(self):
+        """
+        """
+        analytics = GetGAData('2020-01-01', '2020-01-02')
+        rows = analytics.writeParquet(fakePayload(), self.directory, batch=False, verbose=False)
+        self.assertEqual(rows, 4)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, 'view_id=1'))),
+                         ['date=2020-01-01', 'date=2020-01-02'])
+
+        table = pq.read_table(os.path.join(self.directory, 'view_id=1', 'date=2020-01-01'))
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.schema.field('ga:sessions').type, pyarrow.int64())
+        self.assertTrue(pyarrow.types.is_dictionary(table.schema.field('ga:date').type))
+
+
+    def testColumnPruning(self):
+        """
+        """
+        from googleAnalyticUtility._parquet import reportsToRecordBatch
+
+        report = fakeReport([(('mobile',), ('10', '50.5'))])
+        batch = reportsToRecordBatch([report], columns=['ga:bounceRate'])
+        self.assertEqual(batch.schema.names, ['ga:bounceRate'])
+        self.assertEqual(batch.column(0).to_pylist(), [50.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+
+from googleAnalyticUtility.Analytics import GetGAData
+from googleAnalyticUtility._spec import ReportSpec, compileSpec
+from googleAnalyticUtility._storage import Checkpoint, ResponseCache, requestSignature
+
+
+class testReportSpec(unittest.TestCase):
+    """
+    Test the compilation of report requests
+    """
+
+    def setUp(self):
+        self.analytics = GetGAData('2020-01-01', '2020-01-31')
+
+
+    def testEmptyClausesDropped(self):
+        """
+        """
+        payload = self.analytics.formatPayload(['ga:date'], ['ga:sessions'], view_id='1')
+        request = payload.get('reportRequests')[0]
+        self.assertNotIn('dimensionFilterClauses', request)
+        self.assertNotIn('metricFilterClauses', request)
+
+        payload = self.analytics.formatPayload(['ga:date'], ['ga:sessions'], view_id='1',
+                                               dimensions_filters=[('ga:date', False, 'EXACT', '20200101', False)],
+                                               metric_operator='AND',
+                                               metrics_filters=[('ga:sessions', False, 'GREATER_THAN', '1')])
+        request = payload.get('reportRequests')[0]
+        self.assertEqual(request.get('dimensionFilterClauses')[0].get('filters')[0].get('expressions'), '20200101')
+        self.assertNotIn('operator', request.get('dimensionFilterClauses')[0])
+        self.assertEqual(request.get('metricFilterClauses')[0].get('operator'), 'AND')
+
+
+    def testValidation(self):
+        """
+        """
+        with self.assertRaises(ValueError):
+            self.analytics.formatPayload(['ga:date'], ['ga:sessions'])
+        with self.assertRaises(ValueError):
+            self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1', dimension_operator='XOR')
+        with self.assertRaises(ValueError):
+            self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1',
+                                      metrics_filters=[('ga:sessions', False, 'ABOVE', '1')])
+        with self.assertRaises(ValueError):
+            self.analytics.reportSpec([f'ga:dimension{i}' for i in range(10)], ['ga:sessions'], view_id='1')
+
+
+    def testImmutableAndMemoized(self):
+        """
+        """
+        spec = self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1')
+        self.assertIs(spec, self.analytics.reportSpec(('ga:date',), ('ga:sessions',), view_id='1'))
+        self.assertEqual(spec, ReportSpec('1', ['ga:date'], ['ga:sessions'], '2020-01-01', '2020-01-31'))
+        self.assertEqual(len({spec, compileSpec('1', ['ga:date'], ['ga:sessions'], '2020-01-01', '2020-01-31')}), 1)
+        with self.assertRaises(AttributeError):
+            spec.view_id = '2'
+
+
+    def testDerivedPayloads(self):
+        """
+        """
+        spec = self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1')
+        day = spec.payload('2020-01-05', page_token='200')
+        request = day.get('reportRequests')[0]
+        self.assertEqual(request.get('dateRanges'), [{'startDate': '2020-01-05', 'endDate': '2020-01-05'}])
+        self.assertEqual(request.get('pageToken'), '200')
+        self.assertIsNot(request.get('metrics'), spec.payload().get('reportRequests')[0].get('metrics'))
+
+        request['pageToken'] = '300'
+        request['dateRanges'][0]['startDate'] = '1999-01-01'
+        self.assertEqual(spec.payload().get('reportRequests')[0].get('pageToken'), '0')
+        self.assertEqual(spec.payload().get('reportRequests')[0].get('dateRanges')[0].get('startDate'), '2020-01-01')
+
+
+    def testEditedPayloadsAreNotShared(self):
+        """
+        """
+        payload = self.analytics.formatPayload(['ga:date'], ['ga:sessions'], view_id='1',
+                                               dimensions_filters=[('ga:date', False, 'IN_LIST', ['20200101'], True)])
+        expected = self.analytics.formatPayload(['ga:date'], ['ga:sessions'], view_id='1',
+                                                dimensions_filters=[('ga:date', False, 'IN_LIST', ['20200101'], True)])
+        request = payload.get('reportRequests')[0]
+        request['dateRanges'][0]['startDate'] = '1999-01-01'
+        request['dimensions'].append({'name': 'ga:browser'})
+        request['dimensionFilterClauses'][0]['filters'][0]['expressions'].append('20200102')
+
+        spec = self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1',
+                                         dimensions_filters=[('ga:date', False, 'IN_LIST', ['20200101'], True)])
+        again = self.analytics.formatPayload(['ga:date'], ['ga:sessions'], view_id='1',
+                                             dimensions_filters=[('ga:date', False, 'IN_LIST', ['20200101'], True)])
+        self.assertEqual(again, expected)
+        self.assertEqual(again.get('reportRequests')[0].get('dateRanges')[0].get('startDate'), '2020-01-01')
+        self.assertEqual(again.get('reportRequests')[0].get('dimensions'), [{'name': 'ga:date'}])
+        self.assertEqual(spec.key, ResponseCache('/tmp').key(again))
+        self.assertEqual(spec.signature, requestSignature(again))
+
+
+    def testKeys(self):
+        """
+        """
+        spec = self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1')
+        day = spec.payload('2020-01-05', page_token='200')
+        self.assertEqual(spec.signature, requestSignature(day))
+        self.assertEqual(spec.key, ResponseCache('/tmp').key(spec.payload()))
+        self.assertIn(spec.signature, Checkpoint('/tmp').unitPath(day))
+
+
+    def testAggregationFeatures(self):
+        """
+        """
+        payload = self.analytics.formatPayload(['ga:date'], ['ga:sessions'], view_id='1',
+                                               order_bys=['ga:date', ('ga:sessions', 'DESCENDING')],
+                                               pivots=[(['ga:browser'], ['ga:sessions'], 5)],
+                                               segments=['gaid::-3'], hide_totals=True)
+        request = payload.get('reportRequests')[0]
+        self.assertEqual(request.get('orderBys'), [{'fieldName': 'ga:date'},
+                                                   {'fieldName': 'ga:sessions', 'sortOrder': 'DESCENDING'}])
+        self.assertEqual(request.get('pivots'), [{'dimensions': [{'name': 'ga:browser'}],
+                                                  'metrics': [{'expression': 'ga:sessions'}], 'maxGroupCount': 5}])
+        self.assertEqual(request.get('segments'), [{'segmentId': 'gaid::-3'}])
+        self.assertEqual(request.get('dimensions')[-1], {'name': 'ga:segment'})
+        self.assertTrue(request.get('hideTotals'))
+        self.assertNotIn('hideValueRanges', request)
+
+        plain = self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1')
+        self.assertNotIn('orderBys', plain.payload().get('reportRequests')[0])
+        self.assertNotEqual(plain.signature, self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1',
+                                                                       hide_totals=True).signature)
+        with self.assertRaises(ValueError):
+            self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1', order_bys=[('ga:date', 'UP')])
+        with self.assertRaises(ValueError):
+            self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1',
+                                      pivots=[(['ga:browser'], ['ga:sessions'])] * 3)
+
+
+    def testDynamicSegmentsAndCohorts(self):
+        """
+        """
+        segment = {'dynamicSegment': {'name': 'mobile', 'sessionSegment': {'segmentFilters': [
+            {'simpleSegment': {'orFiltersForSegment': [{'segmentFilterClauses': [{'dimensionFilter': {
+                'dimensionName': 'ga:deviceCategory', 'expressions': ['mobile']}}]}]}}]}}}
+        spec = self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1', segments=[segment])
+        self.assertEqual(spec.payload().get('reportRequests')[0].get('segments'), [segment])
+        self.assertIs(spec, self.analytics.reportSpec(['ga:date'], ['ga:sessions'], view_id='1', segments=[segment]))
+
+        spec = self.analytics.reportSpec([], ['ga:cohortActiveUsers'], view_id='1',
+                                         cohorts=[('week 1', '2020-01-01', '2020-01-07')], lifetime_value=True)
+        request = spec.payload().get('reportRequests')[0]
+        self.assertNotIn('dateRanges', request)
+        self.assertEqual(request.get('dimensions'), [{'name': 'ga:cohort'}])
+        self.assertEqual(request.get('cohortGroup'), {'cohorts': [{
+            'name': 'week 1', 'type': 'FIRST_VISIT_DATE',
+            'dateRange': {'startDate': '2020-01-01', 'endDate': '2020-01-07'}}], 'lifetimeValue': True})
+        with self.assertRaises(ValueError):
+            spec.payload('2020-01-02')
+
+
+if __name__ == '__main__':
+    unittest.main()
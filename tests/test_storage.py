@@ -0,0 +1,180 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+
+from unittest import mock
+from googleAnalyticUtility.Analytics import GetGAData, RetryPolicy
+from googleAnalyticUtility._helpers import datePayload
+from googleAnalyticUtility._storage import Checkpoint, ResponseCache, requestSignature
+from tests.fakes import FakeService, fakeCohortPayload, fakePayload
+
+
+class testCheckpoint(unittest.TestCase):
+    """
+    Test that checkpointed fetches resume where they stopped
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = Checkpoint(self.directory)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def analytics(self, service):
+        analytics = GetGAData('2020-01-01', '2020-01-01', retry_policy=RetryPolicy(max_attempts=1),
+                              checkpoint_dir=self.directory)
+        analytics.report_service = service
+        return analytics
+
+
+    def testResume(self):
+        """
+        """
+        with self.assertRaises(ConnectionError):
+            self.analytics(FakeService(pages=3, fail_after=2)).getData(fakePayload(), verbose=False)
+        self.assertEqual(len(list(self.checkpoint.iterPages(fakePayload()))), 2)
+        self.assertFalse(self.checkpoint.isDone(fakePayload()))
+
+        service = FakeService(pages=3)
+        data = self.analytics(service).getData(fakePayload(), verbose=False)
+        self.assertEqual(service.calls, [2])
+        self.assertEqual(len(data[0].get('reports')), 3)
+        self.assertTrue(self.checkpoint.isDone(fakePayload()))
+
+        service = FakeService(pages=3)
+        self.assertEqual(self.analytics(service).getData(fakePayload(), verbose=False), data)
+        self.assertEqual(len(list(self.analytics(service).iterData(fakePayload(), verbose=False))), 3)
+        self.assertEqual(service.calls, [])
+
+
+    def testResumeCohorts(self):
+        """
+        """
+        with self.assertRaises(ConnectionError):
+            self.analytics(FakeService(pages=3, fail_after=1)).getData(fakeCohortPayload(), verbose=False)
+        self.assertTrue(self.checkpoint.unitPath(fakeCohortPayload()).endswith('2020-01-01_2020-01-14'))
+
+        service = FakeService(pages=3)
+        data = self.analytics(service).getData(fakeCohortPayload(), verbose=False)
+        self.assertEqual(service.calls, [1, 2])
+        self.assertEqual(len(data[0].get('reports')), 3)
+        self.assertTrue(self.checkpoint.isDone(fakeCohortPayload()))
+
+
+    def testSignatureIgnoresDatesAndToken(self):
+        """
+        """
+        payload = fakePayload()
+        other = datePayload(payload, '2020-02-01', '2020-02-01')
+        other.get('reportRequests')[0].update({'pageToken': '7'})
+        self.assertEqual(requestSignature(payload), requestSignature(other))
+        self.assertNotEqual(requestSignature(payload), requestSignature(fakePayload('2')))
+        self.assertNotEqual(self.checkpoint.unitPath(payload), self.checkpoint.unitPath(other))
+
+
+class testResponseCache(unittest.TestCase):
+    """
+    Test the on disk response cache
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testHitAndMiss(self):
+        """
+        """
+        cache = ResponseCache(self.directory)
+        payload = fakePayload()
+        self.assertIsNone(cache.get(payload))
+        cache.put(payload, {'reports': [{'data': {}}]})
+        self.assertEqual(cache.get(payload), {'reports': [{'data': {}}]})
+        self.assertIsNone(cache.get(datePayload(payload, '2020-01-02', '2020-01-02')))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+
+    def testCachedFetchesSkipTheService(self):
+        """
+        """
+        service = FakeService(pages=2)
+        analytics = GetGAData('2020-01-01', '2020-01-03', cache=ResponseCache(self.directory))
+        analytics.report_service = service
+        data = analytics.getData(fakePayload(), batch=False, verbose=False)
+        self.assertEqual(len(service.calls), 6)
+
+        self.assertEqual(analytics.getData(fakePayload(), batch=False, verbose=False), data)
+        pages = list(analytics.iterData(fakePayload(), batch=False, verbose=False))
+        self.assertEqual(len(service.calls), 6)
+        self.assertEqual(pages, data)
+        self.assertEqual(analytics.cache.hits, 6)
+
+
+    def testTtlAndImmutableDays(self):
+        """
+        """
+        old = fakePayload()
+        recent = datePayload(old, time.strftime('%Y-%m-%d'), time.strftime('%Y-%m-%d'))
+        cache = ResponseCache(self.directory, ttl=-1, immutable_after_days=3)
+        cache.put(old, {'reports': []})
+        cache.put(recent, {'reports': []})
+        self.assertIsNotNone(cache.get(old))
+        self.assertIsNone(cache.get(recent))
+
+        cohorts = fakeCohortPayload()
+        cache.put(cohorts, {'reports': []})
+        self.assertIsNotNone(cache.get(cohorts))
+        cache.immutable_after_days = None
+        self.assertIsNone(cache.get(cohorts))
+
+
+    def testLruEviction(self):
+        """
+        """
+        cache = ResponseCache(self.directory, max_bytes=None)
+        payloads = [datePayload(fakePayload(), f'2020-01-0{d}', f'2020-01-0{d}') for d in range(1, 4)]
+        for i, payload in enumerate(payloads):
+            cache.put(payload, {'reports': ['x' * 100]})
+            os.utime(cache.path(cache.key(payload)), (i, i))
+        cache.get(payloads[0])
+        cache.max_bytes = sum(os.path.getsize(cache.path(cache.key(payloads[i]))) for i in (0, 2))
+        cache.evict()
+        self.assertIsNotNone(cache.get(payloads[0]))
+        self.assertIsNone(cache.get(payloads[1]))
+        self.assertIsNotNone(cache.get(payloads[2]))
+
+
+    def testEvictionOnlyAboveMaxBytes(self):
+        """
+        """
+        payloads = [datePayload(fakePayload(), f'2020-01-{d:02d}', f'2020-01-{d:02d}') for d in range(1, 11)]
+        cache = ResponseCache(self.directory, max_bytes=10 ** 6)
+        with mock.patch.object(ResponseCache, 'evict', autospec=True, side_effect=ResponseCache.evict) as evict:
+            for i, payload in enumerate(payloads):
+                cache.put(payload, {'reports': ['x' * 100]})
+                os.utime(cache.path(cache.key(payload)), (i, i))
+            self.assertEqual(evict.call_count, 1)
+            size = sum(os.path.getsize(cache.path(cache.key(payload))) for payload in payloads)
+            self.assertEqual(cache._size, size)
+
+            # the creation time written with the entry can change its size by a few bytes
+            cache.max_bytes = size + 50
+            cache.put(payloads[0], {'reports': ['x' * 100]})
+            self.assertEqual(evict.call_count, 1)
+            cache.put(payloads[0], {'reports': ['x' * 200]})
+            self.assertEqual(evict.call_count, 2)
+        self.assertLessEqual(cache._size, size + 50)
+        self.assertIsNotNone(cache.get(payloads[0]))
+        self.assertIsNone(cache.get(payloads[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()